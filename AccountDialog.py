@@ -23,7 +23,7 @@ class AccountDialog(QDialog):
     """ This class defines a dialog window for the account settings.
     """
 
-    def __init__(self, settings):
+    def __init__(self, settings, account='connection'):
         """ Object initialization
 
         Parameters
@@ -31,13 +31,18 @@ class AccountDialog(QDialog):
         self : QWidget
         settings : QSettings
             Settings object for the program.
+        account : str optional
+            Settings group containing the account.
         """
         super().__init__()
         self.settings = settings
-        self.langLineEdit = QLineEdit(settings.value('connection/lang'))
-        self.siteLineEdit = QLineEdit(settings.value('connection/site'))
-        self.usernameLineEdit = QLineEdit(settings.value('connection/username'))
-        self.passwordLineEdit = QLineEdit(settings.value('connection/password'))
+        self.account = account
+        self.langLineEdit = QLineEdit(settings.value(account + '/lang'))
+        self.siteLineEdit = QLineEdit(settings.value(account + '/site'))
+        self.usernameLineEdit = QLineEdit(
+                settings.value(account + '/username'))
+        self.passwordLineEdit = QLineEdit(
+                settings.value(account + '/password'))
 
         self.passwordLineEdit.setEchoMode(QLineEdit.Password)
 
@@ -73,14 +78,14 @@ class AccountDialog(QDialog):
         """
         # save settings
         self.settings.setValue(
-                'connection/lang',
+                self.account + '/lang',
                 self.langLineEdit.text())
         self.settings.setValue(
-                'connection/site',
+                self.account + '/site',
                 self.siteLineEdit.text())
         self.settings.setValue(
-                'connection/username',
+                self.account + '/username',
                 self.usernameLineEdit.text())
         self.settings.setValue(
-                'connection/password',
+                self.account + '/password',
                 self.passwordLineEdit.text())
@@ -0,0 +1,301 @@
+# This file is part of wikied.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (C) 2016 Martino Pilia <martino.pilia@gmail.com>
+
+import aiohttp
+import asyncio
+import concurrent.futures
+import http.cookiejar
+import http.cookies
+import json
+import threading
+import time
+import yarl
+
+from multidict import CIMultiDict
+
+from RequestHandle import Cancelled
+
+class Response:
+    """ Response to a request made by the AsyncTransport, exposing the same
+    interface of a requests.Response used by the Connection.
+    """
+
+    def __init__(self, url, status_code, headers, content, encoding):
+        """ Object initialization.
+
+        Parameters
+        ----------
+        url : str
+            Address of the request.
+        status_code : int
+            HTTP status code of the response.
+        headers : CIMultiDict
+            Headers of the response, with case insensitive names.
+        content : bytes
+            Body of the response.
+        encoding : str
+            Encoding of the body.
+        """
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.encoding = encoding or 'utf-8'
+
+    @property
+    def text(self):
+        """ Body of the response, decoded.
+        """
+        return self.content.decode(self.encoding, errors='replace')
+
+    def json(self):
+        """ Body of the response, parsed as JSON.
+        """
+        return json.loads(self.text)
+
+class AsyncTransport:
+    """ Transport performing all the HTTP requests to the wiki on a single
+    asyncio event loop, running in a dedicated thread.
+
+    The requests are multiplexed over a small pool of keep-alive
+    connections, so any number of them can be in flight at the same time
+    without a thread for each one. Blocking callers, such as the workers of
+    the Connection, wait for the result of their request.
+
+    The requests are made by the clients of the transport, returned by the
+    client method. Each client has its own cookies, so several clients
+    logged in different wikis or accounts share the same connections.
+    """
+
+    def __init__(self, connections=8):
+        """ Object initialization.
+
+        Parameters
+        ----------
+        connections : int optional
+            Maximum number of simultaneous connections to the wiki.
+        """
+
+        self.connections = max(1, connections)
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(
+                target=self.loop.run_forever,
+                name='AsyncTransport',
+                daemon=True)
+        self.thread.start()
+        self.connector = self.call(self.createConnector())
+        self.clients = []
+
+    async def createConnector(self):
+        """ Create the pool of connections shared by the clients, in the
+        event loop.
+        """
+        return aiohttp.TCPConnector(
+                limit=self.connections,
+                keepalive_timeout=60)
+
+    async def createSession(self):
+        """ Create a HTTP session using the shared connections, in the event
+        loop.
+        """
+        # accept cookies from numeric addresses too, such as a local wiki
+        return aiohttp.ClientSession(
+                connector=self.connector,
+                connector_owner=False,
+                cookie_jar=aiohttp.CookieJar(unsafe=True),
+                timeout=aiohttp.ClientTimeout(sock_connect=30, sock_read=120))
+
+    def client(self):
+        """ Return a new client of the transport, making requests with its
+        own cookies.
+        """
+        client = AsyncClient(self)
+        self.clients.append(client)
+        return client
+
+    def call(self, coroutine, handle=None):
+        """ Run a coroutine in the event loop, and wait for its result.
+
+        Parameters
+        ----------
+        coroutine : coroutine
+            Coroutine to be executed.
+        handle : RequestHandle optional
+            Handle of a request. When the request is cancelled, the
+            coroutine is interrupted and Cancelled is raised.
+        """
+        future = asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+        if handle is None:
+            return future.result()
+
+        handle.addCallback(future.cancel)
+        try:
+            return future.result()
+        except concurrent.futures.CancelledError:
+            raise Cancelled()
+        finally:
+            handle.removeCallback(future.cancel)
+
+    def shutdown(self):
+        """ Close the sessions of the clients and the connections, and stop
+        the event loop.
+        """
+        async def close():
+            for client in self.clients:
+                await client.session.close()
+            await self.connector.close()
+        self.call(close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+class AsyncClient:
+    """ Client making HTTP requests through an AsyncTransport, with its own
+    cookies.
+    """
+
+    def __init__(self, transport):
+        """ Object initialization.
+
+        Parameters
+        ----------
+        transport : AsyncTransport
+            Transport making the requests.
+        """
+        self.transport = transport
+        self.session = transport.call(transport.createSession())
+        # maximum number of simultaneous connections
+        self.connections = transport.connections
+
+    async def request(self, address, data):
+        """ Make a POST request.
+
+        Parameters
+        ----------
+        address : str
+            Address for the request.
+        data : dict
+            Parameters of the request.
+        """
+        data = {k: str(v) for k, v in data.items()}
+        async with self.session.post(address, data=data) as res:
+            content = await res.read()
+            return Response(
+                    str(res.url),
+                    res.status,
+                    CIMultiDict(res.headers),
+                    content,
+                    res.charset)
+
+    def post(self, address, data, handle=None):
+        """ Make a POST request and return the response.
+
+        Parameters
+        ----------
+        address : str
+            Address for the request.
+        data : dict
+            Parameters of the request.
+        handle : RequestHandle optional
+            Handle of the request the HTTP request belongs to. Cancelling
+            it aborts the HTTP request.
+        """
+        return self.transport.call(self.request(address, data), handle)
+
+    def postMany(self, address, dataList, handle=None, timings=None):
+        """ Make a set of POST requests concurrently, and return the list of
+        responses in the same order of the requests.
+
+        Parameters
+        ----------
+        address : str
+            Address for the requests.
+        dataList : list of dict
+            Parameters of each request.
+        handle : RequestHandle optional
+            Handle of the request the HTTP requests belong to. Cancelling
+            it aborts the HTTP requests.
+        timings : list optional
+            List receiving the duration of each request, in seconds, when
+            all the requests are completed.
+        """
+        async def timed(data):
+            start = time.monotonic()
+            res = await self.request(address, data)
+            return res, time.monotonic() - start
+
+        async def gather():
+            return await asyncio.gather(
+                    *[timed(data) for data in dataList])
+
+        results = self.transport.call(gather(), handle)
+        if timings is not None:
+            timings.extend(latency for res, latency in results)
+        return [res for res, latency in results]
+
+    def clearCookies(self):
+        """ Remove all the cookies of the client.
+        """
+        self.transport.loop.call_soon_threadsafe(
+                self.session.cookie_jar.clear)
+
+    def exportCookies(self):
+        """ Return the list of the cookies of the client, each one a
+        dictionary with name, value, domain, path, expires and secure.
+        """
+        async def export():
+            cookies = []
+            for morsel in self.session.cookie_jar:
+                expires = None
+                if morsel['max-age']:
+                    expires = time.time() + int(morsel['max-age'])
+                elif morsel['expires']:
+                    expires = http.cookiejar.http2time(morsel['expires'])
+                cookies.append({
+                    'name': morsel.key,
+                    'value': morsel.value,
+                    'domain': morsel['domain'],
+                    'path': morsel['path'] or '/',
+                    'expires': expires,
+                    'secure': bool(morsel['secure'])
+                })
+            return cookies
+        return self.transport.call(export())
+
+    def importCookies(self, cookies, address):
+        """ Add a list of cookies to the ones of the client.
+
+        Parameters
+        ----------
+        cookies : list of dict
+            Cookies, as returned by exportCookies.
+        address : str
+            Address of the wiki the cookies belong to.
+        """
+        jar = http.cookies.SimpleCookie()
+        for cookie in cookies:
+            jar[cookie['name']] = cookie['value']
+            morsel = jar[cookie['name']]
+            morsel['path'] = cookie['path']
+            if cookie['expires'] is not None:
+                morsel['max-age'] = str(max(0,
+                        int(cookie['expires'] - time.time())))
+            if cookie['secure']:
+                morsel['secure'] = True
+
+        async def update():
+            # the cookies are bound to the host of the wiki
+            self.session.cookie_jar.update_cookies(jar, yarl.URL(address))
+        self.transport.call(update())
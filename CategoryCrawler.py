@@ -0,0 +1,158 @@
+# This file is part of wikied.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (C) 2016 Martino Pilia <martino.pilia@gmail.com>
+
+import collections
+import threading
+
+from WorkerPool import BULK
+
+# namespace number of the categories
+CATEGORY_NAMESPACE = 14
+
+class CategoryCrawler:
+    """ Recursive crawl of a category tree.
+
+    The subcategories are explored concurrently by the workers of the
+    connection, with a bounded number of categories being queried at the
+    same time. Each category is visited once, so cycles in the tree are
+    harmless, and the titles of the pages are sent deduplicated as soon as
+    they are found. Cancelling the request of the crawl stops it.
+    """
+
+    def __init__(self, connection, handle, root, depth, fanout, send, finish):
+        """ Object initialization.
+
+        Parameters
+        ----------
+        connection : Connection
+            Object managing the connection to the wiki.
+        handle : RequestHandle
+            Handle of the request of the crawl.
+        root : str
+            Title of the root category.
+        depth : int
+            Maximum depth of the subcategories to be explored. With depth
+            0, only the pages of the root category are retrieved.
+        fanout : int
+            Maximum number of categories queried at the same time.
+        send : callable
+            Function called with each list of new page titles.
+        finish : callable
+            Function called with the number of page titles found, when the
+            crawl is complete.
+        """
+        self.connection = connection
+        self.handle = handle
+        self.root = root.replace('_', ' ').strip()
+        self.depth = depth
+        self.fanout = max(1, fanout)
+        self.send = send
+        self.finish = finish
+
+        self.lock = threading.Lock()
+        # categories waiting to be queried, with their depth
+        self.queue = collections.deque([(self.root, 0)])
+        # categories already found
+        self.visited = {self.root}
+        # number of categories being queried
+        self.running = 0
+        # titles of the pages already sent
+        self.sent = set()
+        # True once the end of the crawl is reported
+        self.finished = False
+
+    def start(self):
+        """ Start the crawl.
+        """
+        self.schedule()
+
+    def schedule(self):
+        """ Start querying the queued categories, within the fan-out limit,
+        and report the end of the crawl when nothing is left.
+        """
+        if self.handle.isCancelled():
+            return
+
+        with self.lock:
+            tasks = []
+            while len(self.queue) > 0 and self.running < self.fanout:
+                tasks.append(self.queue.popleft())
+                self.running += 1
+            # several tasks may see the crawl complete, only one reports it
+            finished = not self.finished and self.running == 0 and \
+                    len(self.queue) == 0
+            if finished:
+                self.finished = True
+
+        for category, depth in tasks:
+            self.connection.pool.submit(self.crawl, category, depth,
+                    priority=BULK, handle=self.handle)
+
+        if finished:
+            self.finish(len(self.sent))
+
+    def crawl(self, category, depth):
+        """ Query the members of a category.
+
+        Parameters
+        ----------
+        category : str
+            Title of the category.
+        depth : int
+            Depth of the category in the tree.
+        """
+        types = 'page|subcat' if depth < self.depth else 'page'
+        data = {
+            'action': 'query',
+            'format': 'json',
+            'assert': 'user',
+            'list': 'categorymembers',
+            'cmtitle': category,
+            'cmtype': types,
+            'cmprop': 'title',
+            'cmlimit': self.connection.planner.listLimit(),
+        }
+
+        try:
+            for res in self.connection.iterateQuery(data):
+                if 'error' in res:
+                    self.connection.statusMessage.emit(
+                            '%s: %s' % (category, res['error']['code']))
+                    break
+
+                pages = []
+                with self.lock:
+                    for member in res.get('query', {}).get(
+                            'categorymembers', []):
+                        title = member['title']
+                        if member['ns'] == CATEGORY_NAMESPACE:
+                            # explore each subcategory only once
+                            if title not in self.visited:
+                                self.visited.add(title)
+                                self.queue.append((title, depth + 1))
+                        elif title not in self.sent:
+                            self.sent.add(title)
+                            pages.append(title)
+
+                if len(pages) > 0:
+                    self.send(pages)
+                # start querying the new subcategories
+                self.schedule()
+        finally:
+            with self.lock:
+                self.running -= 1
+            self.schedule()
@@ -0,0 +1,176 @@
+# This file is part of wikied.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (C) 2016 Martino Pilia <martino.pilia@gmail.com>
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from PyQt5.QtCore import QStandardPaths
+
+class CheckpointStore:
+    """ On-disk store of the progress of the list queries, in a SQLite
+    database.
+
+    For each query not completed yet, the store keeps the continuation
+    parameters of its next request and the titles received so far, in
+    batches, so an interrupted query can be resumed from its last completed
+    batch, even after a restart of the program. The queries running are
+    claimed, so the checkpoint of a query is written by a single run.
+    """
+
+    def __init__(self, path=None):
+        """ Object initialization.
+
+        Parameters
+        ----------
+        path : str optional
+            Path of the database file. If absent, the file is placed in the
+            cache directory of the user.
+        """
+
+        if path is None:
+            directory = QStandardPaths.writableLocation(
+                    QStandardPaths.CacheLocation)
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, 'checkpoints.sqlite')
+
+        self.lock = threading.Lock()
+        # keys of the queries running in this process
+        self.claimed = set()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.db:
+            self.db.execute(
+                    'CREATE TABLE IF NOT EXISTS queries ('
+                    'key TEXT PRIMARY KEY, '
+                    'continuation TEXT, '
+                    'updated REAL)')
+            self.db.execute(
+                    'CREATE TABLE IF NOT EXISTS batches ('
+                    'key TEXT NOT NULL, '
+                    'seq INTEGER NOT NULL, '
+                    'titles TEXT, '
+                    'PRIMARY KEY (key, seq))')
+
+    def load(self, key, maxAge):
+        """ Return the continuation parameters and the list of the batches of
+        titles received so far by a query, or None if the query has no
+        checkpoint. Checkpoints older than the maximum age are discarded.
+
+        Parameters
+        ----------
+        key : str
+            Key identifying the query.
+        maxAge : float
+            Maximum age of a checkpoint, in seconds.
+        """
+        with self.lock:
+            row = self.db.execute(
+                    'SELECT continuation, updated FROM queries WHERE key = ?',
+                    (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] < time.time() - maxAge:
+                with self.db:
+                    self.delete(key)
+                return None
+            batches = [json.loads(titles) for (titles,) in self.db.execute(
+                    'SELECT titles FROM batches WHERE key = ? ORDER BY seq',
+                    (key,))]
+        return json.loads(row[0]), batches
+
+    def save(self, key, continuation, titles):
+        """ Store a batch of titles received by a query, together with the
+        continuation parameters of the following request.
+
+        Parameters
+        ----------
+        key : str
+            Key identifying the query.
+        continuation : dict
+            Continuation parameters returned with the batch.
+        titles : list of str
+            Titles of the batch.
+        """
+        with self.lock, self.db:
+            row = self.db.execute(
+                    'SELECT COUNT(*) FROM batches WHERE key = ?',
+                    (key,)).fetchone()
+            self.db.execute(
+                    'INSERT INTO batches (key, seq, titles) VALUES (?, ?, ?)',
+                    (key, row[0], json.dumps(titles)))
+            self.db.execute(
+                    'INSERT OR REPLACE INTO queries '
+                    '(key, continuation, updated) VALUES (?, ?, ?)',
+                    (key, json.dumps(continuation), time.time()))
+
+    def claim(self, key):
+        """ Mark a query as running, returning False if it was already
+        claimed by another run.
+
+        Parameters
+        ----------
+        key : str
+            Key identifying the query.
+        """
+        with self.lock:
+            if key in self.claimed:
+                return False
+            self.claimed.add(key)
+            return True
+
+    def release(self, key):
+        """ Mark a query as no longer running.
+
+        Parameters
+        ----------
+        key : str
+            Key identifying the query.
+        """
+        with self.lock:
+            self.claimed.discard(key)
+
+    def remove(self, key):
+        """ Remove the checkpoint of a query.
+
+        Parameters
+        ----------
+        key : str
+            Key identifying the query.
+        """
+        with self.lock, self.db:
+            self.delete(key)
+
+    def delete(self, key):
+        """ Delete the rows of a query. Must be called holding the lock,
+        inside a transaction.
+
+        Parameters
+        ----------
+        key : str
+            Key identifying the query.
+        """
+        self.db.execute('DELETE FROM queries WHERE key = ?', (key,))
+        self.db.execute('DELETE FROM batches WHERE key = ?', (key,))
+
+    def clear(self):
+        """ Remove all the checkpoints.
+        """
+        with self.lock, self.db:
+            self.db.execute('DELETE FROM queries')
+            self.db.execute('DELETE FROM batches')
@@ -0,0 +1,241 @@
+# This file is part of wikied.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (C) 2016 Martino Pilia <martino.pilia@gmail.com>
+
+import collections
+import threading
+import time
+
+class Flight:
+    """ Result of an operation shared by several callers.
+    """
+
+    def __init__(self):
+        """ Object initialization.
+        """
+        self.event = threading.Event()
+        self.ok = False
+        self.value = None
+        # generation of the coalescer when the operation started
+        self.generation = 0
+
+    # interval between the checks of the cancellation of a waiting caller,
+    # in seconds
+    interval = 0.1
+
+    def wait(self, handle=None):
+        """ Wait for the leader to complete the operation, and return True if
+        it succeeded, making its result available in the value attribute.
+
+        Parameters
+        ----------
+        handle : RequestHandle optional
+            Handle of the request of the caller. If given, Cancelled is
+            raised once the request is cancelled, without waiting for the
+            leader.
+        """
+        if handle is None:
+            self.event.wait()
+            return self.ok
+        while not self.event.wait(self.interval):
+            handle.check()
+        return self.ok
+
+class Coalescer:
+    """ Share the result of identical operations between their callers.
+
+    The first caller of an operation becomes its leader, and the callers
+    asking for the same operation while it is in progress wait for its
+    result instead of repeating it. The results are also kept for a short
+    time, so repeated operations completed in a quick succession are
+    performed once. If the leader fails, each waiting caller repeats the
+    operation. The results are dropped once expired, and their number and
+    their total size are bounded.
+    """
+
+    def __init__(self, ttl=2.0, size=256, capacity=16 * 2 ** 20,
+            weigh=None):
+        """ Object initialization.
+
+        Parameters
+        ----------
+        ttl : float optional
+            Time for which a result is reused, in seconds. With 0, only the
+            operations in progress are shared.
+        size : int optional
+            Maximum number of results kept.
+        capacity : int optional
+            Maximum total size of the results kept, in bytes. Larger
+            results are not kept at all.
+        weigh : callable optional
+            Function returning the approximate size of a result, in bytes.
+            If absent, the results are bounded only in number.
+        """
+        self.ttl = ttl
+        self.size = size
+        self.capacity = capacity
+        self.weigh = weigh
+        self.lock = threading.Lock()
+        # operations in progress, indexed by key
+        self.pending = {}
+        # completion time, result and size of the last operations, indexed
+        # by key, in order of completion
+        self.memo = collections.OrderedDict()
+        # total size of the results kept
+        self.bytes = 0
+        # number of times the results have been cleared
+        self.generation = 0
+
+        # counters
+        self.shared = 0
+        self.memoHits = 0
+
+    def claim(self, key):
+        """ Return the Flight of an operation, and True if the caller is its
+        leader. The leader must perform the operation and report its
+        outcome with resolve or abandon, the other callers must wait for
+        the result.
+
+        Parameters
+        ----------
+        key : hashable
+            Key identifying the operation.
+        """
+        with self.lock:
+            self.prune()
+            if key in self.memo:
+                completion, value, weight = self.memo[key]
+                self.memoHits += 1
+                flight = Flight()
+                flight.ok = True
+                flight.value = value
+                flight.event.set()
+                return flight, False
+
+            if key in self.pending:
+                self.shared += 1
+                return self.pending[key], False
+
+            flight = Flight()
+            flight.generation = self.generation
+            self.pending[key] = flight
+            return flight, True
+
+    def resolve(self, key, flight, value, memo=True):
+        """ Publish the result of an operation.
+
+        Parameters
+        ----------
+        key : hashable
+            Key identifying the operation.
+        flight : Flight
+            Flight of the operation, as returned by claim.
+        value : object
+            Result of the operation.
+        memo : bool optional
+            If False, the result is not reused after the completion.
+        """
+        weight = self.weigh(value) if self.weigh is not None else 0
+        with self.lock:
+            self.pending.pop(key, None)
+            # a result obtained before a clear may be outdated already
+            if memo and self.ttl > 0 and weight <= self.capacity and \
+                    flight.generation == self.generation:
+                self.discard(key)
+                self.memo[key] = (time.monotonic(), value, weight)
+                self.bytes += weight
+            self.prune()
+        flight.ok = True
+        flight.value = value
+        flight.event.set()
+
+    def abandon(self, key, flight):
+        """ Report the failure of an operation.
+
+        Parameters
+        ----------
+        key : hashable
+            Key identifying the operation.
+        flight : Flight
+            Flight of the operation, as returned by claim.
+        """
+        with self.lock:
+            self.pending.pop(key, None)
+        flight.event.set()
+
+    def run(self, key, function, memo=None, handle=None):
+        """ Perform an operation or share its result, and return the result.
+
+        Parameters
+        ----------
+        key : hashable
+            Key identifying the operation.
+        function : callable
+            Function without arguments performing the operation.
+        memo : callable optional
+            Function returning False for the results which must not be
+            reused after the completion.
+        handle : RequestHandle optional
+            Handle of the request of the caller, whose cancellation stops
+            the wait for the result of another caller.
+        """
+        while True:
+            flight, leader = self.claim(key)
+            if leader:
+                break
+            if flight.wait(handle):
+                return flight.value
+
+        try:
+            value = function()
+        except BaseException:
+            self.abandon(key, flight)
+            raise
+        self.resolve(key, flight, value, memo is None or memo(value))
+        return value
+
+    def prune(self):
+        """ Drop the expired results, and the oldest ones exceeding the
+        limits. Must be called holding the lock.
+        """
+        now = time.monotonic()
+        while len(self.memo) > 0:
+            key, (completion, value, weight) = next(iter(self.memo.items()))
+            if now - completion < self.ttl and len(self.memo) <= self.size \
+                    and self.bytes <= self.capacity:
+                break
+            self.discard(key)
+
+    def discard(self, key):
+        """ Drop a result, if kept. Must be called holding the lock.
+
+        Parameters
+        ----------
+        key : hashable
+            Key identifying the operation.
+        """
+        entry = self.memo.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry[2]
+
+    def clear(self):
+        """ Forget the results of the completed operations, and do not keep
+        the results of the operations in progress.
+        """
+        with self.lock:
+            self.memo.clear()
+            self.bytes = 0
+            self.generation += 1
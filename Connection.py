@@ -15,17 +15,38 @@
 #
 # Copyright (C) 2016 Martino Pilia <martino.pilia@gmail.com>
 
+import collections
+import json
 import logging
-import requests
 import threading
+import time
 
 from PyQt5.QtCore import QObject, pyqtSignal
 
+from CategoryCrawler import CategoryCrawler
+from Coalescer import Coalescer
+from ListMerger import ListMerger
+from LuceneRegex import translate
+from Merge import merge3
+from QueryPlanner import QueryPlanner
+from RequestHandle import Cancelled, RequestHandle
+from SaveQueue import SaveQueue, TRANSIENT_ERRORS
+from SessionRegistry import SessionRegistry
+from Scheduler import Scheduler
+from Tracer import Tracer
+from WorkerPool import INTERACTIVE, BULK
+
 class Connection(QObject):
     """ Manage the connection with the wiki.
 
-    The requests are made in separate threads, allowing to wait without
-    blocking the UI.
+    The requests are made by a pool of worker threads, allowing to wait
+    without blocking the UI. Each request returns a RequestHandle, which
+    allows to cancel it, and whose id is carried by the signals emitting
+    its results.
+
+    The workers, the transport and the on-disk stores belong to a
+    SessionRegistry, possibly shared with the connections to other wikis or
+    accounts.
     """
 
     # signal emitted to change the temporary status message in a status bar
@@ -34,16 +55,45 @@ class Connection(QObject):
     # signal emitted to change the permanent status message in a status bar
     permanentMessage = pyqtSignal('QString', name='permanentMessage')
 
-    # signal emitted when the content of a page is available
-    pageContentReceived = pyqtSignal('QString', name='pageContentReceived')
-
-    # signal emitted when the content of a page is unavailable
-    pageContentUnavailable = pyqtSignal(name='pageContentUnavailable')
-
-    # signal emitted when a voice list is available
-    voicesReceived = pyqtSignal(list, name='voicesReceived')
-
-    def __init__(self, settings):
+    # signal emitted when the content of a page is available, carrying the
+    # request id, the content and the metadata of its revision
+    pageContentReceived = pyqtSignal(int, 'QString', dict,
+            name='pageContentReceived')
+
+    # signal emitted when the content of a page is unavailable, carrying the
+    # request id, and True if the page could not be loaded for a network
+    # failure
+    pageContentUnavailable = pyqtSignal(int, bool,
+            name='pageContentUnavailable')
+
+    # signal emitted when a batch of voices of a list is available, carrying
+    # the request id and the titles
+    voicesReceived = pyqtSignal(int, list, name='voicesReceived')
+
+    # signal emitted when a list query is completed, carrying the request id
+    # and the number of voices received
+    listFinished = pyqtSignal(int, int, name='listFinished')
+
+    # signal emitted for each page of a batch request, carrying the request
+    # id, the title, the content and the revision metadata of the page
+    pageDataReceived = pyqtSignal(int, 'QString', 'QString', dict,
+            name='pageDataReceived')
+
+    # signal emitted for each page of a batch request which is unavailable,
+    # carrying the request id and the title
+    pageDataUnavailable = pyqtSignal(int, 'QString',
+            name='pageDataUnavailable')
+
+    # signal emitted when the validation of a list of titles is completed,
+    # carrying the request id, the final title of each valid title, and the
+    # reason of each title changed or dropped
+    titlesValidated = pyqtSignal(int, dict, dict, name='titlesValidated')
+
+    # signal emitted when the filtering of a list of titles by a search is
+    # completed, carrying the request id and the titles matching the search
+    titlesFiltered = pyqtSignal(int, list, name='titlesFiltered')
+
+    def __init__(self, settings, registry=None, account='connection'):
         """ Object initialization.
 
         Parameters
@@ -51,71 +101,424 @@ class Connection(QObject):
         self : QWidget
         settings : QObject
             Settings object for the program.
+        registry : SessionRegistry optional
+            Registry providing the workers, the transport and the stores.
+            If absent, the connection creates its own.
+        account : str optional
+            Settings group containing the language, the site, the username,
+            the password and the optional API address of the account.
         """
         super().__init__()
         self.setObjectName('Connection')
 
-        # logging
-        logging.basicConfig()
-        logging.getLogger().setLevel(logging.DEBUG)
-        requests_log = logging.getLogger("requests.packages.urllib3")
-        requests_log.setLevel(logging.DEBUG)
-        requests_log.propagate = True
-
         self.settings = settings
+        self.account = account
+        self.ownsRegistry = registry is None
+        if registry is None:
+            registry = SessionRegistry(settings)
+        self.registry = registry
+
+        # verbose logging, disabled by default
+        if self.settings.value('connection/debug', False, type=bool):
+            logging.basicConfig()
+            logging.getLogger().setLevel(logging.DEBUG)
+            requests_log = logging.getLogger("requests.packages.urllib3")
+            requests_log.setLevel(logging.DEBUG)
+            requests_log.propagate = True
+
+        # record of the last requests
+        self.tracer = Tracer(self.settings.value('trace/size', 10000, type=int))
         self.isConnected = False
-        self.session = requests.Session()
+        self.pool = registry.pool
+        # client of the shared transport, with the cookies of this session
+        self.transport = registry.transport.client()
+        # object regulating the rate of the requests
+        self.scheduler = Scheduler(self.settings)
+        # object sharing the responses of identical reads
+        self.coalescer = Coalescer(
+                self.settings.value('connection/memo', 2.0, type=float),
+                capacity=self.settings.value(
+                    'connection/memobytes', 16 * 2 ** 20, type=int),
+                weigh=memoWeight)
+        # object choosing limits, batch sizes and concurrency of the
+        # requests, from the information retrieved at login
+        self.planner = QueryPlanner(self.transport.connections)
+        # edit token of the session
+        self.csrfToken = None
+        # metadata of the loaded revision of each page, indexed by title
+        self.pageInfo = {}
+        # id and content of the last loaded revisions, indexed by title,
+        # used as common ancestor when merging an edit conflict
+        self.baseTexts = collections.OrderedDict()
+        self.baseTextsSize = self.settings.value('merge/size', 500, type=int)
+        self.baseTextsLock = threading.Lock()
+        # number of times an edit is merged and submitted again when the
+        # page keeps changing
+        self.mergeAttempts = self.settings.value(
+                'merge/attempts', 3, type=int)
+        # queue of the edits to be saved in background
+        self.saveQueue = SaveQueue(self)
+        # on-disk cache of the page content
+        self.cache = registry.cache
+        # on-disk progress of the list queries, to resume them
+        self.checkpoints = registry.checkpoints
+        # login sessions kept between the runs of the program
+        self.sessions = registry.sessions
 
     def address(self):
         """ Return the address of the wiki in use.
+
+        The address built from the language and the site can be overridden
+        with the full address of an api.php endpoint.
         """
+        if self.accountValue('api'):
+            return self.accountValue('api')
         return 'https://%s.%s.org/w/api.php' % (
-            self.settings.value('connection/lang'),
-            self.settings.value('connection/site'))
+            self.accountValue('lang'),
+            self.accountValue('site'))
+
+    def accountValue(self, key):
+        """ Return a setting of the account of the connection.
+
+        Parameters
+        ----------
+        self : QWidget
+        key : str
+            Name of the setting, one of lang, site, username, password and
+            api.
+        """
+        return self.settings.value(self.account + '/' + key)
+
+    def post(self, data, address=None):
+        """ Make a POST request to the wiki and return the response.
+
+        The request waits for the scheduler, and it is repeated when the
+        server asks to slow down. When the request of the calling worker is
+        cancelled, Cancelled is raised. Identical queries in progress or
+        completed in the last moments share the same response.
+
+        Parameters
+        ----------
+        self : QWidget
+        data : dict
+            Parameters of the request.
+        address : str optional
+            Address for the request. If absent, the API address is used.
+        """
+        if address is None:
+            address = self.address()
+        data = self.schedulerData(data)
+
+        key = coalescingKey(address, data)
+        if key is None:
+            return self.send(address, data)
+        # errors are not memorized, so the request can be repeated
+        return self.coalescer.run(
+                key,
+                lambda: self.send(address, data),
+                lambda res: res.status_code == 200
+                    and 'MediaWiki-API-Error' not in res.headers,
+                self.pool.currentHandle())
+
+    def send(self, address, data):
+        """ Make a POST request to the wiki, waiting for the scheduler, and
+        return the response.
+
+        Parameters
+        ----------
+        self : QWidget
+        address : str
+            Address for the request.
+        data : dict
+            Parameters of the request, including the scheduler ones.
+        """
+        kind = requestKind(data)
+        handle = self.pool.currentHandle()
+
+        for attempt in range(self.scheduler.maxRetries + 1):
+            self.scheduler.acquire(kind)
+            start = time.monotonic()
+            try:
+                res = self.transport.post(address, data, handle)
+            except Exception:
+                self.tracer.record(
+                        address, data, None, time.monotonic() - start)
+                raise
+            self.tracer.record(address, data, res, time.monotonic() - start)
+            if not self.scheduler.feedback(kind, res, start):
+                break
+        return res
+
+    def postMany(self, dataList, address=None):
+        """ Make a set of POST requests to the wiki, concurrently when the
+        transport allows it, and return the list of responses.
+
+        Parameters
+        ----------
+        self : QWidget
+        dataList : list of dict
+            Parameters of each request.
+        address : str optional
+            Address for the requests. If absent, the API address is used.
+        """
+        if address is None:
+            address = self.address()
+        dataList = [self.schedulerData(data) for data in dataList]
+
+        # the number of requests in flight is chosen by the planner
+        responses = []
+        sent = []
+        step = self.planner.concurrency()
+        for i in range(0, len(dataList), step):
+            chunk = dataList[i : i + step]
+            for data in chunk:
+                self.scheduler.acquire(requestKind(data))
+            start = time.monotonic()
+            timings = []
+            try:
+                chunkResponses = self.transport.postMany(
+                        address, chunk, self.pool.currentHandle(), timings)
+            except Exception:
+                # the requests without a timing are recorded with the
+                # duration of the whole chunk
+                elapsed = time.monotonic() - start
+                timings.extend([elapsed] * (len(chunk) - len(timings)))
+                for data, latency in zip(chunk, timings):
+                    self.tracer.record(address, data, None, latency)
+                raise
+            for data, res, latency in zip(chunk, chunkResponses, timings):
+                self.tracer.record(address, data, res, latency)
+            responses.extend(chunkResponses)
+            sent.extend([start] * len(chunk))
+
+        # repeat one by one the throttled requests
+        for i, (data, res) in enumerate(zip(dataList, responses)):
+            if self.scheduler.feedback(requestKind(data), res, sent[i]):
+                responses[i] = self.send(address, data)
+        return responses
+
+    def schedulerData(self, data):
+        """ Return the parameters of a request, completed with the maxlag
+        parameter for the API requests.
+
+        Parameters
+        ----------
+        self : QWidget
+        data : dict
+            Parameters of the request.
+        """
+        if 'format' in data and self.scheduler.maxlag > 0:
+            data = dict(data)
+            data.setdefault('maxlag', str(self.scheduler.maxlag))
+        return data
+
+    def submit(self, function, *args, priority=INTERACTIVE):
+        """ Start a new request executing a function in a worker, and return
+        its handle. The handle is passed to the function as first argument.
+
+        Parameters
+        ----------
+        self : QWidget
+        function : callable
+            Function implementing the request.
+        args : list
+            Further arguments for the function.
+        priority : int optional
+            Priority class of the request.
+        """
+        handle = RequestHandle()
+        self.pool.submit(function, handle, *args,
+                priority=priority, handle=handle)
+        return handle
+
+    def sleep(self, seconds):
+        """ Wait for some time in a worker, stopping as soon as the request
+        of the worker is cancelled.
+
+        Parameters
+        ----------
+        self : QWidget
+        seconds : float
+            Waiting time.
+        """
+        handle = self.pool.currentHandle()
+        if handle is None:
+            time.sleep(seconds)
+        else:
+            handle.sleep(seconds)
+
+    def shutdown(self):
+        """ Stop the workers and the transport once the pending requests are
+        completed, if they are not shared with other connections.
+        """
+        if self.ownsRegistry:
+            self.registry.shutdown()
 
     def connect(self):
-        """ Open a connection to the wiki.
+        """ Open a connection to the wiki. When already connected, the
+        edits staged offline after a network failure are saved.
         """
         if self.isConnected:
-            return
+            if self.saveQueue.offlineCount() < 1:
+                return
+            function = self.saveQueue.flush
+        else:
+            function = self.connectFunction
 
-        t = threading.Thread(target=self.connectFunction)
-        t.start()
+        handle = RequestHandle()
+        self.pool.submit(function, handle=handle)
+        return handle
 
     def connectFunction(self):
         """ Implement the connection opening.
 
+        A session stored by a previous run is reused when it is still valid,
+        otherwise the full login is performed. When the stored session cannot
+        be validated, the connection stays closed and the session is kept
+        for the next attempt. Once connected, the edits made while offline
+        are saved.
+
         See https://www.mediawiki.org/wiki/API:Login
         """
 
+        try:
+            resumed = self.resumeSession()
+        except Cancelled:
+            raise
+        except Exception as e:
+            # network failure
+            resumed = None
+            self.statusMessage.emit(
+                    'Reconnection failed: %s' % type(e).__name__)
+        if resumed is None:
+            self.permanentMessage.emit('Disconnected')
+            return
+        if resumed:
+            self.saveQueue.flush()
+            return
+
         data = {
             'action': 'login',
-            'lgname': self.settings.value('connection/username'),
-            'lgpassword': self.settings.value('connection/password'),
+            'lgname': self.accountValue('username'),
+            'lgpassword': self.accountValue('password'),
             'format': 'json'
         }
-        res = self.session.post(self.address(), data=data)
+        res = self.post(data)
 
         self.statusMessage.emit('Login: ' + res.json()['login']['result'])
 
         data = {
             'action': 'login',
-            'lgname': self.settings.value('connection/username'),
-            'lgpassword': self.settings.value('connection/password'),
+            'lgname': self.accountValue('username'),
+            'lgpassword': self.accountValue('password'),
             'lgtoken': res.json()['login']['token'],
             'format': 'json'
         }
-        res = self.session.post(self.address(), data=data).json()
+        res = self.post(data).json()
 
         self.statusMessage.emit('Login: ' + res['login']['result'])
 
         if res['login']['result'] == "Success":
-            self.isConnected = True
-            self.permanentMessage.emit(
-                    '%s@%s.%s' % (
-                        self.settings.value('connection/username'),
-                        self.settings.value('connection/lang'),
-                        self.settings.value('connection/site')))
+            # responses memorized before the login are not valid anymore
+            self.coalescer.clear()
+            self.getSiteInfo()
+            self.setConnected()
+            self.saveSession()
+            self.saveQueue.flush()
+
+    def setConnected(self):
+        """ Mark the connection as open.
+        """
+        self.isConnected = True
+        self.permanentMessage.emit(
+                '%s@%s.%s' % (
+                    self.accountValue('username'),
+                    self.accountValue('lang'),
+                    self.accountValue('site')))
+
+    def sessionKey(self):
+        """ Return the key identifying the current account in the session
+        store and in the offline store.
+        """
+        return '%s@%s' % (
+                self.accountValue('username'),
+                self.address())
+
+    def hasStoredSession(self):
+        """ Return True if a session of the current account is stored.
+        """
+        return self.sessions is not None and \
+                self.sessions.load(self.sessionKey()) is not None
+
+    def resumeSession(self):
+        """ Restore the session stored for the current account, returning
+        True if it is still valid, False if there is no valid session, and
+        None if the session could not be validated.
+
+        The session is validated by the request for the information about
+        the site and the user, which is needed anyway. The session is
+        dropped only when the server reports the user as anonymous.
+        """
+
+        if self.sessions is None:
+            return False
+        state = self.sessions.load(self.sessionKey())
+        if state is None:
+            return False
+
+        self.transport.importCookies(state['cookies'], self.address())
+        self.csrfToken = state.get('csrfToken')
+        self.coalescer.clear()
+        userinfo = self.getSiteInfo()
+
+        if userinfo is None:
+            # error of the server, the session is kept for the next attempt
+            self.statusMessage.emit('Reconnection failed')
+            return None
+
+        if 'anon' in userinfo:
+            # the session expired
+            self.transport.clearCookies()
+            self.csrfToken = None
+            self.sessions.remove(self.sessionKey())
+            self.statusMessage.emit('Session expired')
+            return False
+
+        self.statusMessage.emit('Session restored')
+        self.setConnected()
+        return True
+
+    def saveSession(self):
+        """ Store the current session, to be reused by the next run.
+        """
+        if self.sessions is None or not self.isConnected:
+            return
+        self.sessions.save(self.sessionKey(), {
+            'cookies': self.transport.exportCookies(),
+            'csrfToken': self.csrfToken
+        })
+
+    def getSiteInfo(self):
+        """ Retrieve the information about the site and the logged user
+        used to plan the requests, and apply the rate limits of the user.
+        Return the information about the user, or None on failure.
+
+        See https://www.mediawiki.org/wiki/API:Siteinfo and
+        https://www.mediawiki.org/wiki/API:Userinfo
+        """
+
+        data = {
+            'action': 'query',
+            'format': 'json',
+            'meta': 'siteinfo|userinfo',
+            'siprop': 'general|namespaces',
+            'uiprop': 'rights|ratelimits'
+        }
+        res = self.post(data).json()
+
+        self.planner.update(res.get('query', {}) if 'error' not in res else {})
+        self.scheduler.limitMaxRate('edit', self.planner.rate('edit'))
+        return res.get('query', {}).get('userinfo')
 
     def disconnect(self):
         """ Close a connection to the wiki.
@@ -123,8 +526,9 @@ class Connection(QObject):
         if not self.isConnected:
             return
 
-        t = threading.Thread(target=self.disconnectFunction)
-        t.start()
+        handle = RequestHandle()
+        self.pool.submit(self.disconnectFunction, handle=handle)
+        return handle
 
     def disconnectFunction(self):
         """ Implement the connection closure.
@@ -132,13 +536,21 @@ class Connection(QObject):
         See https://www.mediawiki.org/wiki/API:Logout
         """
 
-        self.session.post(self.address(), data={'action': 'logout'})
+        self.post({'action': 'logout'})
+        self.transport.clearCookies()
+        if self.sessions is not None:
+            self.sessions.remove(self.sessionKey())
+        self.csrfToken = None
+        self.coalescer.clear()
+        self.planner.update({})
+        self.scheduler.limitMaxRate('edit', None)
 
         self.isConnected = False
         self.permanentMessage.emit('Disconnected')
 
     def getPageContent(self, page):
-        """ Get the content of a page from the wiki.
+        """ Get the content of a page from the wiki. While offline, the
+        page is read from the cache.
 
         Parameters
         ----------
@@ -147,82 +559,514 @@ class Connection(QObject):
             Name of the requested page.
         """
 
-        if not self.isConnected:
+        if not self.isConnected and self.cache is None:
             return
 
-        t = threading.Thread(target=self.getPageContentFunction, args=[page])
-        t.start()
+        return self.submit(self.getPageContentFunction, page)
 
-    def getPageContentFunction(self, page):
+    def getPageContentFunction(self, handle, page):
         """ Implement the page request.
-        """
 
-        address = 'https://%s.%s.org/wiki/%s' % (
-                self.settings.value('connection/lang'),
-                self.settings.value('connection/site'),
-                requests.utils.quote(page, safe=''))
+        The metadata of the revision are stored, to be used as base for a
+        following edit of the page.
+        """
 
-        res = self.session.post(address, data={'action': 'raw'})
+        try:
+            pages = self.loadPages([page])
+        except Cancelled:
+            raise
+        except Exception as e:
+            # network failure, the selector must not wait for the page
+            handle.check()
+            self.statusMessage.emit('Loading failed: %s' % type(e).__name__)
+            self.pageContentUnavailable.emit(handle.id, True)
+            return
+        handle.check()
 
-        if res.status_code != 200:
+        if page not in pages:
             self.statusMessage.emit('The selected voice cannot be loaded')
-            self.pageContentUnavailable.emit()
+            self.pageContentUnavailable.emit(handle.id, False)
         else:
-            self.pageContentReceived.emit(res.text)
+            self.pageContentReceived.emit(handle.id, *pages[page])
+
+    def getPagesContent(self, titles, priority=INTERACTIVE):
+        """ Get the content of a set of pages from the wiki, using as few
+        requests as possible.
 
-    def edit(self, page, content, summary=''):
-        """ Edit a page in the wiki, using the providen content.
+        The result for each page is emitted separately, through the
+        pageDataReceived and pageDataUnavailable signals. While offline, the
+        pages are read from the cache.
 
         Parameters
         ----------
         self : QWidget
-        page : str
-            Name of the requested page.
-        content : str
-            Content to be saved in the page.
-        summary : str optional
-            Summary for the edit.
+        titles : list of str
+            Names of the requested pages.
+        priority : int optional
+            Priority class of the request, PREFETCH when the pages are
+            loaded ahead of the user.
         """
 
-        if not self.isConnected:
+        if not self.isConnected and self.cache is None:
             return
 
-        t = threading.Thread(
-                target=self.editFunction,
-                args=[page, content, summary])
-        t.start()
+        return self.submit(self.getPagesContentFunction, list(titles),
+                priority=priority)
+
+    def getPagesContentFunction(self, handle, titles):
+        """ Implement the batch page request.
+
+        See https://www.mediawiki.org/wiki/API:Revisions
+
+        Parameters
+        ----------
+        self : QWidget
+        handle : RequestHandle
+            Handle of the request.
+        titles : list of str
+            Names of the requested pages.
+        """
+
+        try:
+            pages = self.loadPages(titles)
+        except Cancelled:
+            raise
+        except Exception as e:
+            # network failure, release the titles so they can be requested
+            # again
+            handle.check()
+            self.statusMessage.emit('Loading failed: %s' % type(e).__name__)
+            pages = {}
+        handle.check()
+
+        for title in titles:
+            if title in pages:
+                self.pageDataReceived.emit(handle.id, title, *pages[title])
+            else:
+                self.pageDataUnavailable.emit(handle.id, title)
+
+    def loadPages(self, titles):
+        """ Return a dictionary containing the content and the metadata of
+        the last revision of each available page, indexed by title.
+
+        A page already being loaded by another worker, or loaded in the
+        last moments, is not requested again, and its result is shared.
+
+        Parameters
+        ----------
+        self : QWidget
+        titles : list of str
+            Names of the requested pages.
+        """
+
+        flights = {}
+        waiting = {}
+        for title in dict.fromkeys(titles):
+            flight, leader = self.coalescer.claim(
+                    ('page', self.address(), title))
+            if leader:
+                flights[title] = flight
+            else:
+                waiting[title] = flight
+
+        try:
+            pages = self.fetchPages(list(flights))
+        except BaseException:
+            for title, flight in flights.items():
+                self.coalescer.abandon(('page', self.address(), title), flight)
+            raise
+        for title, flight in flights.items():
+            self.coalescer.resolve(
+                    ('page', self.address(), title), flight, pages.get(title))
+
+        # load again the pages whose leader failed, leaving the wait when
+        # the request of this worker is cancelled
+        handle = self.pool.currentHandle()
+        failed = [title for title, flight in waiting.items()
+                if not flight.wait(handle)]
+        pages.update(self.fetchPages(failed))
+        for title, flight in waiting.items():
+            if flight.ok and flight.value is not None:
+                pages[title] = flight.value
+
+        return pages
+
+    def fetchPages(self, titles):
+        """ Return a dictionary containing the content and the metadata of
+        the last revision of each available page, indexed by title.
+
+        The pages found in the cache are revalidated with a single cheap
+        request for each batch of titles, unless they were validated
+        recently, and only the pages missing from the cache or outdated are
+        downloaded. While offline, or when the revalidation fails, the
+        cached pages are used regardless of their age, and the other ones
+        are not available. Cached pages are removed only when the server
+        reports them as missing.
+
+        Parameters
+        ----------
+        self : QWidget
+        titles : list of str
+            Names of the requested pages.
+        """
 
-    def editFunction(self, page, content, summary=''):
-        """ Implement the page edit.
+        pages = {}
+
+        if self.cache is not None:
+            cached = self.cache.get(self.address(), titles)
+            freshness = self.settings.value('cache/freshness', 900, type=float)
+            stale = []
+            for title, (content, meta) in cached.items():
+                if meta['checked'] > time.time() - freshness or \
+                        not self.isConnected:
+                    self.pageInfo[title] = meta
+                    self.rememberBase(title, meta['revid'], content)
+                    pages[title] = (content, meta)
+                else:
+                    stale.append(title)
+            if len(stale) > 0:
+                missing = set()
+                try:
+                    current = self.getPagesMeta(stale, missing)
+                except Cancelled:
+                    raise
+                except Exception:
+                    # network failure, the cached pages are used
+                    current = {}
+                valid = []
+                for title in stale:
+                    content, meta = cached[title]
+                    if title in missing:
+                        # the page does not exist anymore
+                        self.cache.remove(self.address(), title)
+                    elif title not in current:
+                        # the revalidation failed, the cached page is used
+                        # and checked again the next time
+                        self.pageInfo[title] = meta
+                        self.rememberBase(title, meta['revid'], content)
+                        pages[title] = (content, meta)
+                    elif current[title]['revid'] == meta['revid']:
+                        pages[title] = (content, current[title])
+                        self.rememberBase(title, meta['revid'], content)
+                        valid.append(title)
+                self.cache.touch(self.address(), valid)
+
+        titles = [title for title in titles if title not in pages]
+        if len(titles) == 0 or not self.isConnected:
+            return pages
+        batches = self.planner.batches(titles)
+        dataList = [self.pagesBatchData(batch) for batch in batches]
+
+        # the first requests of the batches are made concurrently
+        responses = self.postMany(dataList)
+
+        for batch, data, res in zip(batches, dataList, responses):
+            pages.update(self.readPagesBatch(batch, data, res.json()))
+
+        return pages
+
+    def getPagesMeta(self, titles, missing=None):
+        """ Return a dictionary containing the metadata of the last revision
+        of each available page, indexed by title.
+
+        Parameters
+        ----------
+        self : QWidget
+        titles : list of str
+            Names of the requested pages.
+        missing : set optional
+            Set receiving the titles reported as missing by the server.
+        """
+
+        batches = self.planner.batches(titles)
+        dataList = [self.pagesBatchData(batch, False) for batch in batches]
+
+        responses = self.postMany(dataList)
+
+        metas = {}
+        for batch, data, res in zip(batches, dataList, responses):
+            pages = self.readPagesBatch(batch, data, res.json(), missing)
+            for title, (content, meta) in pages.items():
+                metas[title] = meta
+        return metas
+
+    def pagesBatchData(self, titles, content=True):
+        """ Return the parameters of a request for the content and the
+        metadata of the last revision of a batch of pages.
+
+        Parameters
+        ----------
+        self : QWidget
+        titles : list of str
+            Names of the requested pages, not exceeding the batch size.
+        content : bool optional
+            If False, only the metadata are requested.
+        """
+        return {
+            'action': 'query',
+            'format': 'json',
+            'prop': 'revisions',
+            'rvprop': 'content|timestamp|ids|size' if content
+                else 'timestamp|ids|size',
+            'rvslots': 'main',
+            'titles': '|'.join(titles),
+            'curtimestamp': '',
+            'continue': ''
+        }
+
+    def readPagesBatch(self, titles, data, res, missing=None):
+        """ Return a dictionary containing the content and the metadata of
+        each available page of a batch request, indexed by the requested
+        title, following the continuation of the query when needed.
+
+        The metadata are also stored in the pageInfo attribute, to be used
+        as base for a following edit of the page, and the content is stored
+        in the cache.
+
+        Parameters
+        ----------
+        self : QWidget
+        titles : list of str
+            Names of the requested pages.
+        data : dict
+            Parameters of the request.
+        res : dict
+            Parsed response to the first request of the batch.
+        missing : set optional
+            Set receiving the titles reported as missing or invalid by the
+            server. The titles of a failed request are not added.
+        """
+
+        # map the titles normalized by the server to the requested ones
+        requested = {title: title for title in titles}
+        pages = {}
+        withContent = 'content' in data['rvprop'].split('|')
+
+        while True:
+            if 'error' in res:
+                self.statusMessage.emit(res['error']['code'])
+                break
+
+            for item in res['query'].get('normalized', []):
+                requested[item['to']] = requested.get(item['from'], item['from'])
+
+            for page in res['query']['pages'].values():
+                title = requested.get(page['title'], page['title'])
+                if missing is not None and \
+                        ('missing' in page or 'invalid' in page):
+                    missing.add(title)
+                    continue
+                # pages with content exceeding the response size limit are
+                # returned in the following continuation batches
+                if 'revisions' not in page or title in pages:
+                    continue
+                revision = page['revisions'][0]
+                meta = revisionMeta(page, revision, res)
+                content = revisionContent(revision)
+                self.pageInfo[title] = meta
+                if withContent:
+                    self.rememberBase(title, meta['revid'], content)
+                if withContent and self.cache is not None:
+                    self.cache.put(self.address(), title, content, meta)
+                pages[title] = (content, meta)
+
+            # manage continuation of the query
+            if 'continue' in res:
+                data.update(res['continue'])
+                res = self.post(data).json()
+            else:
+                break
+
+        return pages
+
+    def editFunction(self, page, content, summary='', meta=None):
+        """ Implement the page edit, returning the error code of the edit or
+        None on success.
+
+        The base revision of the edit is the one given, usually the revision
+        shown in the editor, or the one loaded last when absent, so the edit
+        requires a single request when the edit token is already available.
+        When the page was changed in the meanwhile, the edit is merged with
+        the last revision and submitted again, unless the changes overlap.
+
+        The metadata given are updated to the saved revision when the edit
+        is saved without merging, since the editor which made it keeps the
+        saved text, so its following edits are based on the saved revision.
 
         See https://www.mediawiki.org/wiki/API:Edit
         """
 
-        # get edit token
+        given = meta
+        if meta is None:
+            meta = self.pageInfo.get(page)
+        if meta is None:
+            # the page was not loaded, get its last revision
+            meta = self.getPageMeta(page)
+            if meta is None:
+                self.statusMessage.emit('Wrong page title')
+                return 'missingtitle'
+        meta = dict(meta)
+
+        res = self.editRequest(page, content, summary, meta)
+
+        if 'error' in res and res['error']['code'] == 'badtoken':
+            # the token expired, get a new one and retry
+            self.csrfToken = None
+            res = self.editRequest(page, content, summary, meta)
+
+        attempts = 0
+        while 'error' in res and res['error']['code'] == 'editconflict' and \
+                attempts < self.mergeAttempts:
+            attempts += 1
+            merged = self.mergeConflict(page, content, meta)
+            if merged is None:
+                break
+            content, meta = merged
+            self.statusMessage.emit('%s: edit conflict merged' % page)
+            res = self.editRequest(page, content, summary, meta)
+
+        if 'error' in res:
+            self.statusMessage.emit(res['error']['code'])
+            return res['error']['code']
+
+        self.statusMessage.emit(res['edit']['result'])
+        if res['edit']['result'] != 'Success':
+            return res['edit']['result']
+
+        # the memorized responses may contain the previous revision
+        self.coalescer.clear()
+
+        if 'newrevid' in res['edit']:
+            # the saved revision is the base for the next edit
+            meta.update({
+                'revid': res['edit']['newrevid'],
+                'timestamp': res['edit']['newtimestamp'],
+                'size': len(content.encode('utf-8'))
+            })
+            self.pageInfo[page] = meta
+            if given is not None and attempts == 0:
+                # after a merge, the saved text includes changes missing from
+                # the editor, which stays based on its revision
+                given.update(meta)
+            self.rememberBase(page, meta['revid'], content)
+            if self.cache is not None:
+                self.cache.put(self.address(), page, content, meta)
+        return None
+
+    def mergeConflict(self, page, content, meta):
+        """ Merge an edit with the changes made to the page after its base
+        revision, and return the merged content and the metadata of the last
+        revision, which is the base of the merged edit. Return None if the
+        changes overlap or the revisions are not available.
+
+        Parameters
+        ----------
+        self : QWidget
+        page : str
+            Name of the page.
+        content : str
+            Content of the edit.
+        meta : dict
+            Metadata of the base revision of the edit.
+        """
+
+        base = self.baseText(page, meta['revid'])
+        if base is None:
+            return None
+
+        # the last revision is requested bypassing the shared responses,
+        # which may be older than the conflicting one
+        data = self.pagesBatchData([page])
+        res = self.send(self.address(), self.schedulerData(data))
+        current = self.readPagesBatch([page], data, res.json()).get(page)
+        if current is None:
+            return None
+
+        merged = merge3(base, content, current[0])
+        if merged is None:
+            return None
+        return merged, dict(current[1])
+
+    def rememberBase(self, page, revid, content):
+        """ Store the content of a loaded revision, to be used as common
+        ancestor when merging an edit conflict.
+
+        Parameters
+        ----------
+        self : QWidget
+        page : str
+            Name of the page.
+        revid : int
+            Id of the revision.
+        content : str
+            Content of the revision.
+        """
+        with self.baseTextsLock:
+            self.baseTexts[page] = (revid, content)
+            self.baseTexts.move_to_end(page)
+            while len(self.baseTexts) > self.baseTextsSize:
+                self.baseTexts.popitem(last=False)
+
+    def baseText(self, page, revid, fetch=True):
+        """ Return the content of a revision of a page, using the stored one
+        when available, or None if the revision is not available.
+
+        Parameters
+        ----------
+        self : QWidget
+        page : str
+            Name of the page.
+        revid : int
+            Id of the revision.
+        fetch : bool optional
+            If False, the revision is not requested when it is not stored.
+
+        See https://www.mediawiki.org/wiki/API:Revisions
+        """
+        with self.baseTextsLock:
+            stored = self.baseTexts.get(page)
+        if stored is not None and stored[0] == revid:
+            return stored[1]
+        if not fetch:
+            return None
+
         data = {
             'action': 'query',
             'format': 'json',
-            'prop': 'info',
-            'meta': 'tokens',
-            'type': 'csrf',
-            'indexpageids': '',
-            'titles': page
+            'prop': 'revisions',
+            'rvprop': 'content|ids',
+            'rvslots': 'main',
+            'revids': revid
         }
+        res = self.post(data).json()
+        if 'error' in res:
+            return None
+        for item in res['query'].get('pages', {}).values():
+            for revision in item.get('revisions', []):
+                if revision['revid'] == revid:
+                    return revisionContent(revision)
+        return None
 
-        res = self.session.post(self.address(), data=data).json()
+    def editRequest(self, page, content, summary, meta):
+        """ Submit an edit, and return the parsed response.
 
-        if 'error' in res:
-            # TODO the query somehow failed
-            self.statusMessage.emit('Some error')
-
-        # get pageid
-        pageid = str(res['query']['pageids'][0])
-        if int(pageid) < 0:
-            # TODO page not found
-            self.statusMessage.emit('Wrong page title')
-            return
+        Parameters
+        ----------
+        self : QWidget
+        page : str
+            Name of the page.
+        content : str
+            Content to be saved in the page.
+        summary : str
+            Summary for the edit.
+        meta : dict
+            Metadata of the base revision of the edit.
+        """
+
+        token = self.getCsrfToken()
+        if token is None:
+            return {'error': {'code': 'notoken'}}
 
-        # query to submit changes
         # pass the token parameter last, so if the edit gets interrupted,
         # the token won't be passed and the edit will fail
         data = {
@@ -232,17 +1076,49 @@ class Connection(QObject):
             'title': page,
             'summary': summary,
             'text': content,
-            'basetimestamp': res['query']['pages'][pageid]['touched'],
-            'token': res['query']['tokens']['csrftoken']
+            'baserevid': meta['revid'],
+            'basetimestamp': meta['timestamp'],
         }
+        if meta.get('starttimestamp'):
+            data['starttimestamp'] = meta['starttimestamp']
+        data['token'] = token
 
-        res = self.session.post(self.address(), data=data).json()
+        return self.post(data).json()
 
-        if 'error' in res:
-            #TODO
-            self.statusMessage.emit(res['error']['code'])
-        else:
-            self.statusMessage.emit(res['edit']['result'])
+    def getCsrfToken(self):
+        """ Return the edit token for the session, requesting it only when it
+        is not available yet.
+
+        See https://www.mediawiki.org/wiki/API:Tokens
+        """
+
+        if self.csrfToken is not None:
+            return self.csrfToken
+
+        data = {
+            'action': 'query',
+            'format': 'json',
+            'meta': 'tokens',
+            'type': 'csrf'
+        }
+
+        res = self.post(data).json()
+
+        if 'error' not in res:
+            self.csrfToken = res['query']['tokens']['csrftoken']
+        return self.csrfToken
+
+    def getPageMeta(self, page):
+        """ Get the metadata of the last revision of a page, returning None
+        if the page does not exist.
+
+        Parameters
+        ----------
+        self : QWidget
+        page : str
+            Name of the page.
+        """
+        return self.getPagesMeta([page]).get(page)
 
     def getLinks(self, title):
         """ Get the links contained in a page.
@@ -257,12 +1133,30 @@ class Connection(QObject):
         if not self.isConnected:
             return
 
-        t = threading.Thread(target=self.getLinksFunction, args=[title])
-        t.start()
+        return self.submit(self.getLinksFunction, title, priority=BULK)
 
-    def getLinksFunction(self, title):
+    def getLinksFunction(self, handle, title):
         """ Implement the request to obtain the links contained in a page.
 
+        Parameters
+        ----------
+        self : QWidget
+        handle : RequestHandle
+            Handle of the request.
+        title : str
+            Title of the page.
+        """
+
+        count = 0
+        for links in self.linkBatches(title):
+            count += len(links)
+            self.voicesReceived.emit(handle.id, links)
+
+        self.listFinished.emit(handle.id, count)
+
+    def linkBatches(self, title, errors=None):
+        """ Generator yielding the batches of the links contained in a page.
+
         See https://www.mediawiki.org/wiki/API:Links
 
         Parameters
@@ -270,51 +1164,39 @@ class Connection(QObject):
         self : QWidget
         title : str
             Title of the page.
+        errors : list optional
+            List receiving the error code when the query is interrupted.
         """
 
-        links = []
-
         data = {
             'action': 'query',
             'format': 'json',
             'assert': 'user',
             'prop': 'links',
             'titles': title,
-            'pllimit': '500',
+            'pllimit': self.planner.listLimit(),
             'indexpageids': '',
             'continue': ''
         }
 
-        continueToken = {}
-
-        while True:
-            data.update(continueToken)
-
-            res = self.session.post(self.address(), data=data).json()
-
+        for res in self.iterateQuery(data):
             if 'error' in res:
-                #TODO
-                self.voicesReceived.emit(links)
-                return
+                self.statusMessage.emit(res['error']['code'])
+                if errors is not None:
+                    errors.append(res['error']['code'])
+                break
 
             # get pageid
             pageid = str(res['query']['pageids'][0])
             if int(pageid) < 0:
                 # TODO page not found
                 self.statusMessage.emit('Wrong page title')
-                return
-
-            # get links
-            for voice in res['query']['pages'][pageid]['links']:
-                links.append(voice['title'])
-
-            # manage continuation of the query
-            if 'continue' in res:
-                continueToken = res['continue']
-            else:
+                if errors is not None:
+                    errors.append('missingtitle')
                 break
 
-        self.voicesReceived.emit(links)
+            yield [voice['title'] for voice in
+                    res['query']['pages'][pageid].get('links', [])]
 
     def getBacklinks(self, title):
         """ Get the backlinks for a page.
@@ -331,17 +1213,8 @@ class Connection(QObject):
         if not self.isConnected:
             return
 
-        data = {
-            'list': 'backlinks',
-            'blnamespace': '0',
-            'bltitle': title,
-            'bllimit': '500',
-        }
-
-        t = threading.Thread(
-                target=self.getVoices,
-                args=[title, 'backlinks', data])
-        t.start()
+        return self.submit(self.getVoices, title, 'backlinks',
+                self.listParams('backlinks', title), priority=BULK)
 
     def getEmbeddedin(self, title):
         """ Get the list of pages embedding a page.
@@ -358,18 +1231,8 @@ class Connection(QObject):
         if not self.isConnected:
             return
 
-        data = {
-            'list': 'embeddedin',
-            'eititle': title,
-            'einamespace': '0',
-            'eilimit': '500',
-            'continue': ''
-        }
-
-        t = threading.Thread(
-                target=self.getVoices,
-                args=[title, 'embeddedin', data])
-        t.start()
+        return self.submit(self.getVoices, title, 'embeddedin',
+                self.listParams('embeddedin', title), priority=BULK)
 
     def getCategorymembers(self, title):
         """ Get the pages contained in a category.
@@ -386,26 +1249,267 @@ class Connection(QObject):
         if not self.isConnected:
             return
 
+        return self.submit(self.getVoices, title, 'categorymembers',
+                self.listParams('categorymembers', title), priority=BULK)
+
+    def getSearch(self, text):
+        """ Get the pages matching a search, in the order of relevance.
+
+        See https://www.mediawiki.org/wiki/API:Search
+
+        Parameters
+        ----------
+        self : QWidget
+        text : str
+            Text of the search, as returned by searchText.
+        """
+
+        if not self.isConnected:
+            return
+
+        return self.submit(self.getVoices, text, 'search',
+                self.listParams('search', text), priority=BULK)
+
+    def searchText(self, pattern, terms=''):
+        """ Return the text of a search for the pages whose source matches a
+        regular expression.
+
+        The Python regular expression is translated into the syntax of the
+        search engine of the wiki, widening the constructs without an
+        equivalent, so the search finds at least all the pages matching
+        locally, where the regex is applied again. Further search terms,
+        such as incategory:Foo, are applied by the server too. ValueError is
+        raised if the regex cannot be translated.
+
+        See https://www.mediawiki.org/wiki/Help:CirrusSearch#Insource
+
+        Parameters
+        ----------
+        self : QWidget
+        pattern : str
+            Python regular expression.
+        terms : str optional
+            Further search terms.
+        """
+
+        expression, caseless = translate(pattern)
+        source = 'insource:/%s/%s' % (expression, 'i' if caseless else '')
+        return ' '.join(t for t in (terms.strip(), source) if t != '')
+
+    def getCategoryTree(self, title, depth):
+        """ Get the pages contained in a category and in its subcategories,
+        up to a given depth.
+
+        Parameters
+        ----------
+        self : QWidget
+        title : str
+            Title of the category.
+        depth : int
+            Maximum depth of the subcategories to be explored.
+        """
+
+        if not self.isConnected:
+            return
+
+        # the pool reserves workers for the interactive requests
+        fanout = min(
+                self.settings.value('crawl/fanout', 3, type=int),
+                self.pool.background,
+                self.planner.concurrency())
+
+        handle = RequestHandle()
+        crawler = CategoryCrawler(
+                self,
+                handle,
+                title,
+                depth,
+                fanout,
+                lambda voices: self.voicesReceived.emit(handle.id, voices),
+                lambda count: self.listFinished.emit(handle.id, count))
+        crawler.start()
+        return handle
+
+    def getVoicesWithContent(self, source, title):
+        """ Get a list of pages together with their content, which is stored
+        in the cache, so the pages are ready to be edited once the list is
+        complete.
+
+        Parameters
+        ----------
+        self : QWidget
+        source : str
+            Kind of list, one of links, backlinks, embeddedin,
+            categorymembers and search.
+        title : str
+            Title of the page, or text of the search.
+        """
+
+        if not self.isConnected:
+            return
+
+        if self.cache is None:
+            # nowhere to keep the content, get the titles only
+            if source == 'links':
+                return self.submit(self.getLinksFunction, title,
+                        priority=BULK)
+            return self.submit(self.getVoices, title, source,
+                    self.listParams(source, title), priority=BULK)
+
+        return self.submit(self.getVoicesWithContentFunction, source, title,
+                priority=BULK)
+
+    def getVoicesWithContentFunction(self, handle, source, title):
+        """ Implement the request of a list of pages with their content, using
+        the list as generator for a revisions query.
+
+        See https://www.mediawiki.org/wiki/API:Query#Generators
+
+        Parameters
+        ----------
+        self : QWidget
+        handle : RequestHandle
+            Handle of the request.
+        source : str
+            Kind of list.
+        title : str
+            Title of the page.
+        """
+
         data = {
-            'list': 'categorymembers',
-            'cmtitle': title,
-            'cmtype': 'page',
-            'cmlimit': '500',
+            'action': 'query',
+            'format': 'json',
+            'assert': 'user',
+            'prop': 'revisions|info',
+            'rvprop': 'content|timestamp|ids|size',
+            'rvslots': 'main',
+            'curtimestamp': ''
         }
+        data.update(self.generatorParams(source, title))
 
-        t = threading.Thread(
-                target=self.getVoices,
-                args=[title, 'categorymembers', data])
-        t.start()
+        sent = set()
+        timedOut = False
+        for res in self.iterateQuery(data):
+            if 'error' in res:
+                self.statusMessage.emit(res['error']['code'])
+                break
+            if searchTimedOut(res) and not timedOut:
+                timedOut = True
+                self.statusMessage.emit(
+                        'The regex search timed out, the list is partial')
+
+            # the content of some pages of a batch may be returned by the
+            # following continuation requests
+            voices = []
+            pages = res.get('query', {}).get('pages', {}).values()
+            for page in sorted(pages, key=lambda p: p['title']):
+                if 'revisions' not in page or page['title'] in sent:
+                    continue
+                revision = page['revisions'][0]
+                meta = revisionMeta(page, revision, res)
+                self.pageInfo[page['title']] = meta
+                self.rememberBase(
+                        page['title'], meta['revid'], revisionContent(revision))
+                self.cache.put(
+                        self.address(),
+                        page['title'],
+                        revisionContent(revision),
+                        meta)
+                sent.add(page['title'])
+                voices.append(page['title'])
+
+            if len(voices) > 0:
+                self.voicesReceived.emit(handle.id, voices)
+
+        self.listFinished.emit(handle.id, len(sent))
+
+    def generatorParams(self, source, title):
+        """ Return the parameters to use a list as generator in a query.
 
-    def getVoices(self, title, query, params):
-        """ Implement a query to the wiki to retrive a set of pages.
+        Parameters
+        ----------
+        self : QWidget
+        source : str
+            Kind of list, one of links, backlinks, embeddedin,
+            categorymembers and search.
+        title : str
+            Title of the page, or text of the search.
+        """
 
-        See https://www.mediawiki.org/wiki/API:Query
+        if source == 'links':
+            params = {
+                'generator': 'links',
+                'titles': title,
+                'gpllimit': self.planner.listLimit()
+            }
+        else:
+            params = {'generator': source}
+            for key, value in self.listParams(source, title).items():
+                if key != 'list':
+                    params['g' + key] = value
+
+        # the number of pages in each batch must not exceed the number of
+        # titles allowed in a query
+        for key in params:
+            if key.endswith('limit'):
+                params[key] = str(self.planner.titlesLimit())
+        return params
+
+    def listParams(self, query, title):
+        """ Return the parameters of a list query.
+
+        Parameters
+        ----------
+        self : QWidget
+        query : str
+            MediaWiki list module, one of backlinks, embeddedin,
+            categorymembers and search.
+        title : str
+            Title of the page, or text of the search.
+        """
+
+        if query == 'backlinks':
+            return {
+                'list': 'backlinks',
+                'blnamespace': '0',
+                'bltitle': title,
+                'bllimit': self.planner.listLimit(),
+            }
+        if query == 'embeddedin':
+            return {
+                'list': 'embeddedin',
+                'eititle': title,
+                'einamespace': '0',
+                'eilimit': self.planner.listLimit(),
+            }
+        if query == 'categorymembers':
+            return {
+                'list': 'categorymembers',
+                'cmtitle': title,
+                'cmtype': 'page',
+                'cmlimit': self.planner.listLimit(),
+            }
+        if query == 'search':
+            # only the titles are needed, without snippets and total hits
+            return {
+                'list': 'search',
+                'srsearch': title,
+                'srwhat': 'text',
+                'srnamespace': '0',
+                'srinfo': '',
+                'srprop': '',
+                'srlimit': self.planner.listLimit(),
+            }
+        raise ValueError('Unknown list query: %s' % query)
+
+    def getVoices(self, handle, title, query, params):
+        """ Implement a query to the wiki to retrive a set of pages.
 
         Parameters
         ----------
         self : QWidget
+        handle : RequestHandle
+            Handle of the request.
         title : str
             Title of the page.
         query : str
@@ -414,7 +1518,36 @@ class Connection(QObject):
             Parameters for the query.
         """
 
-        links = []
+        count = 0
+        for voices in self.voiceBatches(query, params):
+            count += len(voices)
+            self.voicesReceived.emit(handle.id, voices)
+
+        self.listFinished.emit(handle.id, count)
+
+    def voiceBatches(self, query, params, errors=None):
+        """ Generator yielding the batches of titles returned by a list
+        query.
+
+        The progress of the query is saved after each batch, and a query
+        interrupted by an error, a cancellation or a crash is resumed from
+        its last completed batch when it is repeated, yielding first the
+        titles already received. A query repeated while it is still running
+        is neither resumed nor saved.
+
+        See https://www.mediawiki.org/wiki/API:Query
+
+        Parameters
+        ----------
+        self : QWidget
+        query : str
+            MediaWiki query argument.
+        params : dict
+            Parameters for the query.
+        errors : list optional
+            List receiving the error code when the query is interrupted.
+        """
+
         data = {
             'action': 'query',
             'format': 'json',
@@ -422,26 +1555,485 @@ class Connection(QObject):
         }
         data.update(params)
 
-        continueToken = {}
-        while True:
-            data.update(continueToken)
+        key = None
+        if self.checkpoints is not None:
+            key = json.dumps([self.address(), sorted(data.items())])
+            if not self.checkpoints.claim(key):
+                # an identical query is running and keeps the checkpoint, so
+                # this one starts from scratch without saving its progress
+                key = None
+
+        timedOut = False
+        try:
+            if key is not None:
+                state = self.checkpoints.load(key, self.settings.value(
+                        'checkpoint/maxage', 86400, type=float))
+                if state is not None:
+                    continuation, batches = state
+                    self.statusMessage.emit(
+                            'Resuming the query after %d voices'
+                            % sum(len(batch) for batch in batches))
+                    yield from batches
+                    data.update(continuation)
+
+            for res in self.iterateQuery(data):
+                if 'error' in res:
+                    # the checkpoint is kept, to resume the query later
+                    self.statusMessage.emit(res['error']['code'])
+                    if errors is not None:
+                        errors.append(res['error']['code'])
+                    break
+
+                if searchTimedOut(res) and not timedOut:
+                    # the results of the search are partial
+                    timedOut = True
+                    self.statusMessage.emit(
+                            'The regex search timed out, the list is partial')
+                    if errors is not None:
+                        errors.append('cirrussearch-regex-timed-out')
+
+                titles = [voice['title'] for voice in
+                        res.get('query', {}).get(query, [])]
+                if key is not None:
+                    if 'continue' in res:
+                        self.checkpoints.save(key, res['continue'], titles)
+                    else:
+                        self.checkpoints.remove(key)
+                yield titles
+        finally:
+            if key is not None:
+                self.checkpoints.release(key)
+
+    def sourceBatches(self, source, title, errors=None):
+        """ Generator yielding the batches of titles of a list source.
 
-            res = self.session.post(self.address(), data=data).json()
+        Parameters
+        ----------
+        self : QWidget
+        source : str
+            Kind of list, one of links, backlinks, embeddedin,
+            categorymembers and search.
+        title : str
+            Title of the page, or text of the search.
+        errors : list optional
+            List receiving the error code when the query is interrupted.
+        """
+        if source == 'links':
+            return self.linkBatches(title, errors)
+        return self.voiceBatches(source, self.listParams(source, title),
+                errors)
+
+    def getCompound(self, sources, operation):
+        """ Get the union, the intersection or the difference of a set of
+        lists. The lists are retrieved concurrently, and the titles of the
+        result are sent as soon as they are known.
+
+        Parameters
+        ----------
+        self : QWidget
+        sources : list of tuple
+            Kind of list and title of the page for each source, as accepted
+            by sourceBatches.
+        operation : str
+            One of union, intersection and difference. The difference
+            subtracts from the first source all the others.
+        """
+
+        if not self.isConnected or len(sources) < 1:
+            return
+
+        handle = RequestHandle()
+        merger = ListMerger(
+                operation,
+                len(sources),
+                lambda voices: self.voicesReceived.emit(handle.id, voices),
+                lambda count: self.listFinished.emit(handle.id, count))
+
+        for i, (source, title) in enumerate(sources):
+            self.pool.submit(self.getSourceFunction, merger, i, source, title,
+                    priority=BULK, handle=handle)
+        return handle
 
+    def getSourceFunction(self, merger, index, source, title):
+        """ Implement the query for a source of a compound list. When the
+        query of the source is interrupted, its titles are incomplete, so
+        the compound list is aborted and the other sources are cancelled.
+
+        Parameters
+        ----------
+        self : QWidget
+        merger : ListMerger
+            Object combining the sources.
+        index : int
+            Index of the source.
+        source : str
+            Kind of list.
+        title : str
+            Title of the page.
+        """
+        errors = []
+        try:
+            for voices in self.sourceBatches(source, title, errors):
+                merger.add(index, voices)
+        except Cancelled:
+            merger.fail(index)
+            raise
+        except Exception as e:
+            # network failure
+            errors.append(type(e).__name__)
+
+        if len(errors) > 0:
+            self.statusMessage.emit(
+                    'Compound list incomplete (%s)' % errors[0])
+            merger.fail(index)
+            self.pool.currentHandle().cancel()
+        else:
+            merger.complete(index)
+
+    def validateTitles(self, titles):
+        """ Check a list of titles before loading the pages, emitting the
+        result through the titlesValidated signal.
+
+        The titles are normalized and the redirects are resolved, while the
+        titles which are invalid, or whose pages are missing or protected
+        against the edits of the user, are dropped.
+
+        Parameters
+        ----------
+        self : QWidget
+        titles : list of str
+            Titles to be checked.
+        """
+
+        if not self.isConnected:
+            return
+
+        return self.submit(self.validateTitlesFunction, list(titles),
+                priority=BULK)
+
+    def validateTitlesFunction(self, handle, titles):
+        """ Implement the validation of a list of titles, with a single
+        request for each batch of titles.
+
+        See https://www.mediawiki.org/wiki/API:Info and
+        https://www.mediawiki.org/wiki/API:Query#Resolving_redirects
+
+        Parameters
+        ----------
+        self : QWidget
+        handle : RequestHandle
+            Handle of the request.
+        titles : list of str
+            Titles to be checked.
+        """
+
+        batches = self.planner.batches(list(dict.fromkeys(titles)))
+        dataList = [{
+            'action': 'query',
+            'format': 'json',
+            'prop': 'info',
+            'inprop': 'protection',
+            'redirects': '',
+            'titles': '|'.join(batch)
+        } for batch in batches]
+
+        targets = {}
+        reasons = {}
+        try:
+            responses = self.postMany(dataList)
+        except Cancelled:
+            raise
+        except Exception as e:
+            # the list is kept unchecked, so the pages can still be loaded
+            self.statusMessage.emit('Validation failed: %s' % type(e).__name__)
+            responses = [None] * len(batches)
+        handle.check()
+
+        for batch, res in zip(batches, responses):
+            if res is None:
+                targets.update((title, title) for title in batch)
+            else:
+                self.readValidationBatch(batch, res.json(), targets, reasons)
+
+        self.titlesValidated.emit(handle.id, targets, reasons)
+
+    def readValidationBatch(self, titles, res, targets, reasons):
+        """ Read the response to the validation of a batch of titles.
+
+        Parameters
+        ----------
+        self : QWidget
+        titles : list of str
+            Titles of the batch.
+        res : dict
+            Parsed response.
+        targets : dict
+            Dictionary receiving the final title of each valid title.
+        reasons : dict
+            Dictionary receiving the reason of each title changed, either
+            normalized or redirect, or dropped, either invalid, interwiki,
+            missing or protected.
+        """
+
+        if 'error' in res:
+            # the titles of the batch are kept unchecked
+            self.statusMessage.emit(res['error']['code'])
+            targets.update((title, title) for title in titles)
+            return
+
+        query = res.get('query', {})
+        normalized = {item['from']: item['to']
+                for item in query.get('normalized', [])}
+        redirects = {item['from']: item['to']
+                for item in query.get('redirects', [])}
+        interwiki = {item['title'] for item in query.get('interwiki', [])}
+        pages = {page['title']: page
+                for page in query.get('pages', {}).values()}
+
+        for title in titles:
+            name = normalized.get(title, title)
+            if name in interwiki:
+                reasons[title] = 'interwiki'
+                continue
+            target = redirects.get(name, name)
+            page = pages.get(target)
+            if page is None or 'invalid' in page:
+                reasons[title] = 'invalid'
+            elif 'missing' in page:
+                reasons[title] = 'missing'
+            elif not self.planner.canEdit(page.get('protection', [])):
+                reasons[title] = 'protected'
+            else:
+                targets[title] = target
+                if target != name:
+                    reasons[title] = 'redirect'
+                elif name != title:
+                    reasons[title] = 'normalized'
+
+    def filterTitles(self, titles, text):
+        """ Keep the titles of a list whose pages match a search, emitting
+        the result through the titlesFiltered signal, so the pages not
+        matching are never downloaded.
+
+        Parameters
+        ----------
+        self : QWidget
+        titles : list of str
+            Titles to be filtered.
+        text : str
+            Text of the search, as returned by searchText.
+        """
+
+        if not self.isConnected:
+            return
+
+        return self.submit(self.filterTitlesFunction, list(titles), text,
+                priority=BULK)
+
+    def filterTitlesFunction(self, handle, titles, text):
+        """ Implement the filtering of a list of titles, following the
+        results of the search until all the titles are found or the results
+        are exhausted.
+
+        The search engine stops returning results after a maximum offset,
+        10000 for CirrusSearch, so when the results are cut off, the titles
+        not found may still match, and the list is kept unfiltered. So it is
+        when the regex search times out, returning partial results.
+
+        Parameters
+        ----------
+        self : QWidget
+        handle : RequestHandle
+            Handle of the request.
+        titles : list of str
+            Titles to be filtered.
+        text : str
+            Text of the search.
+        """
+
+        data = {
+            'action': 'query',
+            'format': 'json',
+            'assert': 'user',
+        }
+        data.update(self.listParams('search', text))
+        # the total number of results tells if they were cut off
+        data['srinfo'] = 'totalhits'
+
+        wanted = set(titles)
+        matches = set()
+        received = 0
+        total = 0
+        for res in self.iterateQuery(data):
             if 'error' in res:
-                #TODO
-                print(res['error'])
-                self.voicesReceived.emit(links)
-                return
+                # the list is kept unfiltered
+                self.statusMessage.emit(
+                        'Search failed: %s' % res['error']['code'])
+                matches = wanted
+                break
+            if searchTimedOut(res):
+                self.statusMessage.emit('The regex search timed out, the '
+                        'list is kept unfiltered')
+                matches = wanted
+                break
+            query = res.get('query', {})
+            total = max(total, query.get('searchinfo', {}).get('totalhits', 0))
+            results = query.get('search', [])
+            received += len(results)
+            matches.update(voice['title'] for voice in results
+                    if voice['title'] in wanted)
+            if len(matches) == len(wanted):
+                break
+        else:
+            if received < total:
+                self.statusMessage.emit('Too many search results (%d), the '
+                        'list is kept unfiltered' % total)
+                matches = wanted
+        handle.check()
+
+        self.titlesFiltered.emit(
+                handle.id, [title for title in titles if title in matches])
+
+    def iterateQuery(self, data):
+        """ Generator yielding the parsed responses to a query, following its
+        continuation. The iteration stops after a response containing an
+        error.
+
+        Requests failing with a transient error, or because of the network,
+        are repeated with an exponential backoff. When the attempts are
+        exhausted, the error is yielded.
+
+        See https://www.mediawiki.org/wiki/API:Continue
+
+        Parameters
+        ----------
+        self : QWidget
+        data : dict
+            Parameters for the query.
+        """
+
+        data = dict(data)
+        data.setdefault('continue', '')
+        retries = self.settings.value('query/retries', 5, type=int)
+        backoff = self.settings.value('query/backoff', 2.0, type=float)
 
-            # get links
-            for voice in res['query'][query]:
-                links.append(voice['title'])
+        while True:
+            for attempt in range(retries + 1):
+                try:
+                    res = self.post(data).json()
+                except Cancelled:
+                    raise
+                except Exception as e:
+                    # network failure
+                    res = {'error': {'code': type(e).__name__, 'info': str(e)}}
+                    transient = True
+                else:
+                    transient = 'error' in res and \
+                            res['error']['code'] in TRANSIENT_ERRORS
+                if not transient or attempt == retries:
+                    break
+                self.statusMessage.emit('%s, retrying in %.0f s' % (
+                        res['error']['code'], backoff * 2 ** attempt))
+                self.sleep(backoff * 2 ** attempt)
+            yield res
 
             # manage continuation of the query
-            if 'continue' in res:
-                continueToken = res['continue']
-            else:
+            if 'error' in res or 'continue' not in res:
                 break
+            data.update(res['continue'])
+
+
+def coalescingKey(address, data):
+    """ Return the key identifying a request which can share its response
+    with the identical ones, or None for the requests which must always be
+    sent.
+
+    Only queries can be shared, except the ones for tokens, which must be
+    fresh after a token error.
+
+    Parameters
+    ----------
+    address : str
+        Address for the request.
+    data : dict
+        Parameters of the request.
+    """
+    if data.get('action') != 'query' or 'tokens' in data.get('meta', ''):
+        return None
+    return (address, tuple(sorted((k, str(v)) for k, v in data.items())))
+
+def memoWeight(value):
+    """ Return the approximate size in bytes of a result shared by the
+    coalescer, either a response or the content and the metadata of a page.
+
+    Parameters
+    ----------
+    value : object
+        Shared result.
+    """
+    if value is None:
+        return 0
+    if isinstance(value, tuple):
+        return len(value[0])
+    return len(value.content)
+
+def requestKind(data):
+    """ Return the class of a request for the scheduler, 'edit' or 'read'.
+
+    Parameters
+    ----------
+    data : dict
+        Parameters of the request.
+    """
+    return 'edit' if data.get('action') == 'edit' else 'read'
+
+def searchTimedOut(res):
+    """ Return True if a response reports that the regex search timed out,
+    so its results are partial.
+
+    See https://www.mediawiki.org/wiki/Help:CirrusSearch#Regular_expressions
 
-        self.voicesReceived.emit(links)
+    Parameters
+    ----------
+    res : dict
+        Parsed response to a search.
+    """
+    # the warning is a message or a code, depending on the error format
+    warnings = json.dumps(res.get('warnings', {}).get('search', ''))
+    return 'cirrussearch-regex-timed-out' in warnings or \
+            'regex search timed out' in warnings
+
+def revisionMeta(page, revision, res):
+    """ Return the metadata of a revision object returned by the API.
+
+    Parameters
+    ----------
+    page : dict
+        Page object, as contained in a prop=revisions response.
+    revision : dict
+        Revision object of the page.
+    res : dict
+        Whole response containing the page.
+    """
+    return {
+        'title': page['title'],
+        'pageid': page['pageid'],
+        'revid': revision['revid'],
+        'parentid': revision.get('parentid', 0),
+        'timestamp': revision['timestamp'],
+        'size': revision.get('size', 0),
+        'starttimestamp': res.get('curtimestamp', '')
+    }
+
+def revisionContent(revision):
+    """ Return the wikitext of a revision object returned by the API, both for
+    requests with and without the rvslots parameter.
+
+    Parameters
+    ----------
+    revision : dict
+        Revision object, as contained in a prop=revisions response.
+    """
+    if 'slots' in revision:
+        return revision['slots']['main'].get('*', '')
+    return revision.get('*', '')
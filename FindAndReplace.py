@@ -91,7 +91,9 @@ class FindAndReplace(QDockWidget):
         self.replacement.returnPressed.connect(self.replace)
         QShortcut(QKeySequence('Ctrl+R'), self, self.selectReplace)
 
-        QShortcut(QKeySequence('Esc'), self, self.pageContent.setFocus)
+        # the editor can be replaced after the creation
+        QShortcut(QKeySequence('Esc'), self,
+                lambda: self.pageContent.setFocus())
 
         findToolbar = QToolBar('Find')
         findToolbar.addActions([
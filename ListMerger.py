@@ -0,0 +1,174 @@
+# This file is part of wikied.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (C) 2016 Martino Pilia <martino.pilia@gmail.com>
+
+import threading
+
+class ListMerger:
+    """ Combine the titles produced by a set of list queries running
+    concurrently, streaming the deduplicated result.
+
+    The supported operations are the union of all the sources, their
+    intersection, and the difference between the first source and all the
+    others. Titles are sent as soon as their membership in the result is
+    certain: for the union when first received, for the intersection when
+    received by all the sources, and for the difference once the sources
+    to be subtracted are complete. When a source fails, the combination is
+    aborted, since the membership of the titles not sent yet is unknown.
+    """
+
+    # available operations
+    operations = ('union', 'intersection', 'difference')
+
+    def __init__(self, operation, sources, send, finish):
+        """ Object initialization.
+
+        Parameters
+        ----------
+        operation : str
+            Operation to be applied, one of union, intersection and
+            difference.
+        sources : int
+            Number of sources.
+        send : callable
+            Function called with each list of new titles of the result.
+        finish : callable
+            Function called with the number of titles of the result, when
+            all the sources are complete.
+        """
+        if operation not in self.operations:
+            raise ValueError('Unknown operation: %s' % operation)
+
+        self.operation = operation
+        self.sources = sources
+        self.send = send
+        self.finish = finish
+
+        self.lock = threading.Lock()
+        # titles already sent
+        self.sent = set()
+        # sources received for each title, for the intersection
+        self.seen = {}
+        # titles of the first source, waiting for the other sources to
+        # complete, for the difference
+        self.buffer = []
+        # titles of the sources to be subtracted, for the difference
+        self.excluded = set()
+        # sources completed
+        self.completed = set()
+        # True once a source failed
+        self.failed = False
+
+    def add(self, source, titles):
+        """ Add a batch of titles received by a source.
+
+        Parameters
+        ----------
+        source : int
+            Index of the source.
+        titles : list of str
+            Titles received.
+        """
+        with self.lock:
+            if self.failed:
+                return
+            if self.operation == 'union':
+                new = self.collect(titles)
+            elif self.operation == 'intersection':
+                ready = []
+                for title in titles:
+                    sources = self.seen.setdefault(title, set())
+                    sources.add(source)
+                    if len(sources) == self.sources:
+                        ready.append(title)
+                new = self.collect(ready)
+            elif source != 0:
+                self.excluded.update(titles)
+                new = []
+            elif self.subtrahendsComplete():
+                new = self.collect(t for t in titles if t not in self.excluded)
+            else:
+                self.buffer.extend(titles)
+                new = []
+
+            if len(new) > 0:
+                self.send(new)
+
+    def complete(self, source):
+        """ Mark a source as complete.
+
+        Parameters
+        ----------
+        source : int
+            Index of the source.
+        """
+        with self.lock:
+            if self.failed:
+                return
+            self.completed.add(source)
+
+            if self.operation == 'difference' and source != 0 and \
+                    self.subtrahendsComplete():
+                # the titles of the first source received so far can be sent
+                new = self.collect(
+                        t for t in self.buffer if t not in self.excluded)
+                self.buffer = []
+                if len(new) > 0:
+                    self.send(new)
+
+            if len(self.completed) == self.sources:
+                self.seen = {}
+                self.excluded = set()
+                self.finish(len(self.sent))
+
+    def fail(self, source):
+        """ Abort the combination after a source failed. No more titles are
+        sent, and the finish function is called with the number of titles
+        sent so far.
+
+        Parameters
+        ----------
+        source : int
+            Index of the source.
+        """
+        with self.lock:
+            if self.failed or len(self.completed) == self.sources:
+                return
+            self.failed = True
+            self.buffer = []
+            self.seen = {}
+            self.excluded = set()
+            self.finish(len(self.sent))
+
+    def subtrahendsComplete(self):
+        """ Return True if all the sources to be subtracted are complete.
+        """
+        return all(i in self.completed for i in range(1, self.sources))
+
+    def collect(self, titles):
+        """ Return the titles not sent yet, marking them as sent.
+
+        Parameters
+        ----------
+        titles : iterable of str
+            Candidate titles.
+        """
+        new = []
+        for title in titles:
+            if title not in self.sent:
+                self.sent.add(title)
+                new.append(title)
+        return new
@@ -0,0 +1,302 @@
+# This file is part of wikied.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (C) 2016 Martino Pilia <martino.pilia@gmail.com>
+
+import re
+import unicodedata
+
+# characters wider than the Python classes \d, \w and \s, which match some
+# non-ASCII characters too
+CLASSES = {
+    'd': '0-9\x80-\U0010ffff',
+    'w': '0-9A-Za-z_\x80-\U0010ffff',
+    's': '\t\n\x0b\x0c\r\x1c-\x1f \x80-\U0010ffff',
+}
+
+# escapes of single characters
+CHARACTERS = {
+    'a': '\a',
+    'f': '\f',
+    'n': '\n',
+    'r': '\r',
+    't': '\t',
+    'v': '\v',
+}
+
+# quantifier in braces, as accepted by Python
+QUANTIFIER = re.compile(r'\{(\d*)(,?)(\d*)\}')
+
+def translate(pattern):
+    """ Translate a Python regular expression into the syntax of the Lucene
+    regular expressions, used by the insource: search of CirrusSearch,
+    returning the translated expression and True if the match must ignore
+    the case.
+
+    The translated expression matches at least the texts matched by the
+    original one, so the pages found by the search include all the pages
+    matching locally. The constructs without an equivalent are widened:
+    anchors and lookarounds are dropped, backreferences match any text, and
+    the classes \\d, \\w and \\s match any non-ASCII character too.
+    ValueError is raised for an invalid expression, or for constructs which
+    cannot be widened, such as verbose expressions and conditionals.
+
+    See https://www.mediawiki.org/wiki/Help:CirrusSearch#Regular_expression_searches
+
+    Parameters
+    ----------
+    pattern : str
+        Python regular expression.
+    """
+    try:
+        re.compile(pattern)
+    except re.error as e:
+        raise ValueError('Invalid regex: %s' % e)
+
+    translator = Translator(pattern)
+    expression = translator.sequence()
+    if expression.strip('()') == '':
+        raise ValueError('The regex matches any text')
+    return expression, translator.caseless
+
+def literal(c):
+    """ Return a character escaped for a Lucene regular expression, where
+    any character can be preceded by a backslash.
+
+    Parameters
+    ----------
+    c : str
+        Character.
+    """
+    if c.isalnum() or ord(c) > 127:
+        return c
+    return '\\' + c
+
+class Translator:
+    """ Recursive translation of a Python regular expression, already known
+    to be valid.
+    """
+
+    def __init__(self, pattern):
+        """ Object initialization.
+
+        Parameters
+        ----------
+        pattern : str
+            Python regular expression.
+        """
+        self.pattern = pattern
+        self.i = 0
+        self.caseless = False
+
+    def sequence(self):
+        """ Translate the expression up to the end of the current group.
+        """
+        out = []
+        while self.i < len(self.pattern) and self.pattern[self.i] != ')':
+            c = self.pattern[self.i]
+            if c in '*+?':
+                self.i += 1
+                out.append(c)
+                self.modifier()
+            elif c == '{':
+                out.append(self.braces())
+            elif c == '|':
+                # an empty alternative must be explicit
+                self.i += 1
+                if len(out) == 0 or out[-1] == '|':
+                    out.append('()')
+                out.append('|')
+            elif c in '^$':
+                # anchors are not supported, the empty string is wider
+                self.i += 1
+                out.append('()')
+            elif c == '.':
+                # the Lucene dot matches the newlines too, which is wider
+                self.i += 1
+                out.append('.')
+            elif c == '[':
+                out.append(self.characterClass())
+            elif c == '(':
+                out.append(self.group())
+            elif c == '\\':
+                out.append(self.escape())
+            else:
+                self.i += 1
+                out.append(literal(c))
+        if len(out) > 0 and out[-1] == '|':
+            out.append('()')
+        return ''.join(out)
+
+    def modifier(self):
+        """ Skip the lazy or possessive modifier of a quantifier, which does
+        not change the texts matched.
+        """
+        if self.i < len(self.pattern) and self.pattern[self.i] in '?+':
+            self.i += 1
+
+    def braces(self):
+        """ Translate a brace, either a quantifier or a literal brace.
+        """
+        match = QUANTIFIER.match(self.pattern, self.i)
+        if match is None or match.group(0) == '{,}' or \
+                (match.group(1) == '' and match.group(3) == ''):
+            self.i += 1
+            return literal('{')
+        self.i = match.end()
+        self.modifier()
+        low, comma, high = match.groups()
+        return '{%s%s%s}' % (low or '0', comma, high)
+
+    def escape(self):
+        """ Translate an escape outside of a character class.
+        """
+        c = self.pattern[self.i + 1]
+        if c.lower() in CLASSES:
+            self.i += 2
+            if c.islower():
+                return '[%s]' % CLASSES[c]
+            # the complement of a widened class would be narrower
+            return '.'
+        if c in 'bBAZ':
+            self.i += 2
+            return '()'
+        if c.isdigit() and c != '0':
+            # backreference
+            self.i += 2
+            while self.i < len(self.pattern) and \
+                    self.pattern[self.i].isdigit():
+                self.i += 1
+            return '(.*)'
+        return literal(self.character())
+
+    def character(self):
+        """ Return the character of an escape standing for a single
+        character, advancing past it.
+        """
+        c = self.pattern[self.i + 1]
+        self.i += 2
+        if c in CHARACTERS:
+            return CHARACTERS[c]
+        for prefix, length in (('x', 2), ('u', 4), ('U', 8)):
+            if c == prefix:
+                code = self.pattern[self.i : self.i + length]
+                self.i += length
+                return chr(int(code, 16))
+        if c == '0':
+            digits = re.match(r'[0-7]{0,2}', self.pattern[self.i:]).group(0)
+            self.i += len(digits)
+            return chr(int('0' + digits, 8))
+        if c == 'N':
+            end = self.pattern.index('}', self.i)
+            name = self.pattern[self.i + 1 : end]
+            self.i = end + 1
+            return unicodedata.lookup(name)
+        return c
+
+    def characterClass(self):
+        """ Translate a character class.
+        """
+        self.i += 1
+        negated = self.pattern.startswith('^', self.i)
+        if negated:
+            self.i += 1
+        items = []
+        wide = False
+        first = True
+        while first or self.pattern[self.i] != ']':
+            first = False
+            c = self.pattern[self.i]
+            escaped = c == '\\'
+            if escaped:
+                e = self.pattern[self.i + 1]
+                if e.lower() in CLASSES:
+                    self.i += 2
+                    if e.isupper():
+                        wide = True
+                    else:
+                        items.append(CLASSES[e])
+                    continue
+                if e == 'b':
+                    self.i += 2
+                    items.append('\\\b')
+                    continue
+                c = self.character()
+            else:
+                self.i += 1
+            if c == '-' and not escaped and len(items) > 0 and \
+                    self.pattern[self.i] != ']':
+                items.append('-')
+            else:
+                items.append(literal(c))
+        self.i += 1
+
+        if negated and any(CLASSES[k] in items for k in CLASSES):
+            # the complement of a widened class would be narrower
+            wide = True
+        if wide:
+            return '.'
+        return '[%s%s]' % ('^' if negated else '', ''.join(items))
+
+    def group(self):
+        """ Translate a group, including the lookarounds and the inline
+        flags.
+        """
+        rest = self.pattern[self.i:]
+        if not rest.startswith('(?'):
+            self.i += 1
+            return '(' + self.close()
+
+        if rest.startswith('(?#'):
+            self.i = self.pattern.index(')', self.i) + 1
+            return ''
+        if rest.startswith(('(?=', '(?!', '(?<=', '(?<!')):
+            # lookarounds are dropped, which is wider
+            self.i += 4 if rest.startswith('(?<') else 3
+            self.close()
+            return '()'
+        if rest.startswith('(?P='):
+            # named backreference
+            self.i = self.pattern.index(')', self.i) + 1
+            return '(.*)'
+        if rest.startswith('(?P<'):
+            self.i = self.pattern.index('>', self.i) + 1
+            return '(' + self.close()
+        if rest.startswith(('(?:', '(?>')):
+            self.i += 3
+            return '(' + self.close()
+        if rest.startswith('(?('):
+            raise ValueError('Conditional groups are not supported')
+
+        # inline flags, global or scoped
+        match = re.match(r'\(\?([aiLmsux]*)(?:-([imsx]*))?([:)])', rest)
+        flags = match.group(1)
+        if 'x' in flags:
+            raise ValueError('Verbose regexes are not supported')
+        if 'i' in flags:
+            # the whole search ignores the case, which is wider
+            self.caseless = True
+        self.i += match.end()
+        if match.group(3) == ')':
+            return ''
+        return '(' + self.close()
+
+    def close(self):
+        """ Translate the content of a group up to its closing parenthesis,
+        included.
+        """
+        content = self.sequence()
+        self.i += 1
+        return content + ')'
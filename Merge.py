@@ -0,0 +1,95 @@
+# This file is part of wikied.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (C) 2016 Martino Pilia <martino.pilia@gmail.com>
+
+import difflib
+
+def merge3(base, mine, theirs):
+    """ Merge two texts derived from the same base text, returning the merged
+    text, or None if the changes overlap.
+
+    The merge works on lines. Changes of the two sides touching the same
+    lines, or adjacent lines, are considered overlapping unless they are
+    identical, as in diff3.
+
+    Parameters
+    ----------
+    base : str
+        Common ancestor of the two texts.
+    mine : str
+        Text containing the local changes.
+    theirs : str
+        Text containing the changes made by others.
+    """
+
+    if mine == theirs or theirs == base:
+        return mine
+    if mine == base:
+        return theirs
+
+    baseLines = base.splitlines(keepends=True)
+    changes = sorted(
+            [(i1, i2, lines, 0) for i1, i2, lines in hunks(baseLines, mine)] +
+            [(i1, i2, lines, 1) for i1, i2, lines in hunks(baseLines, theirs)],
+            key=lambda change: (change[0], change[1]))
+
+    merged = []
+    position = 0
+    i = 0
+    while i < len(changes):
+        # group the changes touching each other
+        group = [changes[i]]
+        end = changes[i][1]
+        i += 1
+        while i < len(changes) and changes[i][0] <= end:
+            group.append(changes[i])
+            end = max(end, changes[i][1])
+            i += 1
+
+        sides = {side for i1, i2, lines, side in group}
+        if len(sides) > 1:
+            # changes of both sides are accepted only when identical
+            ours = [change[:3] for change in group if change[3] == 0]
+            others = [change[:3] for change in group if change[3] == 1]
+            if ours != others:
+                return None
+            group = [change for change in group if change[3] == 0]
+
+        for i1, i2, lines, side in group:
+            merged.extend(baseLines[position:i1])
+            merged.extend(lines)
+            position = i2
+
+    merged.extend(baseLines[position:])
+    return ''.join(merged)
+
+def hunks(baseLines, text):
+    """ Return the changes turning a list of lines into a text, as a list of
+    tuples containing the start and the end of the replaced lines and the
+    list of the new lines.
+
+    Parameters
+    ----------
+    baseLines : list of str
+        Original lines, including the line terminators.
+    text : str
+        Changed text.
+    """
+    lines = text.splitlines(keepends=True)
+    matcher = difflib.SequenceMatcher(None, baseLines, lines, autojunk=False)
+    return [(i1, i2, lines[j1:j2])
+            for tag, i1, i2, j1, j2 in matcher.get_opcodes()
+            if tag != 'equal']
@@ -0,0 +1,247 @@
+# This file is part of wikied.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (C) 2016 Martino Pilia <martino.pilia@gmail.com>
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from PyQt5.QtCore import QStandardPaths
+
+class OfflineStore:
+    """ On-disk queue of the edits which could not be sent to the wiki, in
+    a SQLite database.
+
+    Each edit is kept with the metadata of its base revision, so it can be
+    saved with conflict detection once the connection is available again,
+    even after a restart of the program. The edits being saved are kept
+    as well until they are saved, so they are not lost by a crash. A page
+    has at most one staged edit, since each edit carries the whole content
+    of the page: staging a newer edit replaces the content and the summary,
+    keeping the base revision of the first one.
+
+    The edits are kept for each account, identified by user name and wiki,
+    so the sessions on the same wiki with different accounts save only
+    their own edits. The edits being saved are claimed, so each one is sent
+    by a single session.
+    """
+
+    def __init__(self, path=None):
+        """ Object initialization.
+
+        Parameters
+        ----------
+        path : str optional
+            Path of the database file. If absent, the file is placed in the
+            data directory of the user.
+        """
+
+        if path is None:
+            directory = QStandardPaths.writableLocation(
+                    QStandardPaths.AppDataLocation)
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, 'offline.sqlite')
+
+        self.lock = threading.Lock()
+        # edits being saved, as tuples of account, title and sequence number
+        self.claimed = set()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.db:
+            self.db.execute(
+                    'CREATE TABLE IF NOT EXISTS edits ('
+                    'account TEXT NOT NULL, '
+                    'title TEXT NOT NULL, '
+                    'seq INTEGER NOT NULL, '
+                    'content TEXT, '
+                    'summary TEXT, '
+                    'base TEXT, '
+                    'error TEXT, '
+                    'created REAL, '
+                    'PRIMARY KEY (account, title))')
+
+    def stage(self, account, title, content, summary, meta):
+        """ Store an edit, replacing the edit staged for the same page, if
+        any. Return the sequence number of the stored edit.
+
+        Parameters
+        ----------
+        account : str
+            Key identifying the account, as returned by
+            Connection.sessionKey.
+        title : str
+            Name of the page.
+        content : str
+            Content to be saved in the page.
+        summary : str
+            Summary for the edit.
+        meta : dict
+            Metadata of the base revision of the edit, or None if unknown.
+        """
+        with self.lock, self.db:
+            row = self.db.execute(
+                    'SELECT seq FROM edits WHERE account = ? AND title = ?',
+                    (account, title)).fetchone()
+            if row is None:
+                self.db.execute(
+                        'INSERT INTO edits (account, title, seq, content, '
+                        'summary, base, error, created) '
+                        'VALUES (?, ?, 0, ?, ?, ?, NULL, ?)',
+                        (account, title, content, summary, json.dumps(meta),
+                            time.time()))
+                return 0
+            self.db.execute(
+                    'UPDATE edits SET seq = ?, content = ?, summary = ?, '
+                    'error = NULL WHERE account = ? AND title = ?',
+                    (row[0] + 1, content, summary, account, title))
+            return row[0] + 1
+
+    def pending(self, account):
+        """ Return the edits of an account waiting to be saved, in the order
+        in which they were staged, as a list of tuples containing title,
+        sequence number, content, summary and metadata of the base revision.
+
+        Parameters
+        ----------
+        account : str
+            Key identifying the account, as returned by
+            Connection.sessionKey.
+        """
+        with self.lock:
+            rows = self.db.execute(
+                    'SELECT title, seq, content, summary, base FROM edits '
+                    'WHERE account = ? AND error IS NULL ORDER BY created',
+                    (account,)).fetchall()
+        return [(title, seq, content, summary, json.loads(base))
+                for title, seq, content, summary, base in rows]
+
+    def remove(self, account, title, seq):
+        """ Remove a saved edit. An edit staged again in the meanwhile, with a
+        different sequence number, is kept.
+
+        Parameters
+        ----------
+        account : str
+            Key identifying the account, as returned by
+            Connection.sessionKey.
+        title : str
+            Name of the page.
+        seq : int
+            Sequence number of the saved edit.
+        """
+        with self.lock, self.db:
+            self.db.execute(
+                    'DELETE FROM edits WHERE account = ? AND title = ? '
+                    'AND seq = ?',
+                    (account, title, seq))
+
+    def fail(self, account, title, seq, error):
+        """ Mark an edit as failed, so it is not sent again. The edit is kept,
+        to avoid losing its content.
+
+        Parameters
+        ----------
+        account : str
+            Key identifying the account, as returned by
+            Connection.sessionKey.
+        title : str
+            Name of the page.
+        seq : int
+            Sequence number of the failed edit.
+        error : str
+            Error code of the failure.
+        """
+        with self.lock, self.db:
+            self.db.execute(
+                    'UPDATE edits SET error = ? '
+                    'WHERE account = ? AND title = ? AND seq = ?',
+                    (error, account, title, seq))
+
+    def failed(self, account):
+        """ Return the edits of an account which failed permanently, in the
+        order in which they were staged, as a list of tuples containing
+        title, sequence number, content, summary, metadata of the base
+        revision and error code.
+
+        Parameters
+        ----------
+        account : str
+            Key identifying the account, as returned by
+            Connection.sessionKey.
+        """
+        with self.lock:
+            rows = self.db.execute(
+                    'SELECT title, seq, content, summary, base, error '
+                    'FROM edits WHERE account = ? AND error IS NOT NULL '
+                    'ORDER BY created',
+                    (account,)).fetchall()
+        return [(title, seq, content, summary, json.loads(base), error)
+                for title, seq, content, summary, base, error in rows]
+
+    def count(self, account):
+        """ Return the number of edits of an account waiting to be saved,
+        excluding the ones being saved.
+
+        Parameters
+        ----------
+        account : str
+            Key identifying the account, as returned by
+            Connection.sessionKey.
+        """
+        with self.lock:
+            rows = self.db.execute(
+                    'SELECT title, seq FROM edits '
+                    'WHERE account = ? AND error IS NULL',
+                    (account,)).fetchall()
+            return sum(1 for title, seq in rows
+                    if (account, title, seq) not in self.claimed)
+
+    def claim(self, account, title, seq):
+        """ Mark an edit as being saved, returning False if it was already
+        claimed by another session.
+
+        Parameters
+        ----------
+        account : str
+            Key identifying the account, as returned by
+            Connection.sessionKey.
+        title : str
+            Name of the page.
+        seq : int
+            Sequence number of the edit.
+        """
+        with self.lock:
+            if (account, title, seq) in self.claimed:
+                return False
+            self.claimed.add((account, title, seq))
+            return True
+
+    def release(self, account, title, seq):
+        """ Mark an edit as no longer being saved.
+
+        Parameters
+        ----------
+        account : str
+            Key identifying the account, as returned by
+            Connection.sessionKey.
+        title : str
+            Name of the page.
+        seq : int
+            Sequence number of the edit.
+        """
+        with self.lock:
+            self.claimed.discard((account, title, seq))
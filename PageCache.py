@@ -0,0 +1,161 @@
+# This file is part of wikied.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (C) 2016 Martino Pilia <martino.pilia@gmail.com>
+
+import os
+import sqlite3
+import threading
+import time
+
+from PyQt5.QtCore import QStandardPaths
+
+class PageCache:
+    """ On-disk cache of the content of the pages, stored in a SQLite
+    database.
+
+    Each page is stored together with the metadata of its revision, so the
+    cached content can be validated against the last revision of the page
+    on the wiki before using it. The time of the last validation is stored
+    too, so recently validated pages can be used directly.
+    """
+
+    def __init__(self, path=None):
+        """ Object initialization.
+
+        Parameters
+        ----------
+        path : str optional
+            Path of the database file. If absent, the file is placed in the
+            cache directory of the user.
+        """
+
+        if path is None:
+            directory = QStandardPaths.writableLocation(
+                    QStandardPaths.CacheLocation)
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, 'pages.sqlite')
+
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.db:
+            self.db.execute(
+                    'CREATE TABLE IF NOT EXISTS pages ('
+                    'site TEXT NOT NULL, '
+                    'title TEXT NOT NULL, '
+                    'pageid INTEGER, '
+                    'revid INTEGER, '
+                    'timestamp TEXT, '
+                    'size INTEGER, '
+                    'content TEXT, '
+                    'checked REAL DEFAULT 0, '
+                    'PRIMARY KEY (site, title))')
+            # add the validation time to databases created without it
+            columns = [row[1] for row in
+                    self.db.execute('PRAGMA table_info(pages)')]
+            if 'checked' not in columns:
+                self.db.execute(
+                        'ALTER TABLE pages ADD COLUMN checked REAL DEFAULT 0')
+
+    def get(self, site, titles):
+        """ Return a dictionary containing the content and the metadata of
+        the cached pages among the requested ones, indexed by title.
+
+        Parameters
+        ----------
+        site : str
+            Address of the wiki.
+        titles : list of str
+            Titles of the pages.
+        """
+        pages = {}
+        with self.lock:
+            for title in titles:
+                row = self.db.execute(
+                        'SELECT pageid, revid, timestamp, size, content, '
+                        'checked FROM pages WHERE site = ? AND title = ?',
+                        (site, title)).fetchone()
+                if row is None:
+                    continue
+                pages[title] = (row[4], {
+                    'title': title,
+                    'pageid': row[0],
+                    'revid': row[1],
+                    'timestamp': row[2],
+                    'size': row[3],
+                    'checked': row[5] or 0
+                })
+        return pages
+
+    def put(self, site, title, content, meta):
+        """ Store the content of a page, validated at the current time.
+
+        Parameters
+        ----------
+        site : str
+            Address of the wiki.
+        title : str
+            Title of the page.
+        content : str
+            Content of the page.
+        meta : dict
+            Metadata of the revision.
+        """
+        with self.lock, self.db:
+            self.db.execute(
+                    'INSERT OR REPLACE INTO pages '
+                    '(site, title, pageid, revid, timestamp, size, content, '
+                    'checked) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                    (site, title, meta['pageid'], meta['revid'],
+                        meta['timestamp'],
+                        meta.get('size', len(content.encode('utf-8'))),
+                        content, time.time()))
+
+    def touch(self, site, titles):
+        """ Mark a set of pages as validated at the current time.
+
+        Parameters
+        ----------
+        site : str
+            Address of the wiki.
+        titles : list of str
+            Titles of the pages.
+        """
+        now = time.time()
+        with self.lock, self.db:
+            self.db.executemany(
+                    'UPDATE pages SET checked = ? WHERE site = ? AND title = ?',
+                    [(now, site, title) for title in titles])
+
+    def remove(self, site, title):
+        """ Remove a page from the cache.
+
+        Parameters
+        ----------
+        site : str
+            Address of the wiki.
+        title : str
+            Title of the page.
+        """
+        with self.lock, self.db:
+            self.db.execute(
+                    'DELETE FROM pages WHERE site = ? AND title = ?',
+                    (site, title))
+
+    def clear(self):
+        """ Remove all the pages from the cache.
+        """
+        with self.lock, self.db:
+            self.db.execute('DELETE FROM pages')
@@ -0,0 +1,154 @@
+# This file is part of wikied.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (C) 2016 Martino Pilia <martino.pilia@gmail.com>
+
+# maximum number of items of a list query, and of titles of a query, for
+# normal users and for users with the apihighlimits right
+# See https://www.mediawiki.org/wiki/API:Query#Limits
+LIST_LIMITS = (500, 5000)
+TITLES_LIMITS = (50, 500)
+
+# maximum number of requests of an operation in flight at the same time,
+# for users without the apihighlimits right
+# See https://www.mediawiki.org/wiki/API:Etiquette
+NORMAL_CONCURRENCY = 2
+
+# rights required to edit the pages with the legacy protection levels
+# See https://www.mediawiki.org/wiki/Manual:$wgRestrictionLevels
+PROTECTION_RIGHTS = {
+    'autoconfirmed': 'editsemiprotected',
+    'sysop': 'editprotected',
+}
+
+class QueryPlanner:
+    """ Choose the limits, the batch sizes and the concurrency of the
+    requests, according to the information about the site and the user
+    retrieved at login.
+
+    Before the login, the limits for a normal user are used.
+    """
+
+    def __init__(self, connections=1):
+        """ Object initialization.
+
+        Parameters
+        ----------
+        connections : int optional
+            Maximum number of simultaneous connections of the transport.
+        """
+        self.connections = max(1, connections)
+        self.update({})
+
+    def update(self, info):
+        """ Store the information about the site and the user.
+
+        Parameters
+        ----------
+        info : dict
+            Content of the query element of a response to a query with
+            meta=siteinfo|userinfo, siprop=general|namespaces and
+            uiprop=rights|ratelimits.
+        """
+        userinfo = info.get('userinfo', {})
+        # rights of the user
+        self.rights = list(userinfo.get('rights', []))
+        # rate limits applying to the user, indexed by action and group
+        self.rateLimits = userinfo.get('ratelimits', {})
+        # general information about the site
+        self.general = info.get('general', {})
+        # names of the namespaces, indexed by number
+        self.namespaces = {
+            int(number): namespace.get('*', '')
+            for number, namespace in info.get('namespaces', {}).items()
+        }
+
+    def highLimits(self):
+        """ Return True if the user has the higher limits of the API.
+        """
+        return 'apihighlimits' in self.rights
+
+    def listLimit(self):
+        """ Return the number of items to be requested in each batch of a
+        list query, as a string for the limit parameter.
+        """
+        return str(LIST_LIMITS[self.highLimits()])
+
+    def titlesLimit(self):
+        """ Return the maximum number of titles allowed in a single query.
+        """
+        return TITLES_LIMITS[self.highLimits()]
+
+    def batches(self, titles):
+        """ Split a list of titles in batches of the maximum size allowed in
+        a single query.
+
+        Parameters
+        ----------
+        titles : list of str
+            Titles to be split.
+        """
+        size = self.titlesLimit()
+        return [titles[i : i + size] for i in range(0, len(titles), size)]
+
+    def concurrency(self):
+        """ Return the maximum number of requests of a single operation in
+        flight at the same time.
+
+        Users with high limits, such as bots, can use all the connections,
+        while the others keep the load on the site low.
+        """
+        if self.highLimits():
+            return self.connections
+        return min(self.connections, NORMAL_CONCURRENCY)
+
+    def rate(self, action):
+        """ Return the maximum number of requests per second allowed by the
+        rate limits of the user for an action, or None if the action is not
+        limited.
+
+        Parameters
+        ----------
+        action : str
+            Name of the action, such as edit.
+        """
+        if 'noratelimit' in self.rights:
+            return None
+        limits = self.rateLimits.get(action, {})
+        # the most permissive of the limits of the groups of the user applies
+        rates = [limit['hits'] / limit['seconds']
+                for limit in limits.values()
+                if limit.get('seconds', 0) > 0]
+        if len(rates) == 0:
+            return None
+        return max(rates)
+
+    def canEdit(self, protection):
+        """ Return True if the user has the rights to edit a page.
+
+        Parameters
+        ----------
+        protection : list of dict
+            Protections of the page, as returned by a query with
+            prop=info and inprop=protection.
+        """
+        for item in protection:
+            if item.get('type') != 'edit':
+                continue
+            level = item.get('level', '')
+            right = PROTECTION_RIGHTS.get(level, level)
+            if right != '' and right not in self.rights:
+                return False
+        return True
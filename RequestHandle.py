@@ -0,0 +1,113 @@
+# This file is part of wikied.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (C) 2016 Martino Pilia <martino.pilia@gmail.com>
+
+import itertools
+import threading
+
+class Cancelled(Exception):
+    """ Exception raised in a worker when the request it is executing has
+    been cancelled.
+    """
+    pass
+
+class RequestHandle:
+    """ Handle of a request made through the Connection.
+
+    Each request has a unique id, carried by the signals emitting its
+    results, so a receiver can recognize the results of requests it is not
+    waiting for anymore. Cancelling a request prevents it from starting,
+    stops it before its next HTTP request, and aborts the HTTP requests in
+    flight when the transport allows it.
+    """
+
+    # source of the request ids
+    ids = itertools.count(1)
+
+    def __init__(self):
+        """ Object initialization.
+        """
+        self.id = next(RequestHandle.ids)
+        self.lock = threading.Lock()
+        self.cancelled = False
+        # set on cancellation, to wake up the sleeping workers
+        self.event = threading.Event()
+        # functions to be called on cancellation
+        self.callbacks = []
+
+    def cancel(self):
+        """ Cancel the request.
+        """
+        with self.lock:
+            if self.cancelled:
+                return
+            self.cancelled = True
+            callbacks = self.callbacks
+            self.callbacks = []
+        self.event.set()
+        for callback in callbacks:
+            callback()
+
+    def isCancelled(self):
+        """ Return True if the request has been cancelled.
+        """
+        return self.cancelled
+
+    def check(self):
+        """ Raise Cancelled if the request has been cancelled.
+        """
+        if self.cancelled:
+            raise Cancelled()
+
+    def sleep(self, seconds):
+        """ Wait for some time, raising Cancelled as soon as the request is
+        cancelled.
+
+        Parameters
+        ----------
+        seconds : float
+            Waiting time.
+        """
+        if self.event.wait(seconds):
+            raise Cancelled()
+
+    def addCallback(self, callback):
+        """ Register a function to be called when the request is cancelled.
+        If the request is already cancelled, the function is called
+        immediately.
+
+        Parameters
+        ----------
+        callback : callable
+            Function without arguments.
+        """
+        with self.lock:
+            if not self.cancelled:
+                self.callbacks.append(callback)
+                return
+        callback()
+
+    def removeCallback(self, callback):
+        """ Unregister a function registered with addCallback.
+
+        Parameters
+        ----------
+        callback : callable
+            Function to be removed.
+        """
+        with self.lock:
+            if callback in self.callbacks:
+                self.callbacks.remove(callback)
@@ -0,0 +1,482 @@
+# This file is part of wikied.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (C) 2016 Martino Pilia <martino.pilia@gmail.com>
+
+import collections
+import threading
+
+from PyQt5.QtCore import QObject, pyqtSignal
+
+from WorkerPool import INTERACTIVE, BULK
+
+# error codes for which an edit is worth retrying
+TRANSIENT_ERRORS = {
+    'maxlag',
+    'ratelimited',
+    'readonly',
+    'notoken',
+    'internal_api_error_DBQueryError',
+    'internal_api_error_DBConnectionError',
+}
+
+class SaveQueue(QObject):
+    """ Queue committing the edits to the wiki in background.
+
+    The edits to the same page are saved in the order in which they were
+    queued, while the edits to different pages are saved in parallel by the
+    workers of the connection. Transient failures are retried with an
+    exponential backoff.
+
+    Each edit is written to an on-disk queue together with its base
+    revision when it is queued, and removed once saved, so the edits not
+    saved survive a crash. The edits made while the connection is not
+    available, or failing for network problems after all the retries, are
+    kept there and saved when the connection is opened again. So are the
+    edits still waiting when the queue is shut down.
+
+    The edits rejected by the wiki are kept too, since the editor may
+    already show another page, until they are recovered by the user.
+    Without an offline queue, they are kept in memory.
+    """
+
+    # signal emitted when the status of a queued edit changes, carrying the
+    # title of the page and the new status
+    statusChanged = pyqtSignal('QString', 'QString', name='statusChanged')
+
+    # signal emitted to change the temporary status message in a status bar
+    statusMessage = pyqtSignal('QString', name='statusMessage')
+
+    # signal emitted when the number of edits not yet saved changes
+    pendingChanged = pyqtSignal(int, name='pendingChanged')
+
+    # signal emitted when the number of edits staged offline changes
+    offlineChanged = pyqtSignal(int, name='offlineChanged')
+
+    # signal emitted when the number of edits rejected by the wiki and not
+    # yet recovered changes
+    failedChanged = pyqtSignal(int, name='failedChanged')
+
+    def __init__(self, connection):
+        """ Object initialization.
+
+        Parameters
+        ----------
+        self : QObject
+        connection : Connection
+            Object managing the connection to the wiki.
+        """
+        super().__init__()
+
+        self.connection = connection
+        self.maxRetries = connection.settings.value(
+                'save/retries', 5, type=int)
+        self.backoff = connection.settings.value(
+                'save/backoff', 2.0, type=float)
+
+        self.lock = threading.Lock()
+        # edits waiting to be saved, for each page
+        self.pending = collections.defaultdict(collections.deque)
+        # pages with an edit being saved
+        self.active = set()
+        # number of edits not yet saved
+        self.count = 0
+        # timers of the edits waiting to be retried, and the arguments of
+        # their retry, indexed by page
+        self.timers = {}
+        # True once the queue is shut down
+        self.closed = False
+        # True when edits were staged offline while connected, after a
+        # network failure, so they are saved after the next successful edit
+        self.stranded = False
+        # on-disk queue of the edits made while offline, shared by the
+        # sessions
+        self.offline = connection.registry.offline
+        # edits rejected by the wiki, as tuples of content, summary,
+        # metadata of the base revision and error code, indexed by page,
+        # used when there is no offline queue
+        self.failed = collections.OrderedDict()
+
+    def enqueue(self, page, content, summary='', meta=None, seq=None):
+        """ Queue an edit. The edit is also written to the offline queue, so
+        it survives a crash, and removed from it once saved. Return False if
+        the edit is refused, since the connection is not available and there
+        is no offline queue to keep it.
+
+        Parameters
+        ----------
+        self : QObject
+        page : str
+            Name of the page.
+        content : str
+            Content to be saved in the page.
+        summary : str optional
+            Summary for the edit.
+        meta : dict optional
+            Metadata of the base revision of the edit. If absent, the
+            revision loaded last is used. Once the edit is saved, it is
+            updated as described in Connection.editFunction.
+        seq : int optional
+            Sequence number of the edit in the offline queue, if it was
+            staged by a previous connection.
+        """
+
+        if not self.connection.isConnected or self.closed:
+            if self.offline is None:
+                self.statusMessage.emit(
+                        '%s: not connected, the edit was not saved' % page)
+                return False
+            self.stage(page, content, summary, meta)
+            return True
+
+        staged = seq is not None
+        if not staged and self.offline is not None:
+            account = self.connection.sessionKey()
+            seq = self.offline.stage(account, page, content, summary,
+                    self.baseMeta(page, meta))
+            self.offline.claim(account, page, seq)
+
+        with self.lock:
+            self.pending[page].append((content, summary, meta, seq, staged))
+            self.count += 1
+            count = self.count
+            start = page not in self.active
+            if start:
+                self.active.add(page)
+
+        self.pendingChanged.emit(count)
+        self.setStatus(page, 'queued')
+        if start:
+            self.dispatch(page)
+        return True
+
+    def dispatch(self, page):
+        """ Start saving the next edit of a page.
+
+        Parameters
+        ----------
+        self : QObject
+        page : str
+            Name of the page.
+        """
+        with self.lock:
+            if len(self.pending[page]) < 1:
+                del self.pending[page]
+                self.active.discard(page)
+                return
+            content, summary, meta, seq, staged = \
+                    self.pending[page].popleft()
+
+        # the edits staged offline leave the workers to the interactive use
+        self.connection.pool.submit(
+                self.saveFunction, page, content, summary, 0, meta, seq,
+                staged, priority=BULK if staged else INTERACTIVE)
+
+    def saveFunction(self, page, content, summary, attempt, meta=None,
+            seq=None, staged=False):
+        """ Save an edit, scheduling a retry on transient failures.
+
+        Parameters
+        ----------
+        self : QObject
+        page : str
+            Name of the page.
+        content : str
+            Content to be saved in the page.
+        summary : str
+            Summary for the edit.
+        attempt : int
+            Number of previous attempts for the edit.
+        meta : dict optional
+            Metadata of the base revision of the edit.
+        seq : int optional
+            Sequence number of the edit in the offline queue.
+        staged : bool optional
+            True if the edit was staged by a previous connection.
+        """
+
+        self.setStatus(page, 'saving')
+
+        try:
+            error = self.connection.editFunction(page, content, summary, meta)
+        except Exception as e:
+            # network failure
+            error = type(e).__name__
+            transient = True
+        else:
+            transient = error in TRANSIENT_ERRORS
+
+        if error is not None and transient and attempt < self.maxRetries:
+            delay = self.backoff * 2 ** attempt
+            args = (page, content, summary, attempt + 1, meta, seq, staged)
+            with self.lock:
+                if not self.closed:
+                    t = threading.Timer(delay, self.retry, args=[page])
+                    t.daemon = True
+                    self.timers[page] = (t, args)
+                    t.start()
+                    self.setStatus(page,
+                            'retrying in %.0f s (%s)' % (delay, error))
+                    return
+
+        account = self.connection.sessionKey()
+        flush = False
+        rejected = False
+        if error is None:
+            self.setStatus(page, 'saved')
+            if seq is not None:
+                self.offline.remove(account, page, seq)
+            with self.lock:
+                flush, self.stranded = self.stranded, False
+        elif transient and self.offline is not None:
+            # keep the edit for the next connection, or for the next
+            # successful edit if still connected
+            with self.lock:
+                self.stranded = True
+            self.setStatus(page, 'staged offline (%s)' % error)
+        elif seq is not None:
+            # the editor may already show another page, the edit is kept
+            # until the user recovers it
+            self.offline.fail(account, page, seq, error)
+            self.setStatus(page, 'failed (%s), kept offline' % error)
+            rejected = True
+        else:
+            with self.lock:
+                self.failed[page] = \
+                        (content, summary, self.baseMeta(page, meta), error)
+                self.failed.move_to_end(page)
+            self.setStatus(page, 'failed (%s), kept until closing' % error)
+            rejected = True
+        if seq is not None:
+            self.offline.release(account, page, seq)
+            self.offlineChanged.emit(self.offlineCount())
+        if rejected:
+            self.failedChanged.emit(self.failedCount())
+
+        with self.lock:
+            self.count -= 1
+            count = self.count
+        self.pendingChanged.emit(count)
+
+        # save the following edit of the same page
+        self.dispatch(page)
+
+        # the server is reachable again
+        if flush:
+            self.flush()
+
+    def retry(self, page):
+        """ Submit again an edit whose retry delay is elapsed.
+
+        Parameters
+        ----------
+        self : QObject
+        page : str
+            Name of the page.
+        """
+        with self.lock:
+            if page not in self.timers:
+                # the queue was shut down
+                return
+            t, args = self.timers.pop(page)
+        staged = args[-1]
+        self.connection.pool.submit(self.saveFunction, *args,
+                priority=BULK if staged else INTERACTIVE)
+
+    def shutdown(self):
+        """ Stop saving the edits. The edits queued and the ones waiting to
+        be retried are left in the offline queue, so they are saved by the
+        next run, while the edits being saved are completed. Return the
+        number of edits which are lost, since there is no offline queue.
+        """
+        with self.lock:
+            self.closed = True
+            waiting = []
+            for page, (t, args) in self.timers.items():
+                t.cancel()
+                waiting.append((page, args[5]))
+            self.timers = {}
+            for page, edits in self.pending.items():
+                waiting.extend((page, edit[3]) for edit in edits)
+                edits.clear()
+            self.count -= len(waiting)
+            count = self.count
+
+        if len(waiting) == 0:
+            return 0
+
+        account = self.connection.sessionKey()
+        lost = 0
+        for page, seq in waiting:
+            if seq is None:
+                lost += 1
+                continue
+            self.offline.release(account, page, seq)
+            self.setStatus(page, 'staged offline')
+        self.pendingChanged.emit(count)
+        self.offlineChanged.emit(self.offlineCount())
+        return lost
+
+    def stage(self, page, content, summary, meta=None):
+        """ Store an edit in the offline queue.
+
+        Parameters
+        ----------
+        self : QObject
+        page : str
+            Name of the page.
+        content : str
+            Content to be saved in the page.
+        summary : str
+            Summary for the edit.
+        meta : dict optional
+            Metadata of the base revision of the edit. If absent, the
+            revision loaded last is used.
+        """
+        self.offline.stage(self.connection.sessionKey(), page, content,
+                summary, self.baseMeta(page, meta))
+        self.setStatus(page, 'staged offline')
+        self.offlineChanged.emit(self.offlineCount())
+
+    def baseMeta(self, page, meta=None):
+        """ Return a copy of the metadata of the base revision of an edit,
+        or None if the page was never loaded.
+
+        Parameters
+        ----------
+        self : QObject
+        page : str
+            Name of the page.
+        meta : dict optional
+            Metadata given with the edit. If absent, the revision loaded
+            last is used.
+        """
+        if meta is None:
+            meta = self.connection.pageInfo.get(page)
+        return None if meta is None else dict(meta)
+
+    def flush(self):
+        """ Save the edits staged offline. Must be called by a worker,
+        after the connection is opened.
+
+        The edits are queued in background with their own base revision,
+        so the edits to pages changed in the meanwhile are merged with the
+        last revision when possible, and kept otherwise. The last revisions
+        of the pages never loaded, used as base of their edits, are
+        requested with a single request for each batch of titles.
+        """
+
+        if self.offline is None:
+            return
+        account = self.connection.sessionKey()
+        staged = self.offline.pending(account)
+        if len(staged) < 1:
+            return
+
+        self.statusMessage.emit('Saving %d edits made offline' % len(staged))
+        unknown = [title for title, seq, content, summary, meta in staged
+                if meta is None]
+        current = self.connection.getPagesMeta(unknown) \
+                if len(unknown) > 0 else {}
+
+        for title, seq, content, summary, meta in staged:
+            # already queued by a previous connection, or by another
+            # session of the same account
+            if not self.offline.claim(account, title, seq):
+                continue
+            if meta is None:
+                meta = current.get(title)
+            self.enqueue(title, content, summary, meta, seq)
+
+        self.offlineChanged.emit(self.offlineCount())
+
+    def failedEdits(self):
+        """ Return the edits of the current account rejected by the wiki
+        and not yet recovered, as a list of tuples containing title,
+        content, summary, metadata of the base revision and error code.
+
+        Parameters
+        ----------
+        self : QObject
+        """
+        with self.lock:
+            edits = [(page,) + edit for page, edit in self.failed.items()]
+        if self.offline is not None:
+            edits.extend((title, content, summary, meta, error)
+                    for title, seq, content, summary, meta, error
+                    in self.offline.failed(self.connection.sessionKey()))
+        return edits
+
+    def recover(self, page):
+        """ Forget the rejected edit of a page, returning its content,
+        summary and metadata of the base revision, or None if the page has
+        no rejected edit.
+
+        Parameters
+        ----------
+        self : QObject
+        page : str
+            Name of the page.
+        """
+        with self.lock:
+            edit = self.failed.pop(page, None)
+        if edit is None and self.offline is not None:
+            account = self.connection.sessionKey()
+            for title, seq, content, summary, meta, error in \
+                    self.offline.failed(account):
+                if title == page:
+                    self.offline.remove(account, title, seq)
+                    edit = (content, summary, meta, error)
+                    break
+        if edit is None:
+            return None
+        self.failedChanged.emit(self.failedCount())
+        return edit[:3]
+
+    def failedCount(self):
+        """ Return the number of edits of the current account rejected by
+        the wiki and not yet recovered.
+
+        Parameters
+        ----------
+        self : QObject
+        """
+        return len(self.failedEdits())
+
+    def offlineCount(self):
+        """ Return the number of edits staged offline for the current
+        account and not yet saved.
+
+        Parameters
+        ----------
+        self : QObject
+        """
+        if self.offline is None:
+            return 0
+        return self.offline.count(self.connection.sessionKey())
+
+    def setStatus(self, page, status):
+        """ Report the status of an edit.
+
+        Parameters
+        ----------
+        self : QObject
+        page : str
+            Name of the page.
+        status : str
+            Status of the edit.
+        """
+        self.statusChanged.emit(page, status)
+        self.statusMessage.emit('%s: %s' % (page, status))
@@ -0,0 +1,218 @@
+# This file is part of wikied.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (C) 2016 Martino Pilia <martino.pilia@gmail.com>
+
+import threading
+import time
+
+class TokenBucket:
+    """ Token bucket limiting the rate of a class of requests.
+    """
+
+    def __init__(self, rate, burst):
+        """ Object initialization.
+
+        Parameters
+        ----------
+        rate : float
+            Number of tokens added each second.
+        burst : float
+            Maximum number of tokens stored in the bucket.
+        """
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.tokens = self.burst
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def refill(self):
+        """ Add the tokens accumulated since the last refill.
+        """
+        now = time.monotonic()
+        self.tokens = min(
+                self.burst,
+                self.tokens + (now - self.last) * self.rate)
+        self.last = now
+
+    def acquire(self):
+        """ Take a token from the bucket, waiting until one is available.
+        """
+        while True:
+            with self.lock:
+                self.refill()
+                if self.tokens >= 1.0:
+                    self.tokens -= 1.0
+                    return
+                wait = (1.0 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def setRate(self, rate):
+        """ Change the rate of the bucket.
+
+        Parameters
+        ----------
+        rate : float
+            Number of tokens added each second.
+        """
+        with self.lock:
+            self.refill()
+            self.rate = rate
+
+class Scheduler:
+    """ Scheduler regulating the rate of the requests to the wiki.
+
+    Reads and edits are limited by two token buckets. The rate of a class
+    is halved when the server answers with a maxlag or ratelimited error,
+    or asks to retry later, and it is increased again slowly, up to the
+    configured maximum, while the requests succeed. The requests sent
+    before a decrease of the rate belong to the same throttling event, so
+    their responses do not halve the rate again.
+
+    See https://www.mediawiki.org/wiki/Manual:Maxlag_parameter
+    """
+
+    def __init__(self, settings):
+        """ Object initialization.
+
+        Parameters
+        ----------
+        settings : QObject
+            Settings object for the program.
+        """
+
+        # maximum rate for each class of requests, in requests per second
+        self.maxRate = {
+            'read': settings.value('scheduler/readrate', 20.0, type=float),
+            'edit': settings.value('scheduler/editrate', 1.0, type=float)
+        }
+        # maximum rates set by the user
+        self.configuredRate = dict(self.maxRate)
+        self.minRate = 0.05
+        # value of the maxlag parameter passed with the requests
+        self.maxlag = settings.value('scheduler/maxlag', 5, type=int)
+        # number of times a throttled request is retried
+        self.maxRetries = settings.value('scheduler/retries', 5, type=int)
+
+        self.buckets = {
+            kind: TokenBucket(rate, rate) for kind, rate in self.maxRate.items()
+        }
+
+        self.lock = threading.Lock()
+        # no request is made before this time
+        self.pausedUntil = 0.0
+        # time of the last decrease of the rate of each class
+        self.decreased = {kind: float('-inf') for kind in self.maxRate}
+
+    def acquire(self, kind):
+        """ Wait until a request of the given class can be made.
+
+        Parameters
+        ----------
+        kind : str
+            Class of the request, 'read' or 'edit'.
+        """
+        with self.lock:
+            wait = self.pausedUntil - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        self.buckets[kind].acquire()
+
+    def feedback(self, kind, res, sent=None):
+        """ Adjust the rate according to the response to a request, and
+        return True if the request was throttled and should be retried.
+
+        Parameters
+        ----------
+        kind : str
+            Class of the request, 'read' or 'edit'.
+        res : requests.Response
+            Response to the request.
+        sent : float optional
+            Time when the request was sent, as given by time.monotonic. If
+            absent, the request is assumed to be sent after the last
+            decrease of the rate.
+        """
+
+        error = res.headers.get('MediaWiki-API-Error', '')
+        throttled = (error in ('maxlag', 'ratelimited')
+                or res.status_code in (429, 503))
+
+        bucket = self.buckets[kind]
+        if not throttled:
+            # additive increase
+            if bucket.rate < self.maxRate[kind]:
+                bucket.setRate(min(self.maxRate[kind], bucket.rate + 0.1))
+            return False
+
+        # multiplicative decrease, once for each throttling event
+        with self.lock:
+            decrease = sent is None or sent >= self.decreased[kind]
+            if decrease:
+                self.decreased[kind] = time.monotonic()
+        if decrease:
+            bucket.setRate(max(self.minRate, bucket.rate / 2))
+
+        try:
+            delay = float(res.headers.get('Retry-After', ''))
+        except ValueError:
+            delay = 1.0 / bucket.rate
+        with self.lock:
+            self.pausedUntil = max(
+                    self.pausedUntil,
+                    time.monotonic() + delay)
+
+        return True
+
+    def setMaxRate(self, kind, rate):
+        """ Change the maximum rate for a class of requests.
+
+        Parameters
+        ----------
+        kind : str
+            Class of the requests, 'read' or 'edit'.
+        rate : float
+            Maximum number of requests per second.
+        """
+        self.maxRate[kind] = rate
+        self.buckets[kind].setRate(rate)
+
+    def limitMaxRate(self, kind, rate):
+        """ Lower the maximum rate for a class of requests to the rate
+        allowed by the server, without exceeding the rate set by the user.
+
+        Parameters
+        ----------
+        kind : str
+            Class of the requests, 'read' or 'edit'.
+        rate : float
+            Maximum number of requests per second allowed by the server, or
+            None to restore the rate set by the user.
+        """
+        if rate is None:
+            self.setMaxRate(kind, self.configuredRate[kind])
+        else:
+            self.setMaxRate(kind, min(self.configuredRate[kind], rate))
+
+    def rate(self, kind):
+        """ Return the current effective rate for a class of requests, in
+        requests per second.
+
+        Parameters
+        ----------
+        kind : str
+            Class of the requests, 'read' or 'edit'.
+        """
+        return self.buckets[kind].rate
@@ -0,0 +1,184 @@
+# This file is part of wikied.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (C) 2016 Martino Pilia <martino.pilia@gmail.com>
+
+import collections
+import threading
+
+from PyQt5.QtCore import QObject, pyqtSignal
+
+from CheckpointStore import CheckpointStore
+from OfflineStore import OfflineStore
+from PageCache import PageCache
+from SessionStore import SessionStore
+from WorkerPool import WorkerPool
+
+# name of the session whose account is stored in the connection group of
+# the settings
+DEFAULT = 'default'
+
+class SessionRegistry(QObject):
+    """ Keep several sessions open at the same time, each one a Connection
+    to a wiki with an account.
+
+    The connections share the workers, the transport and the on-disk
+    stores, so the number of threads and of network connections stays
+    bounded however many sessions are open, while each connection keeps its
+    own cookies, edit token, limits and rate of requests.
+
+    The account of the default session is stored in the connection group
+    of the settings, the account of any other session in the
+    sessions/<name> group, with the same keys.
+    """
+
+    # signal emitted when a session is opened, carrying its name
+    sessionOpened = pyqtSignal('QString', name='sessionOpened')
+
+    # signal emitted when a session is closed, carrying its name
+    sessionClosed = pyqtSignal('QString', name='sessionClosed')
+
+    def __init__(self, settings):
+        """ Object initialization.
+
+        Parameters
+        ----------
+        settings : QSettings
+            Settings object for the program.
+        """
+        super().__init__()
+
+        self.settings = settings
+
+        workers = settings.value('connection/workers', 4, type=int)
+        # background tasks leave at least a worker for the interactive ones
+        self.pool = WorkerPool(workers, settings.value(
+                'connection/background', workers - 1, type=int))
+        # object performing the HTTP requests for the workers
+        if settings.value('connection/transport', 'threads') == 'asyncio':
+            from AsyncTransport import AsyncTransport
+            self.transport = AsyncTransport(
+                    settings.value('connection/connections', 8, type=int))
+        else:
+            self.transport = self.pool
+        # on-disk cache of the page content
+        if settings.value('cache/enabled', True, type=bool):
+            self.cache = PageCache(settings.value('cache/path'))
+        else:
+            self.cache = None
+        # on-disk progress of the list queries, to resume them
+        if settings.value('checkpoint/enabled', True, type=bool):
+            self.checkpoints = CheckpointStore(
+                    settings.value('checkpoint/path'))
+        else:
+            self.checkpoints = None
+        # login sessions kept between the runs of the program
+        if settings.value('session/persist', True, type=bool):
+            self.sessions = SessionStore(settings.value('session/path'))
+        else:
+            self.sessions = None
+        # edits made while offline
+        if settings.value('offline/enabled', True, type=bool):
+            self.offline = OfflineStore(settings.value('offline/path'))
+        else:
+            self.offline = None
+
+        # open connections, indexed by session name
+        self.connections = collections.OrderedDict()
+
+    def names(self):
+        """ Return the names of the configured sessions, the default one
+        first.
+        """
+        self.settings.beginGroup('sessions')
+        names = sorted(self.settings.childGroups())
+        self.settings.endGroup()
+        return [DEFAULT] + [name for name in names if name != DEFAULT]
+
+    def account(self, name):
+        """ Return the settings group containing the account of a session.
+
+        Parameters
+        ----------
+        name : str
+            Name of the session.
+        """
+        if name == DEFAULT:
+            return 'connection'
+        return 'sessions/' + name
+
+    def open(self, name):
+        """ Return the connection of a session, creating it if needed. The
+        connection is not logged in automatically.
+
+        Parameters
+        ----------
+        name : str
+            Name of the session.
+        """
+        if name in self.connections:
+            return self.connections[name]
+
+        # imported here, since a connection used alone creates its registry
+        from Connection import Connection
+        connection = Connection(self.settings, self, self.account(name))
+        self.connections[name] = connection
+        self.sessionOpened.emit(name)
+        return connection
+
+    def get(self, name):
+        """ Return the connection of an open session, or None.
+
+        Parameters
+        ----------
+        name : str
+            Name of the session.
+        """
+        return self.connections.get(name)
+
+    def close(self, name):
+        """ Close a session. Its edits not saved yet are staged offline,
+        and its login is kept for the next run when the sessions are
+        persistent, otherwise the account is logged out.
+
+        Parameters
+        ----------
+        name : str
+            Name of the session.
+        """
+        connection = self.connections.pop(name, None)
+        if connection is None:
+            return
+        connection.saveQueue.shutdown()
+        if self.sessions is not None:
+            connection.saveSession()
+        else:
+            connection.disconnect()
+        self.sessionClosed.emit(name)
+
+    def shutdown(self):
+        """ Close all the sessions, then stop the workers and the transport
+        once the pending requests are completed.
+        """
+        for name in list(self.connections):
+            self.close(name)
+
+        self.pool.shutdown()
+        if self.transport is not self.pool:
+            def closeTransport():
+                for t in self.pool.workers:
+                    t.join()
+                self.transport.shutdown()
+            threading.Thread(target=closeTransport).start()
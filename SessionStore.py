@@ -0,0 +1,130 @@
+# This file is part of wikied.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (C) 2016 Martino Pilia <martino.pilia@gmail.com>
+
+import json
+import os
+import threading
+import time
+
+from PyQt5.QtCore import QStandardPaths
+
+class SessionStore:
+    """ On-disk store of the login sessions, allowing to reuse a session
+    after a restart of the program instead of logging in again.
+
+    The state of each session, made of its cookies and its edit token, is
+    kept in a JSON file readable only by the user, since the cookies grant
+    access to the account.
+    """
+
+    def __init__(self, path=None):
+        """ Object initialization.
+
+        Parameters
+        ----------
+        path : str optional
+            Path of the file. If absent, the file is placed in the data
+            directory of the user.
+        """
+
+        if path is None:
+            directory = QStandardPaths.writableLocation(
+                    QStandardPaths.AppDataLocation)
+            path = os.path.join(directory, 'sessions.json')
+
+        self.path = path
+        self.lock = threading.Lock()
+
+    def load(self, key):
+        """ Return the state of a session, or None if the session is not
+        stored. The expired cookies are discarded.
+
+        Parameters
+        ----------
+        key : str
+            Key identifying the session.
+        """
+        with self.lock:
+            state = self.read().get(key)
+        if state is None:
+            return None
+        now = time.time()
+        state['cookies'] = [cookie for cookie in state.get('cookies', [])
+                if cookie.get('expires') is None or cookie['expires'] > now]
+        if len(state['cookies']) == 0:
+            return None
+        return state
+
+    def save(self, key, state):
+        """ Store the state of a session.
+
+        Parameters
+        ----------
+        key : str
+            Key identifying the session.
+        state : dict
+            State of the session, with the list of the cookies, each one a
+            dictionary with name, value, domain, path, expires and secure,
+            and the edit token.
+        """
+        with self.lock:
+            sessions = self.read()
+            sessions[key] = state
+            self.write(sessions)
+
+    def remove(self, key):
+        """ Remove a session.
+
+        Parameters
+        ----------
+        key : str
+            Key identifying the session.
+        """
+        with self.lock:
+            sessions = self.read()
+            if sessions.pop(key, None) is not None:
+                self.write(sessions)
+
+    def read(self):
+        """ Return all the stored sessions. Must be called holding the lock.
+        """
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def write(self, sessions):
+        """ Replace the stored sessions. Must be called holding the lock.
+
+        The file is created with permissions for the user only, and
+        replaced atomically.
+
+        Parameters
+        ----------
+        sessions : dict
+            Sessions to be stored, indexed by key.
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        temporary = self.path + '.tmp'
+        fd = os.open(temporary, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        # the mode is ignored if the file already exists
+        if hasattr(os, 'fchmod'):
+            os.fchmod(fd, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(sessions, f)
+        os.replace(temporary, self.path)
@@ -0,0 +1,118 @@
+# This file is part of wikied.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (C) 2016 Martino Pilia <martino.pilia@gmail.com>
+
+import collections
+import json
+import threading
+import time
+
+class Tracer:
+    """ Record of the last requests made to the wiki.
+
+    The records are kept in memory in a ring buffer of fixed size, and
+    they are formatted only when dumped or summarized, so tracing has a
+    negligible cost on the requests.
+    """
+
+    def __init__(self, size=10000):
+        """ Object initialization.
+
+        Parameters
+        ----------
+        size : int optional
+            Maximum number of records kept in memory.
+        """
+        self.records = collections.deque(maxlen=max(1, size))
+        self.lock = threading.Lock()
+
+    def record(self, address, data, res, latency):
+        """ Record a request.
+
+        Parameters
+        ----------
+        address : str
+            Address of the request.
+        data : dict
+            Parameters of the request.
+        res : requests.Response
+            Response to the request, or None if the request failed.
+        latency : float
+            Duration of the request, in seconds.
+        """
+        # keep only the measures, not to retain the responses in memory
+        entry = (time.time(), address, data.get('action', ''),
+                data.get('list') or data.get('prop') or data.get('meta') or '',
+                sum(len(str(k)) + len(str(v)) + 2 for k, v in data.items()))
+        if res is not None:
+            entry += (len(res.content), latency, res.status_code,
+                    res.headers.get('MediaWiki-API-Error', ''))
+        else:
+            entry += (0, latency, 0, 'exception')
+        with self.lock:
+            self.records.append(entry)
+
+    def entries(self):
+        """ Return the list of the recorded requests, as dictionaries.
+        """
+        with self.lock:
+            records = list(self.records)
+
+        keys = ('time', 'endpoint', 'action', 'query', 'sent', 'received',
+                'latency', 'status', 'error')
+        return [dict(zip(keys, record)) for record in records]
+
+    def dump(self, path):
+        """ Write the recorded requests to a file, one JSON object per line.
+
+        Parameters
+        ----------
+        path : str
+            Path of the output file.
+        """
+        with open(path, 'w') as f:
+            for entry in self.entries():
+                f.write(json.dumps(entry) + '\n')
+
+    def summary(self):
+        """ Return a dictionary with the number of recorded requests, the
+        amount of transferred bytes and the percentiles of the latency.
+        """
+        entries = self.entries()
+        latencies = sorted(entry['latency'] for entry in entries)
+
+        def percentile(p):
+            if len(latencies) < 1:
+                return 0.0
+            return latencies[min(len(latencies) - 1,
+                int(p / 100 * len(latencies)))]
+
+        return {
+            'requests': len(entries),
+            'errors': sum(1 for entry in entries if entry['error'] != ''),
+            'sent': sum(entry['sent'] for entry in entries),
+            'received': sum(entry['received'] for entry in entries),
+            'p50': percentile(50),
+            'p90': percentile(90),
+            'p99': percentile(99),
+            'max': latencies[-1] if len(latencies) > 0 else 0.0
+        }
+
+    def clear(self):
+        """ Remove all the records.
+        """
+        with self.lock:
+            self.records.clear()
@@ -46,6 +46,9 @@ class VoiceEditor(QWidget):
         self.connection = connection
         self.diff = diff
         self.originalContent = ''
+        # metadata of the revision shown in the editor, base of its edits,
+        # following the revisions saved from the editor
+        self.originalMeta = None
 
         ## ACTIONS
 
@@ -129,30 +132,62 @@ class VoiceEditor(QWidget):
 
     def savePageContent(self):
         """ Save the page content making an edit in the wiki.
+
+        The edit is queued and saved in background, based on the revision
+        shown in the editor. Return False if the edit was refused.
         """
         # ensure there is an opened voice
         if self.pageTitle.text() == '':
             return
 
-        self.connection.edit(
+        return self.connection.saveQueue.enqueue(
                 self.pageTitle.text(),
                 self.pageContent.toPlainText(),
-                self.summary.text())
+                self.summary.text(),
+                self.originalMeta)
 
     def saveAndNextVoice(self):
         """ Save the page content and load the next voice in the list.
         """
-        # save current voice
-        self.savePageContent()
+        # save current voice, keeping it in the editor if refused
+        if self.savePageContent() is False:
+            return
         # ask to load next voice
         self.loadNextVoice.emit()
 
+    def openEdit(self, page, content, summary, meta):
+        """ Put in the editor an edit which was not saved, based on a given
+        revision.
+
+        Parameters
+        ----------
+        self : QWidget
+        page : str
+            Name of the page.
+        content : str
+            Content of the edit.
+        summary : str
+            Summary of the edit.
+        meta : dict
+            Metadata of the base revision of the edit, or None if unknown.
+        """
+        base = None
+        if meta is not None:
+            base = self.connection.baseText(page, meta['revid'], fetch=False)
+        self.pageTitle.setText(page)
+        self.pageContent.setPlainText(content)
+        self.summary.setText(summary)
+        # the diff is shown against the base revision, when still known
+        self.originalContent = base if base is not None else ''
+        self.originalMeta = None if meta is None else dict(meta)
+
     def clear(self):
         """ Clear the editor content.
         """
         self.pageContent.setPlainText('')
         self.pageTitle.setText('')
         self.originalContent = ''
+        self.originalMeta = None
 
     def showDiff(self):
         """ Show the diff between the original text and the current text in
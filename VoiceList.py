@@ -23,7 +23,7 @@ class VoiceList(QListWidget):
     """ This class implements a widget containing a list of page titles.
     """
 
-    def __init__(self, load, remove):
+    def __init__(self, load, remove, validate, filter):
         """ Object initialization.
 
         Parameters
@@ -33,11 +33,18 @@ class VoiceList(QListWidget):
             Event triggered when the user loads a page from this list.
         remove : QEvent
             Event triggered when the user removes a page from this list.
+        validate : QEvent
+            Event triggered when the user checks the titles of this list.
+        filter : QEvent
+            Event triggered when the user keeps the pages of this list
+            matching a search.
         """
 
         super().__init__()
         self.load = load
         self.remove = remove
+        self.validate = validate
+        self.filter = filter
 
         # clear the list
         self.clearList= QAction(
@@ -50,7 +57,9 @@ class VoiceList(QListWidget):
         """ Event handler.
         """
         menu = QMenu(self)
-        menu.addActions([self.load, self.remove, self.clearList])
+        menu.addActions(
+                [self.load, self.remove, self.validate, self.filter,
+                    self.clearList])
         # show the menu only if the mouse is pointing a list item
         if self.itemAt(e.pos()):
             menu.popup(e.globalPos())
@@ -15,12 +15,19 @@
 #
 # Copyright (C) 2016 Martino Pilia <martino.pilia@gmail.com>
 
+import collections
+
 from PyQt5.QtCore import Qt, pyqtSignal
 from PyQt5.QtGui import QIcon
 from PyQt5.QtWidgets import (QWidget, QAction, QComboBox, QPushButton,
-        QLineEdit, QHBoxLayout, QVBoxLayout, QDockWidget)
+        QLineEdit, QHBoxLayout, QVBoxLayout, QDockWidget, QProgressBar,
+        QSpinBox, QCheckBox)
 
 from VoiceList import VoiceList
+from WorkerPool import PREFETCH
+
+# item data role marking the voices already validated
+VALIDATED = Qt.UserRole
 
 class VoiceSelector(QDockWidget):
     """ This class implements a dock widget which queries the wiki and
@@ -35,7 +42,7 @@ class VoiceSelector(QDockWidget):
 
     statusMessage = pyqtSignal('QString', name='statusMessage')
 
-    def __init__(self, connection, editor):
+    def __init__(self, connection, editor, pattern=None):
         """ Object initialization.
 
         Parameters
@@ -45,6 +52,9 @@ class VoiceSelector(QDockWidget):
             Object managing the connection to the wiki.
         editor : VoiceEditor
             Editor widget in which open the voices from this list.
+        pattern : callable optional
+            Function returning the regular expression to be searched in the
+            pages, usually the one of the find and replace widget.
         """
 
         super().__init__('Select voices')
@@ -53,21 +63,56 @@ class VoiceSelector(QDockWidget):
         self.connection = connection
         self.pageContent = editor.pageContent
         self.pageTitle = editor.pageTitle
+        self.pattern = pattern
 
         self.connection.pageContentReceived.connect(self.receiveVoiceContent)
-        self.connection.pageContentUnavailable.connect(self.skipVoice)
+        self.connection.pageContentUnavailable.connect(self.voiceUnavailable)
+        self.connection.pageDataReceived.connect(self.receivePrefetchedVoice)
+        self.connection.pageDataUnavailable.connect(
+                self.prefetchedVoiceUnavailable)
+        self.connection.titlesValidated.connect(self.receiveValidation)
+        self.connection.titlesFiltered.connect(self.receiveFilter)
         self.editor.loadNextVoice.connect(self.loadNextVoice)
 
-        # voice being currently loaded
+        # voice being currently loaded, and handle of its request
         self.loadingVoice = None
+        self.loadingRequest = None
+        # number of voices following the current one to be kept in memory
+        self.prefetchSize = self.connection.settings.value(
+                'selector/prefetch', 5, type=int)
+        # content of the prefetched voices, indexed by title
+        self.prefetched = {}
+        # titles of the voices whose prefetch is in progress
+        self.prefetching = set()
+        # handle and titles still awaited of each prefetch request, indexed
+        # by request id
+        self.prefetchRequests = {}
+        # handles of the list queries in progress, indexed by request id
+        self.listRequests = {}
+        # number of voices received by the running list queries
+        self.receivedVoices = 0
+        # handle of the validation in progress, and the items it checks
+        self.validationRequest = None
+        self.validationItems = []
+        # handle of the filtering in progress, and the items it checks
+        self.filterRequest = None
+        self.filterItems = []
         # voice adding modes
         self.titleModes = {
             'title': 'Add title',
             'backlinks': 'Links here',
             'links': 'Links',
             'embeddedin': 'Embedded in',
-            'categorymembers': 'Category members'
+            'categorymembers': 'Category members',
+            'categorytree': 'Category tree',
+            'search': 'Search regex',
+            'union': 'Union of queries',
+            'intersection': 'Intersection of queries',
+            'difference': 'Difference of queries'
         }
+        # list queries which can be combined in a compound query
+        self.sourceModes = ['backlinks', 'links', 'embeddedin',
+                'categorymembers', 'search']
         # current voice index
         self.currentVoice = -1
 
@@ -85,11 +130,28 @@ class VoiceSelector(QDockWidget):
                 'Remove', self)
         removeVoiceAction.setStatusTip('Remove the voice from the list')
         removeVoiceAction.triggered.connect(self.removeSelectedVoice)
+        # validate the list
+        validateAction = QAction(
+                QIcon('icons/document-edit-decrypt-verify'),
+                'Validate list', self)
+        validateAction.setStatusTip(
+                'Resolve the redirects and remove the duplicate, missing '
+                'and protected pages')
+        validateAction.triggered.connect(self.validateVoices)
+        # keep the voices matching the regex
+        filterAction = QAction(
+                QIcon('icons/edit-find'),
+                'Keep matching', self)
+        filterAction.setStatusTip(
+                'Keep the voices whose source matches the regex of find and '
+                'replace, without loading them')
+        filterAction.triggered.connect(self.filterVoices)
 
         ## WIDGETS
 
         self.titleMode = QComboBox()
         self.titleMode.addItems(sorted(self.titleModes.values()))
+        self.titleMode.currentTextChanged.connect(self.updatePlaceholder)
 
         titleSubmit = QPushButton('Add')
         titleSubmit.setFixedWidth(40)
@@ -98,18 +160,58 @@ class VoiceSelector(QDockWidget):
         self.titleEdit = QLineEdit()
         self.titleEdit.returnPressed.connect(titleSubmit.click)
 
+        # depth of the category tree
+        self.depth = QSpinBox()
+        self.depth.setRange(0, 50)
+        self.depth.setValue(3)
+        self.depth.setPrefix('Depth ')
+        self.depth.setToolTip('Maximum depth of the subcategories')
+        self.depth.setVisible(False)
+
+        # download the content of the pages together with the list
+        self.withContent = QCheckBox('With content')
+        self.withContent.setToolTip(
+                'Download the content of the pages together with the list')
+
+        # validate the list before loading the pages
+        self.validateBox = QCheckBox('Validate')
+        self.validateBox.setToolTip(
+                'Validate the list before loading the pages')
+
         titleTools = QHBoxLayout()
         titleTools.addWidget(self.titleMode)
+        titleTools.addWidget(self.depth)
+        titleTools.addWidget(self.withContent)
+        titleTools.addWidget(self.validateBox)
         titleTools.addWidget(titleSubmit)
 
-        self.voicesList = VoiceList(loadVoiceAction, removeVoiceAction)
+        self.voicesList = VoiceList(
+                loadVoiceAction, removeVoiceAction, validateAction,
+                filterAction)
         self.voicesList.setContextMenuPolicy(Qt.DefaultContextMenu)
-        self.connection.voicesReceived.connect(self.voicesList.addItems)
+        self.connection.voicesReceived.connect(self.receiveVoices)
+        self.connection.listFinished.connect(self.finishQuery)
+
+        # busy indicator for the running list queries
+        self.progress = QProgressBar()
+        self.progress.setRange(0, 0)
+        self.progress.setVisible(False)
+
+        # stop the running list queries
+        self.stopButton = QPushButton('Stop')
+        self.stopButton.setToolTip('Stop the running queries')
+        self.stopButton.clicked.connect(self.stopQueries)
+        self.stopButton.setVisible(False)
+
+        progressTools = QHBoxLayout()
+        progressTools.addWidget(self.progress)
+        progressTools.addWidget(self.stopButton)
 
         vbox = QVBoxLayout()
         vbox.addWidget(self.titleEdit)
         vbox.addLayout(titleTools)
         vbox.addWidget(self.voicesList)
+        vbox.addLayout(progressTools)
 
         widget = QWidget()
         widget.setLayout(vbox)
@@ -120,18 +222,387 @@ class VoiceSelector(QDockWidget):
         """ Add the queried voices.
         """
         title = self.titleEdit.text()
+        if self.titleMode.currentText() == self.titleModes['search']:
+            # the title field holds further search terms, possibly none
+            self.addSearch(title)
+            return
         if title == '':
             return
         if self.titleMode.currentText() == self.titleModes['title']:
             self.voicesList.addItem(title)
-        elif self.titleMode.currentText() == self.titleModes['backlinks']:
-            self.connection.getBacklinks(title)
+            if self.validateBox.isChecked():
+                self.validateNewVoices()
+            else:
+                self.prefetch()
+            return
+        if not self.connection.isConnected:
+            return
+        for operation in ('union', 'intersection', 'difference'):
+            if self.titleMode.currentText() == self.titleModes[operation]:
+                self.addCompound(title, operation)
+                return
+        if self.withContent.isChecked():
+            for mode in self.sourceModes:
+                if self.titleMode.currentText() == self.titleModes[mode]:
+                    self.startQuery(
+                            self.connection.getVoicesWithContent(mode, title))
+                    return
+        if self.titleMode.currentText() == self.titleModes['backlinks']:
+            self.startQuery(self.connection.getBacklinks(title))
         elif self.titleMode.currentText() == self.titleModes['links']:
-            self.connection.getLinks(title)
+            self.startQuery(self.connection.getLinks(title))
         elif self.titleMode.currentText() == self.titleModes['embeddedin']:
-            self.connection.getEmbeddedin(title)
+            self.startQuery(self.connection.getEmbeddedin(title))
         elif self.titleMode.currentText() == self.titleModes['categorymembers']:
-            self.connection.getCategorymembers(title)
+            self.startQuery(self.connection.getCategorymembers(title))
+        elif self.titleMode.currentText() == self.titleModes['categorytree']:
+            self.startQuery(self.connection.getCategoryTree(
+                    title, self.depth.value()))
+
+    def addSearch(self, terms):
+        """ Add the voices whose source matches the regex of find and
+        replace, as found by the search engine of the wiki.
+
+        Parameters
+        ----------
+        self : QWidget
+        terms : str
+            Further search terms, e.g. "incategory:Foo".
+        """
+        if not self.connection.isConnected:
+            return
+        text = self.searchText('', terms)
+        if text is None:
+            return
+        if self.withContent.isChecked():
+            self.startQuery(
+                    self.connection.getVoicesWithContent('search', text))
+        else:
+            self.startQuery(self.connection.getSearch(text))
+
+    def searchText(self, pattern, terms=''):
+        """ Return the text of a search for a regex, or None if there is
+        no regex to search, or the search engine cannot match it.
+
+        Parameters
+        ----------
+        self : QWidget
+        pattern : str
+            Regular expression. If empty, the regex of find and replace is
+            used.
+        terms : str optional
+            Further search terms.
+        """
+        if pattern == '' and self.pattern is not None:
+            pattern = self.pattern()
+        if pattern == '':
+            self.statusMessage.emit('No regex to search')
+            return None
+        try:
+            return self.connection.searchText(pattern, terms)
+        except ValueError as e:
+            self.statusMessage.emit('Cannot search the regex: %s' % e)
+            return None
+
+    def addCompound(self, text, operation):
+        """ Add the voices resulting from a compound query.
+
+        Parameters
+        ----------
+        self : QWidget
+        text : str
+            List of sources, separated by semicolons, each one in the form
+            "query:title", e.g. "backlinks:Foo; embeddedin:Template:Bar".
+            The title of a search source is a regex, and if empty the regex
+            of find and replace is used, e.g. "search:; categorymembers:Foo".
+        operation : str
+            One of union, intersection and difference.
+        """
+        sources = []
+        for part in text.split(';'):
+            mode, _, title = part.strip().partition(':')
+            if mode == 'search':
+                title = self.searchText(title.strip())
+                if title is None:
+                    return
+            elif mode not in self.sourceModes or title.strip() == '':
+                self.statusMessage.emit('Invalid query: %s' % part.strip())
+                return
+            sources.append((mode, title.strip()))
+
+        self.startQuery(self.connection.getCompound(sources, operation))
+
+    def updatePlaceholder(self, mode):
+        """ Show in the title field the syntax for the selected mode, and the
+        depth selector for the category tree.
+
+        Parameters
+        ----------
+        self : QWidget
+        mode : str
+            Text of the selected mode.
+        """
+        self.depth.setVisible(mode == self.titleModes['categorytree'])
+        if mode in (self.titleModes['union'], self.titleModes['intersection'],
+                self.titleModes['difference']):
+            self.titleEdit.setPlaceholderText(
+                    'backlinks:Foo; embeddedin:Template:Bar')
+        elif mode == self.titleModes['search']:
+            self.titleEdit.setPlaceholderText(
+                    'Further search terms, e.g. incategory:Foo')
+        else:
+            self.titleEdit.setPlaceholderText('')
+
+    def startQuery(self, handle):
+        """ Show the progress indicator for a new list query.
+
+        Parameters
+        ----------
+        self : QWidget
+        handle : RequestHandle
+            Handle of the query, or None if the query was not started.
+        """
+        if handle is None:
+            return
+        if len(self.listRequests) == 0:
+            self.receivedVoices = 0
+        self.listRequests[handle.id] = handle
+        self.progress.setFormat('%d voices' % self.receivedVoices)
+        self.progress.setVisible(True)
+        self.stopButton.setVisible(True)
+
+    def receiveVoices(self, request, voices):
+        """ Add to the list a batch of voices of a list query, and update
+        the progress indicator.
+
+        Parameters
+        ----------
+        self : QWidget
+        request : int
+            Id of the query.
+        voices : list of str
+            Titles of the received voices.
+        """
+        if request not in self.listRequests:
+            # the query was stopped
+            return
+        self.voicesList.addItems(voices)
+        self.receivedVoices += len(voices)
+        self.progress.setFormat('%d voices' % self.receivedVoices)
+        self.prefetch()
+
+    def finishQuery(self, request, count):
+        """ Hide the progress indicator when all the list queries are
+        completed.
+
+        Parameters
+        ----------
+        self : QWidget
+        request : int
+            Id of the completed query.
+        count : int
+            Number of voices received by the completed query.
+        """
+        if self.listRequests.pop(request, None) is None:
+            return
+        if len(self.listRequests) == 0:
+            self.hideProgress()
+            self.statusMessage.emit('%d voices added' % self.receivedVoices)
+            if self.validateBox.isChecked():
+                self.validateNewVoices()
+
+    def stopQueries(self):
+        """ Cancel all the running list queries, keeping the voices already
+        received, and the validation and the filtering of the list.
+        """
+        for handle in self.listRequests.values():
+            handle.cancel()
+        self.listRequests = {}
+        if self.validationRequest is not None:
+            self.validationRequest.cancel()
+            self.validationRequest = None
+            self.validationItems = []
+        if self.filterRequest is not None:
+            self.filterRequest.cancel()
+            self.filterRequest = None
+            self.filterItems = []
+        self.progress.setVisible(False)
+        self.stopButton.setVisible(False)
+        self.statusMessage.emit(
+                '%d voices added, queries stopped' % self.receivedVoices)
+        self.prefetch()
+
+    def validateVoices(self):
+        """ Check the titles of the whole list before loading the pages.
+        The pages are not loaded in background until the check is
+        completed.
+        """
+        self.validate([self.voicesList.item(row)
+                for row in range(self.voicesList.count())])
+
+    def validateNewVoices(self):
+        """ Check the titles added to the list since the last validation,
+        including the ones of a validation still in progress.
+        """
+        items = [self.voicesList.item(row)
+                for row in range(self.voicesList.count())]
+        self.validate([item for item in items if not item.data(VALIDATED)])
+
+    def validate(self, items):
+        """ Check the titles of some voices of the list. The pages are not
+        loaded in background until the check is completed.
+
+        Parameters
+        ----------
+        self : QWidget
+        items : list of QListWidgetItem
+            Voices to be checked.
+        """
+        if self.validationRequest is not None:
+            self.validationRequest.cancel()
+        if len(items) < 1:
+            self.validationRequest = None
+            self.validationItems = []
+            return
+        handle = self.connection.validateTitles(
+                [item.text() for item in items])
+        if handle is None:
+            self.validationRequest = None
+            self.validationItems = []
+            return
+        self.validationRequest = handle
+        self.validationItems = items
+        self.progress.setFormat('Validating %d voices' % len(items))
+        self.progress.setVisible(True)
+        self.stopButton.setVisible(True)
+
+    def receiveValidation(self, request, targets, reasons):
+        """ Apply the result of the validation to the list: rename the
+        voices to their final titles, and remove the duplicate and the
+        invalid ones. A voice is a duplicate also of the voices validated
+        before. The voice opened in the editor is kept.
+
+        Parameters
+        ----------
+        self : QWidget
+        request : int
+            Id of the validation request.
+        targets : dict
+            Final title of each valid title.
+        reasons : dict
+            Reason of each title changed or dropped.
+        """
+        if self.validationRequest is None or \
+                request != self.validationRequest.id:
+            # stale result of a cancelled validation
+            return
+
+        checked = {id(item) for item in self.validationItems}
+        seen = set()
+        for row in range(self.voicesList.count()):
+            item = self.voicesList.item(row)
+            if item.data(VALIDATED) and id(item) not in checked:
+                seen.add(item.text())
+
+        dropped = collections.Counter()
+        renamed = 0
+        for item in self.validationItems:
+            row = self.voicesList.row(item)
+            if row < 0:
+                # removed in the meanwhile
+                continue
+            title = item.text()
+            target = targets.get(title)
+            if target is not None and target not in seen:
+                seen.add(target)
+                if target != title:
+                    item.setText(target)
+                    renamed += 1
+                item.setData(VALIDATED, True)
+                continue
+            if item is self.loadingVoice or (row == self.currentVoice and
+                    title == self.pageTitle.text()):
+                continue
+            dropped[reasons.get(title, 'duplicate')] += 1
+            self.removeVoice(item)
+
+        self.validationRequest = None
+        self.validationItems = []
+        self.hideProgress()
+        self.statusMessage.emit('%d voices renamed, %d removed%s' % (
+                renamed,
+                sum(dropped.values()),
+                ' (%s)' % ', '.join('%d %s' % (count, reason)
+                    for reason, count in sorted(dropped.items()))
+                    if len(dropped) > 0 else ''))
+        self.prefetch()
+
+    def filterVoices(self):
+        """ Keep the voices of the list whose source matches the regex of
+        find and replace, searching it on the wiki, so the other pages are
+        not loaded at all. The pages are not loaded in background until the
+        search is completed.
+        """
+        if self.filterRequest is not None:
+            self.filterRequest.cancel()
+        self.filterRequest = None
+        self.filterItems = []
+        items = [self.voicesList.item(row)
+                for row in range(self.voicesList.count())]
+        text = self.searchText('')
+        if len(items) < 1 or text is None:
+            return
+        handle = self.connection.filterTitles(
+                [item.text() for item in items], text)
+        if handle is None:
+            return
+        self.filterRequest = handle
+        self.filterItems = items
+        self.progress.setFormat('Searching %d voices' % len(items))
+        self.progress.setVisible(True)
+        self.stopButton.setVisible(True)
+
+    def receiveFilter(self, request, titles):
+        """ Remove from the list the voices not matching the search. The
+        voice opened in the editor is kept.
+
+        Parameters
+        ----------
+        self : QWidget
+        request : int
+            Id of the filtering request.
+        titles : list of str
+            Titles matching the search.
+        """
+        if self.filterRequest is None or request != self.filterRequest.id:
+            # stale result of a cancelled filtering
+            return
+
+        matching = set(titles)
+        removed = 0
+        for item in self.filterItems:
+            row = self.voicesList.row(item)
+            if row < 0 or item.text() in matching:
+                continue
+            if item is self.loadingVoice or (row == self.currentVoice and
+                    item.text() == self.pageTitle.text()):
+                continue
+            self.removeVoice(item)
+            removed += 1
+
+        self.filterRequest = None
+        self.filterItems = []
+        self.hideProgress()
+        self.statusMessage.emit('%d voices removed, not matching' % removed)
+        self.prefetch()
+
+    def hideProgress(self):
+        """ Hide the progress indicator if no query is running.
+        """
+        if len(self.listRequests) == 0 and self.validationRequest is None \
+                and self.filterRequest is None:
+            self.progress.setVisible(False)
+            self.stopButton.setVisible(False)
 
     def loadSelectedVoice(self):
         """ Load in the editor the page currently selected in the list.
@@ -152,9 +623,26 @@ class VoiceSelector(QDockWidget):
         """
 
         if self.loadingVoice != None:
+            if self.loadingVoice.text() == voice.text():
+                return
+            # another voice was chosen, drop the previous request
+            self.cancelLoading()
+        if voice.text() in self.prefetched:
+            # the voice is already in memory, show it immediately
+            content, meta = self.prefetched.pop(voice.text())
+            self.showVoice(voice, content, meta)
             return
-        self.loadingVoice = voice
-        self.connection.getPageContent(voice.text())
+        self.loadingRequest = self.connection.getPageContent(voice.text())
+        if self.loadingRequest is not None:
+            self.loadingVoice = voice
+
+    def cancelLoading(self):
+        """ Cancel the request of the voice being loaded.
+        """
+        if self.loadingRequest is not None:
+            self.loadingRequest.cancel()
+        self.loadingVoice = None
+        self.loadingRequest = None
 
     def loadNextVoice(self):
         """ Load in the editor the page currently selected in the list, remove
@@ -163,8 +651,14 @@ class VoiceSelector(QDockWidget):
         # ensure there is a voice opened in the editor
         if self.currentVoice < 0 or self.loadingVoice:
             return
-        # remove saved voice from the list
-        self.removeVoice(self.voicesList.item(self.currentVoice))
+        voice = self.voicesList.item(self.currentVoice)
+        if voice is not None and voice.text() == self.pageTitle.text():
+            # remove saved voice from the list
+            self.removeVoice(voice)
+        else:
+            # the current voice could not be opened while offline, and is
+            # kept in the list
+            self.currentVoice += 1
         # check if there is any voice left
         voicesNo = self.voicesList.count()
         if voicesNo < 1:
@@ -179,27 +673,207 @@ class VoiceSelector(QDockWidget):
         # load next voice
         self.loadVoice(self.voicesList.item(self.currentVoice))
 
-    def skipVoice(self):
-        """ Skip a page from the list.
+    def skipVoice(self, voice):
+        """ Remove from the list a page which cannot be loaded, and load the
+        following one.
+
+        Parameters
+        ----------
+        self : QWidget
+        voice : QListWidgetItem
+            Item of the list corresponding to the page.
         """
         self.loadingVoice = None
-        self.loadNextVoice()
+        row = self.voicesList.row(voice)
+        self.removeVoice(voice)
+        if row < 0 or row >= self.voicesList.count():
+            return
+        self.currentVoice = row
+        self.voicesList.setCurrentRow(row)
+        self.loadVoice(self.voicesList.item(row))
+
+    def voiceUnavailable(self, request, failed=False):
+        """ Skip the page being loaded when it cannot be retrieved. While
+        offline, a page missing from the cache is kept in the list, to be
+        loaded once the connection is available, and so is a page which
+        could not be loaded for a network failure.
+
+        Parameters
+        ----------
+        self : QWidget
+        request : int
+            Id of the failed request.
+        failed : bool optional
+            True if the page could not be loaded for a network failure.
+        """
+        if self.loadingRequest is None or request != self.loadingRequest.id:
+            # stale result of a dropped request
+            return
+        self.loadingRequest = None
+        voice = self.loadingVoice
+        if not self.connection.isConnected:
+            self.loadingVoice = None
+            self.statusMessage.emit(
+                    '%s is not available offline' % voice.text())
+            return
+        if failed:
+            self.loadingVoice = None
+            self.statusMessage.emit(
+                    '%s could not be loaded, kept in the list' % voice.text())
+            return
+        self.skipVoice(voice)
 
-    def receiveVoiceContent(self, content):
+    def receiveVoiceContent(self, request, content, meta):
         """ Receive the text content of a page and put it in the editor.
 
         Parameters
         ----------
         self : QWidget
+        request : int
+            Id of the request.
         content : str
             Retrieved text content of the page.
+        meta : dict
+            Revision metadata of the page.
+        """
+        if self.loadingRequest is None or request != self.loadingRequest.id:
+            # stale result of a dropped request
+            return
+        voice = self.loadingVoice
+        self.loadingVoice = None
+        self.loadingRequest = None
+        self.showVoice(voice, content, meta)
+
+    def showVoice(self, voice, content, meta):
+        """ Put the content of a page in the editor, and refill the prefetch
+        window for the following voices.
+
+        Parameters
+        ----------
+        self : QWidget
+        voice : QListWidgetItem
+            Item of the list corresponding to the page.
+        content : str
+            Text content of the page.
+        meta : dict
+            Revision metadata of the page, the base of its edits.
         """
-        self.currentVoice = self.voicesList.row(self.loadingVoice)
+        self.currentVoice = self.voicesList.row(voice)
         self.pageContent.setPlainText(content)
         self.editor.originalContent = content
-        self.pageTitle.setText(self.loadingVoice.text())
+        # kept with the text, since later loads of the page may be newer
+        self.editor.originalMeta = dict(meta)
+        self.pageTitle.setText(voice.text())
 
-        self.loadingVoice = None
+        self.prefetch()
+
+    def prefetchWindow(self):
+        """ Return the titles of the voices following the current one which
+        should be kept in memory.
+        """
+        start = max(self.currentVoice, 0)
+        titles = []
+        for row in range(start, self.voicesList.count()):
+            if len(titles) >= self.prefetchSize:
+                break
+            title = self.voicesList.item(row).text()
+            # skip the voice currently opened in the editor
+            if row == self.currentVoice and title == self.pageTitle.text():
+                continue
+            titles.append(title)
+        return titles
+
+    def prefetch(self):
+        """ Request in background the content of the voices following the
+        current one, and drop from memory the voices outside the window.
+        """
+        if self.prefetchSize < 1:
+            return
+        # wait for the validation and the filtering of the list
+        if self.validationRequest is not None or \
+                self.filterRequest is not None or \
+                (self.validateBox.isChecked() and len(self.listRequests) > 0):
+            return
+
+        window = self.prefetchWindow()
+
+        for title in list(self.prefetched):
+            if title not in window:
+                del self.prefetched[title]
+
+        # cancel the requests whose voices all left the window
+        for request, (handle, titles) in list(self.prefetchRequests.items()):
+            if titles.isdisjoint(window):
+                handle.cancel()
+                del self.prefetchRequests[request]
+                self.prefetching.difference_update(titles)
+
+        missing = [t for t in window
+                if t not in self.prefetched and t not in self.prefetching]
+        if len(missing) < 1 or not self.connection.isConnected:
+            return
+
+        handle = self.connection.getPagesContent(missing, PREFETCH)
+        if handle is None:
+            return
+        self.prefetching.update(missing)
+        self.prefetchRequests[handle.id] = (handle, set(missing))
+
+    def forgetPrefetch(self, request, title):
+        """ Mark a page of a prefetch request as received, returning False
+        if the page was not awaited from that request.
+
+        Parameters
+        ----------
+        self : QWidget
+        request : int
+            Id of the prefetch request.
+        title : str
+            Title of the page.
+        """
+        if request not in self.prefetchRequests:
+            return False
+        handle, titles = self.prefetchRequests[request]
+        if title not in titles:
+            return False
+        titles.discard(title)
+        if len(titles) == 0:
+            del self.prefetchRequests[request]
+        self.prefetching.discard(title)
+        return True
+
+    def receivePrefetchedVoice(self, request, title, content, meta):
+        """ Store in memory the content of a prefetched page.
+
+        Parameters
+        ----------
+        self : QWidget
+        request : int
+            Id of the prefetch request.
+        title : str
+            Title of the page.
+        content : str
+            Retrieved text content of the page.
+        meta : dict
+            Revision metadata of the page.
+        """
+        if not self.forgetPrefetch(request, title):
+            return
+        if title in self.prefetchWindow():
+            self.prefetched[title] = (content, meta)
+
+    def prefetchedVoiceUnavailable(self, request, title):
+        """ Forget a page whose prefetch failed.
+
+        Parameters
+        ----------
+        self : QWidget
+        request : int
+            Id of the prefetch request.
+        title : str
+            Title of the page.
+        """
+        self.forgetPrefetch(request, title)
 
     def removeSelectedVoice(self):
         """ Remove from the voice list the currently selected entry.
@@ -221,7 +895,14 @@ class VoiceSelector(QDockWidget):
         voicePos = self.voicesList.row(voice)
         if voicePos == None:
             return
+        if self.loadingVoice is not None and \
+                self.voicesList.row(self.loadingVoice) == voicePos:
+            # the voice being loaded is not wanted anymore
+            self.cancelLoading()
         if voicePos < self.currentVoice:
             self.currentVoice = self.currentVoice - 1
         # workaround because removeItemWidget(QListWidgetItem) is not working
         self.voicesList.takeItem(voicePos)
+        # refill the prefetch window
+        self.prefetched.pop(voice.text(), None)
+        self.prefetch()
@@ -0,0 +1,358 @@
+# This file is part of wikied.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (C) 2016 Martino Pilia <martino.pilia@gmail.com>
+
+import collections
+import requests
+import threading
+import time
+import traceback
+
+from RequestHandle import Cancelled
+
+# priority classes of the tasks, from the most urgent
+INTERACTIVE = 0
+PREFETCH = 1
+BULK = 2
+
+# connect and read timeouts of the requests, in seconds, the same of the
+# AsyncTransport, so a stalled connection does not block a worker forever
+TIMEOUT = (30, 120)
+
+class WorkerPool:
+    """ Fixed size pool of worker threads executing the requests to the wiki.
+
+    Each worker owns a HTTP session, keeping its connections alive between
+    the requests. The cookies belong to the clients of the pool, returned by
+    the client method: each request is made with the cookie jar of its
+    client, so the login made by a worker is valid for all the others, and
+    several clients logged in different wikis or accounts can share the
+    same workers.
+
+    Tasks belong to a priority class, and a free worker always takes the
+    oldest task of the most urgent class. Background tasks (prefetch and
+    bulk) can occupy only a limited number of workers at the same time, so
+    the remaining ones are always available to interactive tasks.
+    """
+
+    def __init__(self, size=4, background=None):
+        """ Object initialization.
+
+        Parameters
+        ----------
+        size : int optional
+            Number of worker threads.
+        background : int optional
+            Maximum number of workers running background tasks at the same
+            time. By default, all the workers but one.
+        """
+
+        self.size = max(1, size)
+        if background is None:
+            background = self.size - 1
+        self.background = max(1, min(background, self.size))
+        self.local = threading.local()
+
+        # queued tasks of each priority class, and their condition
+        self.queues = [collections.deque() for i in range(BULK + 1)]
+        self.condition = threading.Condition()
+        # number of workers running background tasks
+        self.backgroundBusy = 0
+        self.stopping = False
+
+        # counters
+        self.lock = threading.Lock()
+        self.busy = 0
+        self.completed = 0
+        self.busyTime = 0.0
+        self.startTime = time.monotonic()
+
+        self.workers = []
+        for i in range(self.size):
+            t = threading.Thread(
+                    target=self.work,
+                    name='WorkerPool-%d' % i)
+            t.start()
+            self.workers.append(t)
+
+    def submit(self, function, *args, priority=INTERACTIVE, handle=None):
+        """ Queue a function for the execution in a worker.
+
+        Parameters
+        ----------
+        function : callable
+            Function to be executed.
+        args : list
+            Arguments for the function.
+        priority : int optional
+            Priority class of the task, one of INTERACTIVE, PREFETCH and
+            BULK.
+        handle : RequestHandle optional
+            Handle of the request the task belongs to. The task is dropped
+            if the request is cancelled before its execution.
+        """
+        with self.condition:
+            self.queues[priority].append((function, args, handle))
+            self.condition.notify_all()
+
+    def currentHandle(self):
+        """ Return the handle of the request whose task is being executed
+        by the calling thread, or None.
+        """
+        return getattr(self.local, 'handle', None)
+
+    def next(self):
+        """ Return the next task to be executed by a worker, with its
+        priority, or None if the pool is stopping and no task is left.
+
+        Must be called holding the condition.
+        """
+        while True:
+            if len(self.queues[INTERACTIVE]) > 0:
+                return INTERACTIVE, self.queues[INTERACTIVE].popleft()
+            if self.backgroundBusy < self.background:
+                for priority in (PREFETCH, BULK):
+                    if len(self.queues[priority]) > 0:
+                        self.backgroundBusy += 1
+                        return priority, self.queues[priority].popleft()
+            if self.stopping and self.queueDepth() == 0:
+                return None
+            self.condition.wait()
+
+    def client(self):
+        """ Return a new client of the pool, making requests with its own
+        cookies.
+        """
+        return PoolClient(self)
+
+    def session(self):
+        """ Return the HTTP session of the calling thread.
+        """
+        if not hasattr(self.local, 'session'):
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(
+                    pool_connections=1,
+                    pool_maxsize=1)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            self.local.session = session
+        return self.local.session
+
+    def post(self, address, data, cookies, handle=None):
+        """ Make a POST request with the session of the calling thread, and
+        return the response.
+
+        A request in flight cannot be interrupted, so a cancelled request
+        stops before sending, while a stalled request fails once the
+        timeout expires.
+
+        Parameters
+        ----------
+        address : str
+            Address for the request.
+        data : dict
+            Parameters of the request.
+        cookies : RequestsCookieJar
+            Cookie jar sending and receiving the cookies of the request.
+        handle : RequestHandle optional
+            Handle of the request the HTTP request belongs to.
+        """
+        if handle is not None:
+            handle.check()
+        session = self.session()
+        # the session is used by a thread at a time, so its jar can be
+        # swapped for each request
+        session.cookies = cookies
+        return session.post(address, data=data, timeout=TIMEOUT)
+
+    def queueDepth(self, priority=None):
+        """ Return the number of tasks waiting for a free worker.
+
+        Parameters
+        ----------
+        priority : int optional
+            Priority class of the tasks to be counted. By default, all the
+            tasks are counted.
+        """
+        if priority is not None:
+            return len(self.queues[priority])
+        return sum(len(q) for q in self.queues)
+
+    def utilization(self):
+        """ Return the fraction of time spent by the workers running tasks
+        since the creation of the pool.
+        """
+        with self.lock:
+            elapsed = (time.monotonic() - self.startTime) * self.size
+            return self.busyTime / elapsed if elapsed > 0 else 0.0
+
+    def stats(self):
+        """ Return a dictionary with the counters of the pool.
+        """
+        with self.lock:
+            busy = self.busy
+            completed = self.completed
+        with self.condition:
+            background = self.backgroundBusy
+            queued = [self.queueDepth(p) for p in range(BULK + 1)]
+        return {
+            'workers': self.size,
+            'busy': busy,
+            'background': background,
+            'queued': sum(queued),
+            'queued interactive': queued[INTERACTIVE],
+            'queued prefetch': queued[PREFETCH],
+            'queued bulk': queued[BULK],
+            'completed': completed,
+            'utilization': self.utilization()
+        }
+
+    def work(self):
+        """ Main loop of a worker thread.
+        """
+        while True:
+            with self.condition:
+                task = self.next()
+            if task is None:
+                break
+            priority, (function, args, handle) = task
+
+            with self.lock:
+                self.busy += 1
+            start = time.monotonic()
+
+            self.local.handle = handle
+            try:
+                if handle is None or not handle.isCancelled():
+                    function(*args)
+            except Cancelled:
+                pass
+            except Exception:
+                traceback.print_exc()
+            self.local.handle = None
+
+            with self.lock:
+                self.busy -= 1
+                self.completed += 1
+                self.busyTime += time.monotonic() - start
+
+            if priority != INTERACTIVE:
+                with self.condition:
+                    self.backgroundBusy -= 1
+                    self.condition.notify_all()
+
+    def shutdown(self):
+        """ Stop the workers after the completion of the queued tasks.
+        """
+        with self.condition:
+            self.stopping = True
+            self.condition.notify_all()
+
+class PoolClient:
+    """ Client making HTTP requests through the workers of a WorkerPool,
+    with its own cookies.
+    """
+
+    def __init__(self, pool):
+        """ Object initialization.
+
+        Parameters
+        ----------
+        pool : WorkerPool
+            Pool whose workers make the requests.
+        """
+        self.pool = pool
+        self.cookies = requests.cookies.RequestsCookieJar()
+        # maximum number of simultaneous connections
+        self.connections = pool.size
+
+    def post(self, address, data, handle=None):
+        """ Make a POST request with the session of the calling thread, and
+        return the response.
+
+        Parameters
+        ----------
+        address : str
+            Address for the request.
+        data : dict
+            Parameters of the request.
+        handle : RequestHandle optional
+            Handle of the request the HTTP request belongs to.
+        """
+        return self.pool.post(address, data, self.cookies, handle)
+
+    def postMany(self, address, dataList, handle=None, timings=None):
+        """ Make a set of POST requests, and return the list of responses in
+        the same order of the requests.
+
+        The requests are made sequentially by the calling thread.
+
+        Parameters
+        ----------
+        address : str
+            Address for the requests.
+        dataList : list of dict
+            Parameters of each request.
+        handle : RequestHandle optional
+            Handle of the request the HTTP requests belong to.
+        timings : list optional
+            List receiving the duration of each completed request, in
+            seconds.
+        """
+        responses = []
+        for data in dataList:
+            start = time.monotonic()
+            responses.append(self.post(address, data, handle))
+            if timings is not None:
+                timings.append(time.monotonic() - start)
+        return responses
+
+    def clearCookies(self):
+        """ Remove all the cookies of the client.
+        """
+        self.cookies.clear()
+
+    def exportCookies(self):
+        """ Return the list of the cookies of the client, each one a
+        dictionary with name, value, domain, path, expires and secure.
+        """
+        return [{
+            'name': cookie.name,
+            'value': cookie.value,
+            'domain': cookie.domain,
+            'path': cookie.path,
+            'expires': cookie.expires,
+            'secure': cookie.secure
+        } for cookie in self.cookies]
+
+    def importCookies(self, cookies, address):
+        """ Add a list of cookies to the ones of the client.
+
+        Parameters
+        ----------
+        cookies : list of dict
+            Cookies, as returned by exportCookies.
+        address : str
+            Address of the wiki the cookies belong to.
+        """
+        for cookie in cookies:
+            self.cookies.set(
+                    cookie['name'],
+                    cookie['value'],
+                    domain=cookie['domain'],
+                    path=cookie['path'],
+                    expires=cookie['expires'],
+                    secure=cookie['secure'])
@@ -0,0 +1,960 @@
+#!/usr/bin/env python3
+
+# This file is part of wikied.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (C) 2016 Martino Pilia <martino.pilia@gmail.com>
+
+""" Local stand-in for the MediaWiki API, used to measure the performance of
+the program offline.
+
+The server implements the subset of api.php used by the Connection,
+including the list modules used as generators, on a synthetic wiki held in
+memory, with configurable latency, error injection,
+replication lag and edit rate limits.
+"""
+
+import argparse
+import collections
+import json
+import random
+import re
+import threading
+import time
+import urllib.parse
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# namespace numbers for the title prefixes
+NAMESPACES = {
+    'Template': 10,
+    'Category': 14,
+}
+
+# parameter prefixes of the list modules
+PREFIXES = {
+    'backlinks': 'bl',
+    'embeddedin': 'ei',
+    'categorymembers': 'cm',
+    'links': 'pl',
+    'search': 'sr',
+}
+
+# maximum offset of the search results, as in CirrusSearch
+SEARCH_MAX_OFFSET = 10000
+
+class ApiError(Exception):
+    """ Error returned to the client in the API response.
+    """
+
+    def __init__(self, code, info='', status=200, headers=None):
+        """ Object initialization.
+
+        Parameters
+        ----------
+        code : str
+            Error code.
+        info : str optional
+            Description of the error.
+        status : int optional
+            HTTP status of the response.
+        headers : dict optional
+            Additional headers of the response.
+        """
+        super().__init__(code)
+        self.code = code
+        self.info = info or code
+        self.status = status
+        self.headers = headers or {}
+
+def normalize(title):
+    """ Return the normalized form of a title.
+
+    Parameters
+    ----------
+    title : str
+        Title of a page.
+    """
+    title = title.replace('_', ' ').strip()
+    if ':' in title:
+        prefix, name = title.split(':', 1)
+        if prefix.capitalize() in NAMESPACES:
+            name = name.strip()
+            return prefix.capitalize() + ':' + name[:1].upper() + name[1:]
+    return title[:1].upper() + title[1:]
+
+def namespace(title):
+    """ Return the namespace number of a normalized title.
+
+    Parameters
+    ----------
+    title : str
+        Title of a page.
+    """
+    if ':' in title:
+        return NAMESPACES.get(title.split(':', 1)[0], 0)
+    return 0
+
+def luceneRegex(expression, caseless=False):
+    """ Return the Python regular expression equivalent to a Lucene one,
+    as matched by the insource: search of CirrusSearch. Raise ApiError for
+    invalid or unsupported expressions.
+
+    Unlike Python, Lucene has no escape classes such as \\d, no anchors and
+    no lookarounds: a backslash makes any character literal, and ^ and $
+    are literal too. The dot matches any character, the newline included.
+
+    Parameters
+    ----------
+    expression : str
+        Lucene regular expression.
+    caseless : bool optional
+        If True, the case is ignored.
+    """
+    out = []
+    i = 0
+    while i < len(expression):
+        c = expression[i]
+        if c == '\\':
+            if i + 1 == len(expression):
+                raise ApiError('cirrussearch-regex-syntax-error',
+                        'Unexpected end of the regex')
+            out.append(re.escape(expression[i + 1]))
+            i += 2
+            continue
+        if c == '[':
+            end = i + 1
+            items = []
+            if expression.startswith('^', end):
+                items.append('^')
+                end += 1
+            while end < len(expression) and expression[end] != ']':
+                if expression[end] == '\\':
+                    end += 1
+                    items.append(re.escape(expression[end]))
+                elif expression[end] == '-':
+                    items.append('-')
+                else:
+                    items.append(re.escape(expression[end]))
+                end += 1
+            if end == len(expression):
+                raise ApiError('cirrussearch-regex-syntax-error',
+                        'Unclosed character class')
+            out.append('[%s]' % ''.join(items))
+            i = end + 1
+            continue
+        if c == '{':
+            match = re.compile(r'\{\d+(,\d*)?\}').match(expression, i)
+            if match is None:
+                raise ApiError('cirrussearch-regex-syntax-error',
+                        'Invalid repetition')
+            out.append(match.group(0))
+            i = match.end()
+            continue
+        if c == '"':
+            end = expression.index('"', i + 1)
+            out.append(re.escape(expression[i + 1 : end]))
+            i = end + 1
+            continue
+        if c in '&~<#':
+            raise ApiError('cirrussearch-regex-syntax-error',
+                    'Unsupported regex operator: %s' % c)
+        if c == '@':
+            out.append('[\\s\\S]*')
+        elif c == '.':
+            out.append('[\\s\\S]')
+        elif c in '()|*+?':
+            out.append(c)
+        else:
+            out.append(re.escape(c))
+        i += 1
+    try:
+        return re.compile(''.join(out), re.IGNORECASE if caseless else 0)
+    except re.error as e:
+        raise ApiError('cirrussearch-regex-syntax-error',
+                'Regular expression syntax error: %s' % e)
+
+def timestamp():
+    """ Return the current time in the format used by the API.
+    """
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+
+class FakeWiki:
+    """ In-memory wiki served through a local HTTP server.
+
+    The wiki contains a number of pages "Page 1", "Page 2", ... each one
+    linking the first page and the following one, transcluding
+    "Template:Bench" and belonging to "Category:Bench" and to one of its
+    subcategories "Category:Bench sub 1", "Category:Bench sub 2", ...
+    The first subcategory contains "Category:Bench", forming a cycle.
+    """
+
+    def __init__(self,
+            pages=1000,
+            latency=0.0,
+            errorRate=0.0,
+            lag=0.0,
+            editLimit=None,
+            highLimits=False,
+            subcategories=10,
+            port=0):
+        """ Object initialization.
+
+        Parameters
+        ----------
+        pages : int optional
+            Number of content pages of the synthetic wiki.
+        latency : float optional
+            Delay added to each request, in seconds.
+        errorRate : float optional
+            Fraction of requests failing with a transient error.
+        lag : float optional
+            Simulated replication lag, in seconds, compared with the maxlag
+            parameter of the requests.
+        editLimit : tuple optional
+            Maximum number of edits and period in seconds for the edit rate
+            limit, or None for no limit.
+        highLimits : bool optional
+            If True, the user has the apihighlimits right.
+        subcategories : int optional
+            Number of subcategories of "Category:Bench".
+        port : int optional
+            Port of the server. If 0, a free port is chosen.
+        """
+
+        self.latency = latency
+        self.errorRate = errorRate
+        self.lag = lag
+        self.editLimit = editLimit
+        self.highLimits = highLimits
+
+        self.lock = threading.RLock()
+        self.random = random.Random(0)
+        self.nextPageid = 1
+        self.nextRevid = 1
+        # pages indexed by title, each one a dictionary with the page id
+        # and the list of revisions
+        self.pages = {}
+        # times of the last edits, for the rate limit
+        self.edits = collections.deque()
+        # valid session cookies
+        self.sessions = set()
+        self.token = 'fake+\\'
+        # counters
+        self.requests = 0
+        self.editCount = 0
+
+        self.createPage('Template:Bench', 'Benchmark template')
+        self.createPage('Category:Bench', 'Benchmark category' +
+                ('\n[[Category:Bench sub 1]]' if subcategories > 0 else ''))
+        for i in range(1, subcategories + 1):
+            self.createPage('Category:Bench sub %d' % i,
+                    'Benchmark subcategory\n[[Category:Bench]]')
+        for i in range(1, pages + 1):
+            content = ('{{Bench}}\nText of page %d, see [[Page 1]] and '
+                    '[[Page %d]].\n[[Category:Bench]]' % (i, i + 1))
+            if subcategories > 0:
+                content += '\n[[Category:Bench sub %d]]' % (
+                        i % subcategories + 1)
+            self.createPage('Page %d' % i, content)
+
+        wiki = self
+
+        class Handler(RequestHandler):
+            server_wiki = wiki
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def address(self):
+        """ Address of the api.php endpoint.
+        """
+        return 'http://127.0.0.1:%d/w/api.php' % self.server.server_port
+
+    def start(self):
+        """ Start serving in a background thread.
+        """
+        self.thread = threading.Thread(
+                target=self.server.serve_forever,
+                daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """ Stop the server.
+        """
+        self.server.shutdown()
+        self.server.server_close()
+
+    ## WIKI CONTENT
+
+    def createPage(self, title, content):
+        """ Create a page with a single revision.
+
+        Parameters
+        ----------
+        title : str
+            Normalized title of the page.
+        content : str
+            Content of the page.
+        """
+        self.pages[title] = {
+            'pageid': self.nextPageid,
+            'revisions': []
+        }
+        self.nextPageid += 1
+        self.addRevision(title, content)
+
+    def addRevision(self, title, content):
+        """ Add a revision to a page, returning its metadata.
+
+        Parameters
+        ----------
+        title : str
+            Normalized title of the page.
+        content : str
+            Content of the revision.
+        """
+        page = self.pages[title]
+        revisions = page['revisions']
+        revision = {
+            'revid': self.nextRevid,
+            'parentid': revisions[-1]['revid'] if revisions else 0,
+            'timestamp': timestamp(),
+            'content': content
+        }
+        self.nextRevid += 1
+        revisions.append(revision)
+
+        # index of the links, transclusions and categories
+        page['links'] = set(normalize(t) for t in
+                re.findall(r'\[\[([^\]|#]+)', content)
+                if not t.startswith('Category:'))
+        page['templates'] = set('Template:' + normalize(t) for t in
+                re.findall(r'\{\{([^}|]+)', content))
+        page['categories'] = set(normalize(t) for t in
+                re.findall(r'\[\[(Category:[^\]|]+)', content))
+        redirect = re.match(r'#REDIRECT\s*\[\[([^\]|#]+)', content, re.I)
+        page['redirect'] = normalize(redirect.group(1)) if redirect else None
+        return revision
+
+    def protect(self, title, level):
+        """ Protect a page against the edits of the users without the
+        right corresponding to a level.
+
+        Parameters
+        ----------
+        title : str
+            Normalized title of the page.
+        level : str
+            Protection level, such as autoconfirmed or sysop.
+        """
+        self.pages[title]['protection'] = [{
+            'type': 'edit',
+            'level': level,
+            'expiry': 'infinity'
+        }]
+
+    def lastRevision(self, title):
+        """ Return the last revision of a page.
+
+        Parameters
+        ----------
+        title : str
+            Normalized title of the page.
+        """
+        return self.pages[title]['revisions'][-1]
+
+    ## REQUEST HANDLING
+
+    def handle(self, params, cookies):
+        """ Execute an API request, returning the response and the cookies
+        to be set.
+
+        Parameters
+        ----------
+        params : dict
+            Parameters of the request.
+        cookies : dict
+            Cookies of the request.
+        """
+
+        with self.lock:
+            self.requests += 1
+            failure = self.random.random() < self.errorRate
+
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+        if failure:
+            if self.random.random() < 0.5:
+                raise ApiError('internal_api_error_DBQueryError',
+                        'Injected database error')
+            raise ApiError('http', 'Injected failure', status=503,
+                    headers={'Retry-After': '0'})
+
+        if 'maxlag' in params and self.lag > float(params['maxlag']):
+            raise ApiError('maxlag',
+                    'Waiting for a database server: %.0f seconds lagged'
+                    % self.lag,
+                    headers={'Retry-After': '1'})
+
+        loggedIn = cookies.get('fakewikisession') in self.sessions
+        if params.get('assert') == 'user' and not loggedIn:
+            raise ApiError('assertuserfailed', 'You are no longer logged in')
+
+        action = params.get('action', '')
+        with self.lock:
+            if action == 'login':
+                return self.login(params)
+            if action == 'logout':
+                self.sessions.discard(cookies.get('fakewikisession'))
+                return {}, {}
+            if action == 'query':
+                return self.query(params, loggedIn), {}
+            if action == 'edit':
+                return self.edit(params, loggedIn), {}
+        raise ApiError('badvalue', 'Unrecognized action: %s' % action)
+
+    def login(self, params):
+        """ Implement action=login.
+        """
+        if 'lgtoken' not in params:
+            return {'login': {'result': 'NeedToken', 'token': 'logintoken'}}, {}
+        if params['lgtoken'] != 'logintoken':
+            return {'login': {'result': 'WrongToken'}}, {}
+        session = '%016x' % self.random.getrandbits(64)
+        self.sessions.add(session)
+        return {
+            'login': {
+                'result': 'Success',
+                'lgusername': params.get('lgname', '')
+            }
+        }, {'fakewikisession': session}
+
+    def limit(self, params, name):
+        """ Return the value of a limit parameter.
+
+        Parameters
+        ----------
+        params : dict
+            Parameters of the request.
+        name : str
+            Name of the limit parameter.
+        """
+        maximum = 5000 if self.highLimits else 500
+        value = params.get(name, '10')
+        if value == 'max':
+            return maximum
+        return max(1, min(maximum, int(value)))
+
+    def titles(self, params):
+        """ Return the list of titles requested by a query, with the list of
+        normalizations applied.
+
+        Parameters
+        ----------
+        params : dict
+            Parameters of the request.
+        """
+        titles = []
+        normalized = []
+        for title in params.get('titles', '').split('|'):
+            if title == '':
+                continue
+            norm = normalize(title)
+            if norm != title:
+                normalized.append({'from': title, 'to': norm})
+            titles.append(norm)
+        maximum = 500 if self.highLimits else 50
+        if len(titles) > maximum:
+            raise ApiError('toomanyvalues',
+                    'Too many values supplied for parameter "titles"')
+        return titles, normalized
+
+    def query(self, params, loggedIn):
+        """ Implement action=query.
+        """
+        res = {'batchcomplete': ''}
+        query = {}
+
+        if 'curtimestamp' in params:
+            res['curtimestamp'] = timestamp()
+
+        meta = params.get('meta', '').split('|')
+        if 'tokens' in meta:
+            query['tokens'] = {'csrftoken': self.token if loggedIn else '+\\'}
+        if 'userinfo' in meta:
+            rights = ['read', 'edit']
+            if self.highLimits:
+                rights.append('apihighlimits')
+            query['userinfo'] = {
+                'id': 1 if loggedIn else 0,
+                'name': 'Bench' if loggedIn else '127.0.0.1',
+                'rights': rights
+            }
+            if not loggedIn:
+                query['userinfo']['anon'] = ''
+            uiprop = params.get('uiprop', '').split('|')
+            if 'ratelimits' in uiprop and self.editLimit is not None:
+                count, period = self.editLimit
+                query['userinfo']['ratelimits'] = {
+                    'edit': {'user': {'hits': count, 'seconds': period}}
+                }
+        if 'siteinfo' in meta:
+            query['general'] = {
+                'sitename': 'FakeWiki',
+                'generator': 'MediaWiki 1.35.0'
+            }
+            query['namespaces'] = {
+                str(number): {'id': number, '*': name}
+                for name, number in list(NAMESPACES.items()) + [('', 0)]
+            }
+
+        titles, normalized = self.titles(params)
+        if len(normalized) > 0:
+            query['normalized'] = normalized
+        if 'redirects' in params:
+            redirects = [{'from': t, 'to': self.pages[t]['redirect']}
+                    for t in titles
+                    if t in self.pages and self.pages[t]['redirect']]
+            if len(redirects) > 0:
+                query['redirects'] = redirects
+                targets = {r['from']: r['to'] for r in redirects}
+                titles = list(dict.fromkeys(targets.get(t, t) for t in titles))
+
+        generator = params.get('generator', '')
+        if generator in PREFIXES:
+            # the pages of the query are the current batch of the list
+            prefix = 'g' + PREFIXES[generator]
+            titles = [t for t in self.paginate(res, None, None,
+                    self.listItems(generator, params, prefix, titles),
+                    params, prefix) if t in self.pages]
+
+        prop = params.get('prop', '').split('|')
+        if len(titles) > 0:
+            query['pages'] = {}
+            query['pageids'] = []
+            missing = -1
+            for title in titles:
+                if title not in self.pages:
+                    query['pages'][str(missing)] = {
+                        'ns': namespace(title),
+                        'title': title,
+                        'missing': ''
+                    }
+                    query['pageids'].append(str(missing))
+                    missing -= 1
+                    continue
+                page = self.pageObject(title, prop, params)
+                query['pages'][str(page['pageid'])] = page
+                query['pageids'].append(str(page['pageid']))
+            if 'indexpageids' not in params:
+                del query['pageids']
+            if 'links' in prop and len(titles) == 1 and titles[0] in self.pages:
+                self.paginate(
+                        res,
+                        query['pages'][str(self.pages[titles[0]]['pageid'])],
+                        'links',
+                        self.listItems('links', params, 'pl', titles),
+                        params,
+                        'pl')
+
+        # revisions requested by id, possibly older than the last ones
+        for revid in params.get('revids', '').split('|'):
+            if revid == '':
+                continue
+            for title, page in self.pages.items():
+                revision = [r for r in page['revisions']
+                        if r['revid'] == int(revid)]
+                if len(revision) > 0:
+                    query.setdefault('pages', {})[str(page['pageid'])] = \
+                            self.pageObject(title, prop, params, revision[0])
+                    break
+            else:
+                query.setdefault('badrevids', {})[revid] = {
+                    'revid': int(revid),
+                    'missing': ''
+                }
+
+        lists = params.get('list', '')
+        if lists == 'search' and \
+                'totalhits' in params.get('srinfo', 'totalhits').split('|'):
+            query['searchinfo'] = {'totalhits': len(self.search(
+                    params.get('srsearch', ''),
+                    params.get('srnamespace', '0')))}
+        if lists in PREFIXES and lists != 'links':
+            self.paginate(res, query, lists,
+                    self.listItems(lists, params, PREFIXES[lists], titles),
+                    params, PREFIXES[lists])
+
+        if len(query) > 0:
+            res['query'] = query
+        return res
+
+    def listItems(self, module, params, prefix, titles):
+        """ Return all the titles of a list module.
+
+        Parameters
+        ----------
+        module : str
+            Name of the list module.
+        params : dict
+            Parameters of the request.
+        prefix : str
+            Prefix of the parameters of the module.
+        titles : list of str
+            Titles of the query, used by the links module.
+        """
+        if module == 'links':
+            if len(titles) != 1 or titles[0] not in self.pages:
+                return []
+            return sorted(self.pages[titles[0]]['links'])
+
+        if module == 'search':
+            return self.search(params.get(prefix + 'search', ''),
+                    params.get(prefix + 'namespace', '0'))[:SEARCH_MAX_OFFSET]
+
+        target = normalize(params.get(prefix + 'title', ''))
+        if module == 'backlinks':
+            return sorted(t for t, p in self.pages.items()
+                    if target in p['links'])
+        if module == 'embeddedin':
+            return sorted(t for t, p in self.pages.items()
+                    if target in p['templates'])
+        types = params.get(prefix + 'type', 'page|subcat|file').split('|')
+        return sorted(t for t, p in self.pages.items()
+                if target in p['categories']
+                and ('subcat' if namespace(t) == 14 else 'page') in types)
+
+    def search(self, text, namespaces):
+        """ Return the titles of all the pages matching a search, supporting
+        the insource:/regex/ and incategory: keywords, in title order.
+
+        Parameters
+        ----------
+        text : str
+            Text of the search.
+        namespaces : str
+            Numbers of the namespaces to be searched, separated by pipes.
+        """
+        match = re.search(r'insource:/((?:\\.|[^\\/])*)/(i?)', text)
+        if match is None:
+            raise ApiError('badvalue', 'Only insource regex searches are '
+                    'supported')
+        regex = luceneRegex(match.group(1), match.group(2) == 'i')
+        categories = [normalize('Category:' + c.strip('"')) for c in
+                re.findall(r'incategory:("[^"]*"|\S+)', text)]
+        numbers = {int(n) for n in namespaces.split('|')}
+        return sorted(t for t, p in self.pages.items()
+                if namespace(t) in numbers
+                and all(c in p['categories'] for c in categories)
+                and regex.search(p['revisions'][-1]['content']))
+
+    def pageObject(self, title, prop, params, revision=None):
+        """ Return the object describing an existing page in a query.
+
+        Parameters
+        ----------
+        title : str
+            Normalized title of the page.
+        prop : list of str
+            Requested properties.
+        params : dict
+            Parameters of the request.
+        revision : dict optional
+            Revision to be returned. By default, the last one.
+        """
+        page = self.pages[title]
+        last = page['revisions'][-1]
+        if revision is None:
+            revision = last
+        obj = {
+            'pageid': page['pageid'],
+            'ns': namespace(title),
+            'title': title
+        }
+        if 'info' in prop:
+            obj.update({
+                'contentmodel': 'wikitext',
+                'touched': last['timestamp'],
+                'lastrevid': last['revid'],
+                'length': len(last['content'].encode('utf-8'))
+            })
+            if page['redirect']:
+                obj['redirect'] = ''
+            if 'protection' in params.get('inprop', '').split('|'):
+                obj['protection'] = page.get('protection', [])
+        if 'revisions' in prop:
+            rvprop = params.get('rvprop', 'ids|timestamp|flags|comment|user')
+            rvprop = rvprop.split('|')
+            item = {}
+            if 'ids' in rvprop:
+                item['revid'] = revision['revid']
+                item['parentid'] = revision['parentid']
+            if 'timestamp' in rvprop:
+                item['timestamp'] = revision['timestamp']
+            if 'size' in rvprop:
+                item['size'] = len(revision['content'].encode('utf-8'))
+            if 'content' in rvprop:
+                content = {
+                    'contentmodel': 'wikitext',
+                    'contentformat': 'text/x-wiki',
+                    '*': revision['content']
+                }
+                if 'rvslots' in params:
+                    item['slots'] = {'main': content}
+                else:
+                    item.update(content)
+            obj['revisions'] = [item]
+        return obj
+
+    def paginate(self, res, container, key, items, params, prefix):
+        """ Put in a container the items of the current batch of a list,
+        setting the continuation of the response, and return the titles of
+        the batch.
+
+        Parameters
+        ----------
+        res : dict
+            Whole response.
+        container : dict
+            Object containing the list in the response, or None for a
+            generator.
+        key : str
+            Name of the list in the container.
+        items : list of str
+            All the titles of the list.
+        params : dict
+            Parameters of the request.
+        prefix : str
+            Prefix of the parameters of the list module.
+        """
+        # the search module continues with an offset
+        name = prefix + ('offset' if prefix.endswith('sr') else 'continue')
+        start = int(params.get(name, '0') or '0')
+        limit = self.limit(params, prefix + 'limit')
+        batch = items[start : start + limit]
+        if container is not None:
+            container[key] = [
+                {'pageid': self.pages[t]['pageid'] if t in self.pages else 0,
+                    'ns': namespace(t),
+                    'title': t}
+                for t in batch]
+        if start + limit < len(items):
+            res.setdefault('continue', {'continue': '-||'})
+            res['continue'][name] = str(start + limit)
+            res.pop('batchcomplete', None)
+        return batch
+
+    def edit(self, params, loggedIn):
+        """ Implement action=edit.
+        """
+        if params.get('token') != self.token or not loggedIn:
+            raise ApiError('badtoken', 'Invalid CSRF token')
+
+        if self.editLimit is not None:
+            count, period = self.editLimit
+            now = time.monotonic()
+            while len(self.edits) > 0 and self.edits[0] < now - period:
+                self.edits.popleft()
+            if len(self.edits) >= count:
+                raise ApiError('ratelimited',
+                        "You've exceeded your rate limit",
+                        headers={'Retry-After': '%.0f' % (
+                            self.edits[0] + period - now)})
+            self.edits.append(now)
+
+        title = normalize(params.get('title', ''))
+        if title not in self.pages:
+            if 'nocreate' in params:
+                raise ApiError('missingtitle',
+                        "The page you specified doesn't exist")
+            self.pages[title] = {'pageid': self.nextPageid, 'revisions': []}
+            self.nextPageid += 1
+            last = None
+        else:
+            last = self.lastRevision(title)
+            if len(self.pages[title].get('protection', [])) > 0:
+                raise ApiError('protectedpage',
+                        'This page has been protected to prevent editing')
+
+        if last is not None:
+            baserevid = params.get('baserevid')
+            basetimestamp = params.get('basetimestamp')
+            if ((baserevid and int(baserevid) != last['revid']) or
+                    (not baserevid and basetimestamp and
+                        basetimestamp < last['timestamp'])):
+                raise ApiError('editconflict', 'Edit conflict detected')
+            if params.get('text', '') == last['content']:
+                return {
+                    'edit': {
+                        'result': 'Success',
+                        'pageid': self.pages[title]['pageid'],
+                        'title': title,
+                        'nochange': ''
+                    }
+                }
+
+        revision = self.addRevision(title, params.get('text', ''))
+        self.editCount += 1
+        return {
+            'edit': {
+                'result': 'Success',
+                'pageid': self.pages[title]['pageid'],
+                'title': title,
+                'oldrevid': revision['parentid'],
+                'newrevid': revision['revid'],
+                'newtimestamp': revision['timestamp']
+            }
+        }
+
+class RequestHandler(BaseHTTPRequestHandler):
+    """ HTTP handler forwarding the requests to the FakeWiki.
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    # wiki serving the requests, set by the FakeWiki
+    server_wiki = None
+
+    def do_GET(self):
+        """ Handle a GET request.
+        """
+        url = urllib.parse.urlsplit(self.path)
+        self.dispatch(url.path, url.query)
+
+    def do_POST(self):
+        """ Handle a POST request.
+        """
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length).decode('utf-8')
+        url = urllib.parse.urlsplit(self.path)
+        query = url.query + '&' + body if url.query else body
+        self.dispatch(url.path, query)
+
+    def dispatch(self, path, query):
+        """ Serve a request.
+
+        Parameters
+        ----------
+        path : str
+            Path of the request.
+        query : str
+            Parameters of the request, URL encoded.
+        """
+        wiki = self.server_wiki
+        params = dict(urllib.parse.parse_qsl(query, keep_blank_values=True))
+        cookies = {}
+        for item in self.headers.get('Cookie', '').split(';'):
+            if '=' in item:
+                key, value = item.strip().split('=', 1)
+                cookies[key] = value
+
+        if path.startswith('/wiki/') and params.get('action') == 'raw':
+            title = normalize(urllib.parse.unquote(path[len('/wiki/'):]))
+            with wiki.lock:
+                wiki.requests += 1
+                found = title in wiki.pages
+                content = wiki.lastRevision(title)['content'] if found else ''
+            if wiki.latency > 0:
+                time.sleep(wiki.latency)
+            self.reply(200 if found else 404, content.encode('utf-8'),
+                    'text/x-wiki; charset=UTF-8')
+            return
+
+        if path != '/w/api.php':
+            self.reply(404, b'', 'text/plain')
+            return
+
+        headers = {}
+        setCookies = {}
+        status = 200
+        try:
+            res, setCookies = wiki.handle(params, cookies)
+        except ApiError as e:
+            res = {'error': {'code': e.code, 'info': e.info}}
+            headers = dict(e.headers)
+            headers['MediaWiki-API-Error'] = e.code
+            status = e.status
+
+        body = json.dumps(res).encode('utf-8')
+        for key, value in setCookies.items():
+            headers['Set-Cookie'] = '%s=%s; Path=/' % (key, value)
+        self.reply(status, body, 'application/json; charset=utf-8', headers)
+
+    def reply(self, status, body, contentType, headers={}):
+        """ Send a response.
+
+        Parameters
+        ----------
+        status : int
+            HTTP status.
+        body : bytes
+            Body of the response.
+        contentType : str
+            Content type of the body.
+        headers : dict optional
+            Additional headers.
+        """
+        self.send_response(status)
+        self.send_header('Content-Type', contentType)
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except ConnectionError:
+            # the client aborted the request
+            self.close_connection = True
+
+    def log_message(self, format, *args):
+        """ Do not log the requests.
+        """
+        pass
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--pages', type=int, default=1000)
+    parser.add_argument('--latency', type=float, default=0.0,
+            help='delay added to each request, in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+            help='fraction of requests failing with a transient error')
+    parser.add_argument('--lag', type=float, default=0.0,
+            help='simulated replication lag, in seconds')
+    parser.add_argument('--edit-limit', type=int, nargs=2, default=None,
+            metavar=('EDITS', 'SECONDS'),
+            help='maximum number of edits in a period')
+    parser.add_argument('--high-limits', action='store_true',
+            help='grant the apihighlimits right')
+    args = parser.parse_args()
+
+    wiki = FakeWiki(
+            pages=args.pages,
+            latency=args.latency,
+            errorRate=args.error_rate,
+            lag=args.lag,
+            editLimit=args.edit_limit,
+            highLimits=args.high_limits,
+            port=args.port)
+    print('Serving on %s' % wiki.address)
+    try:
+        wiki.server.serve_forever()
+    except KeyboardInterrupt:
+        wiki.stop()
@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+
+# This file is part of wikied.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (C) 2016 Martino Pilia <martino.pilia@gmail.com>
+
+""" End-to-end throughput benchmark of the network layer.
+
+The benchmark drives the Connection, and the queue workflow of the
+VoiceSelector and VoiceEditor, against a local FakeWiki, reporting the
+number of pages and edits processed each second.
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from PyQt5.QtCore import QSettings, Qt, QTimer
+from PyQt5.QtWidgets import QApplication
+
+from Connection import Connection
+from Diff import Diff
+from FakeWiki import FakeWiki
+from VoiceEditor import VoiceEditor
+from VoiceSelector import VoiceSelector
+
+def makeSettings(wiki, args, directory):
+    """ Return a settings object pointing to the fake wiki.
+
+    Parameters
+    ----------
+    wiki : FakeWiki
+        Wiki used for the benchmark.
+    args : argparse.Namespace
+        Command line arguments.
+    directory : str
+        Directory for the settings file and the cache.
+    """
+    settings = QSettings(
+            os.path.join(directory, 'wikied.ini'),
+            QSettings.IniFormat)
+    settings.setValue('connection/api', wiki.address)
+    settings.setValue('connection/username', 'Bench')
+    settings.setValue('connection/password', 'bench')
+    settings.setValue('connection/workers', args.workers)
+    settings.setValue('connection/transport', args.transport)
+    settings.setValue('cache/enabled', args.cache)
+    settings.setValue('cache/path', os.path.join(directory, 'pages.sqlite'))
+    settings.setValue('checkpoint/path',
+            os.path.join(directory, 'checkpoints.sqlite'))
+    settings.setValue('session/path', os.path.join(directory, 'sessions.json'))
+    settings.setValue('offline/path', os.path.join(directory, 'offline.sqlite'))
+    settings.setValue('scheduler/readrate', args.read_rate)
+    settings.setValue('scheduler/editrate', args.edit_rate)
+    settings.setValue('selector/prefetch', args.prefetch)
+    return settings
+
+def connect(settings):
+    """ Return a Connection logged in the fake wiki.
+
+    Parameters
+    ----------
+    settings : QSettings
+        Settings object pointing to the fake wiki.
+    """
+    connection = Connection(settings)
+    connection.connectFunction()
+    if not connection.isConnected:
+        raise RuntimeError('Login to the fake wiki failed')
+    return connection
+
+def wait(event, timeout):
+    """ Wait for an event, failing after a timeout.
+
+    Parameters
+    ----------
+    event : threading.Event
+        Event to wait for.
+    timeout : float
+        Maximum waiting time, in seconds.
+    """
+    if not event.wait(timeout):
+        raise RuntimeError('Benchmark timed out')
+
+def forget(connection):
+    """ Drop the memorized responses and the cached pages, so the following
+    pass measures the requests to the wiki.
+
+    Parameters
+    ----------
+    connection : Connection
+        Connection used for the benchmark.
+    """
+    connection.coalescer.clear()
+    if connection.cache is not None:
+        connection.cache.clear()
+
+def benchList(connection, args):
+    """ Enumerate the members of the benchmark category, returning the
+    number of titles received each second.
+    """
+    done = threading.Event()
+    count = [0]
+
+    def receive(request, voices):
+        count[0] += len(voices)
+
+    connection.voicesReceived.connect(receive, Qt.DirectConnection)
+    connection.listFinished.connect(
+            lambda request, n: done.set(), Qt.DirectConnection)
+
+    start = time.monotonic()
+    connection.getCategorymembers('Category:Bench')
+    wait(done, args.timeout)
+    elapsed = time.monotonic() - start
+
+    connection.voicesReceived.disconnect(receive)
+    connection.listFinished.disconnect()
+    return count[0] / elapsed
+
+def benchSingleFetch(connection, titles, args):
+    """ Load the pages one request at a time, returning the number of pages
+    loaded each second.
+    """
+    # measure the requests, not the memorized or cached responses
+    forget(connection)
+    done = threading.Event()
+    lock = threading.Lock()
+    count = [0]
+
+    def receive(*a):
+        with lock:
+            count[0] += 1
+            if count[0] == len(titles):
+                done.set()
+
+    connection.pageContentReceived.connect(receive, Qt.DirectConnection)
+    connection.pageContentUnavailable.connect(receive, Qt.DirectConnection)
+
+    start = time.monotonic()
+    for title in titles:
+        connection.getPageContent(title)
+    wait(done, args.timeout)
+    elapsed = time.monotonic() - start
+
+    connection.pageContentReceived.disconnect(receive)
+    connection.pageContentUnavailable.disconnect(receive)
+    return len(titles) / elapsed
+
+def benchBatchFetch(connection, titles, args):
+    """ Load the pages with the batch API, returning the number of pages
+    loaded each second.
+    """
+    # measure the requests, not the memorized or cached responses
+    forget(connection)
+    done = threading.Event()
+    lock = threading.Lock()
+    count = [0]
+
+    def receive(*a):
+        with lock:
+            count[0] += 1
+            if count[0] == len(titles):
+                done.set()
+
+    connection.pageDataReceived.connect(receive, Qt.DirectConnection)
+    connection.pageDataUnavailable.connect(receive, Qt.DirectConnection)
+
+    start = time.monotonic()
+    connection.getPagesContent(titles)
+    wait(done, args.timeout)
+    elapsed = time.monotonic() - start
+
+    connection.pageDataReceived.disconnect(receive)
+    connection.pageDataUnavailable.disconnect(receive)
+    return len(titles) / elapsed
+
+def benchLoadedFetch(connection, titles, args):
+    """ Load the pages one at a time while a category tree is being
+    crawled, returning the mean latency of a page load in milliseconds.
+    """
+    # measure the scheduling of the requests, not the memorized or cached
+    # responses
+    forget(connection)
+    done = threading.Event()
+    received = threading.Event()
+
+    def receive(*a):
+        received.set()
+
+    connection.pageContentReceived.connect(receive, Qt.DirectConnection)
+    connection.pageContentUnavailable.connect(receive, Qt.DirectConnection)
+    connection.listFinished.connect(
+            lambda request, n: done.set(), Qt.DirectConnection)
+
+    connection.getCategoryTree('Category:Bench', 2)
+    start = time.monotonic()
+    for title in titles:
+        received.clear()
+        connection.getPageContent(title)
+        wait(received, args.timeout)
+    elapsed = time.monotonic() - start
+    wait(done, args.timeout)
+
+    connection.pageContentReceived.disconnect(receive)
+    connection.pageContentUnavailable.disconnect(receive)
+    connection.listFinished.disconnect()
+    return elapsed / len(titles) * 1000
+
+def benchEdits(connection, titles, args):
+    """ Save an edit for each page through the save queue, returning the
+    number of edits saved each second.
+    """
+    done = threading.Event()
+
+    def pending(n):
+        if n == 0:
+            done.set()
+
+    connection.saveQueue.pendingChanged.connect(pending, Qt.DirectConnection)
+
+    start = time.monotonic()
+    for title in titles:
+        connection.saveQueue.enqueue(
+                title,
+                'Edited by the benchmark at %f' % time.time(),
+                'Benchmark')
+    wait(done, args.timeout)
+    elapsed = time.monotonic() - start
+
+    connection.saveQueue.pendingChanged.disconnect(pending)
+    return len(titles) / elapsed
+
+def benchWorkflow(app, connection, titles, args):
+    """ Go through a queue of voices with "Save and next", as a user would
+    do, returning the number of voices processed each second and the
+    number of edits saved each second, including the time to drain the
+    save queue.
+    """
+    editor = VoiceEditor(connection, Diff())
+    selector = VoiceSelector(connection, editor)
+    count = [0]
+    times = {}
+
+    def voiceShown(title):
+        if title == '':
+            # the queue is empty
+            times['queue'] = time.monotonic()
+            if connection.saveQueue.count == 0:
+                app.quit()
+            return
+        count[0] += 1
+        editor.pageContent.appendPlainText('Workflow edit')
+        QTimer.singleShot(0, editor.saveAndNextVoice)
+
+    def pending(n):
+        if n == 0 and 'queue' in times:
+            app.quit()
+
+    editor.pageTitle.textChanged.connect(voiceShown)
+    connection.saveQueue.pendingChanged.connect(pending)
+    QTimer.singleShot(int(args.timeout * 1000), app.quit)
+
+    selector.voicesList.addItems(titles)
+    start = time.monotonic()
+    selector.loadVoice(selector.voicesList.item(0))
+    app.exec_()
+    end = time.monotonic()
+
+    connection.saveQueue.pendingChanged.disconnect(pending)
+    if 'queue' not in times:
+        raise RuntimeError('Benchmark timed out')
+    return (count[0] / (times['queue'] - start), count[0] / (end - start))
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--pages', type=int, default=2000,
+            help='number of pages of the fake wiki')
+    parser.add_argument('--sample', type=int, default=200,
+            help='number of pages loaded and edited')
+    parser.add_argument('--latency', type=float, default=0.02,
+            help='delay added to each request, in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+            help='fraction of requests failing with a transient error')
+    parser.add_argument('--lag', type=float, default=0.0,
+            help='simulated replication lag, in seconds')
+    parser.add_argument('--edit-limit', type=int, nargs=2, default=None,
+            metavar=('EDITS', 'SECONDS'),
+            help='maximum number of edits in a period')
+    parser.add_argument('--high-limits', action='store_true',
+            help='grant the apihighlimits right')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--transport', default='threads',
+            choices=['threads', 'asyncio'])
+    parser.add_argument('--cache', action='store_true',
+            help='enable the page cache')
+    parser.add_argument('--prefetch', type=int, default=5)
+    parser.add_argument('--read-rate', type=float, default=1000.0)
+    parser.add_argument('--edit-rate', type=float, default=1000.0)
+    parser.add_argument('--timeout', type=float, default=600.0)
+    parser.add_argument('--json', metavar='PATH',
+            help='write the results to a JSON file')
+    args = parser.parse_args()
+
+    app = QApplication(sys.argv)
+
+    wiki = FakeWiki(
+            pages=args.pages,
+            latency=args.latency,
+            errorRate=args.error_rate,
+            lag=args.lag,
+            editLimit=args.edit_limit,
+            highLimits=args.high_limits)
+    wiki.start()
+
+    titles = ['Page %d' % i for i in range(1, min(args.sample, args.pages) + 1)]
+    results = {}
+
+    with tempfile.TemporaryDirectory() as directory:
+        connection = connect(makeSettings(wiki, args, directory))
+        try:
+            results['list titles/s'] = benchList(connection, args)
+            results['single fetch pages/s'] = benchSingleFetch(
+                    connection, titles, args)
+            results['batch fetch pages/s'] = benchBatchFetch(
+                    connection, titles, args)
+            results['fetch under load ms'] = benchLoadedFetch(
+                    connection, titles[:20], args)
+            results['save queue edits/s'] = benchEdits(
+                    connection, titles, args)
+            voices, edits = benchWorkflow(app, connection, titles, args)
+            results['workflow pages/s'] = voices
+            results['workflow edits/s'] = edits
+        finally:
+            connection.shutdown()
+
+    results['requests'] = wiki.requests
+    wiki.stop()
+
+    for name, value in results.items():
+        print('%-24s %10.1f' % (name, value))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
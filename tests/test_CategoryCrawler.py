@@ -0,0 +1,113 @@
+# This file is part of wikied.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (C) 2016 Martino Pilia <martino.pilia@gmail.com>
+import threading
+import unittest
+
+from CategoryCrawler import CategoryCrawler
+from RequestHandle import RequestHandle
+
+# members of each category of the tree, with their namespace
+TREE = {
+    'Category:Root': [('A', 0), ('Category:Sub 1', 14), ('Category:Sub 2', 14)],
+    'Category:Sub 1': [('B', 0), ('A', 0), ('Category:Root', 14)],
+    'Category:Sub 2': [('C', 0), ('Category:Sub 3', 14)],
+    'Category:Sub 3': [('D', 0)],
+}
+
+class Pool:
+    """ Pool running each task in a new thread.
+    """
+
+    def __init__(self):
+        self.threads = []
+
+    def submit(self, function, *args, priority=None, handle=None):
+        t = threading.Thread(target=function, args=args)
+        self.threads.append(t)
+        t.start()
+
+class Planner:
+
+    def listLimit(self):
+        return 'max'
+
+class Signal:
+
+    def emit(self, *args):
+        pass
+
+class Wiki:
+    """ Connection answering the category queries from the tree.
+    """
+
+    def __init__(self):
+        self.pool = Pool()
+        self.planner = Planner()
+        self.statusMessage = Signal()
+
+    def iterateQuery(self, data):
+        members = [{'title': title, 'ns': ns}
+                for title, ns in TREE.get(data['cmtitle'], [])
+                if ns == 0 or 'subcat' in data['cmtype']]
+        yield {'query': {'categorymembers': members}}
+
+class CategoryCrawlerTest(unittest.TestCase):
+    """ Tests for the recursive crawl of a category tree.
+    """
+
+    def crawl(self, depth, fanout):
+        wiki = Wiki()
+        sent = []
+        finished = []
+        done = threading.Event()
+        def finish(count):
+            finished.append(count)
+            done.set()
+        crawler = CategoryCrawler(wiki, RequestHandle(), 'Category:Root',
+                depth, fanout, sent.extend, finish)
+        crawler.start()
+        self.assertTrue(done.wait(5))
+        for t in list(wiki.pool.threads):
+            t.join()
+        return sent, finished
+
+    def testPagesAreSentOnce(self):
+        sent, finished = self.crawl(5, 3)
+        self.assertEqual(sorted(sent), ['A', 'B', 'C', 'D'])
+        self.assertEqual(finished, [4])
+
+    def testDepthIsLimited(self):
+        sent, finished = self.crawl(1, 2)
+        self.assertEqual(sorted(sent), ['A', 'B', 'C'])
+        self.assertEqual(finished, [3])
+
+    def testFinishIsReportedOnce(self):
+        finished = []
+        crawler = CategoryCrawler(Wiki(), RequestHandle(), 'Category:Root',
+                0, 2, None, finished.append)
+        crawler.queue.clear()
+        crawler.running = 2
+        # two tasks end one after the other, then both schedule
+        for _ in range(2):
+            with crawler.lock:
+                crawler.running -= 1
+        crawler.schedule()
+        crawler.schedule()
+        self.assertEqual(finished, [0])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,161 @@
+# This file is part of wikied.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (C) 2016 Martino Pilia <martino.pilia@gmail.com>
+import threading
+import time
+import unittest
+
+from Coalescer import Coalescer
+from RequestHandle import Cancelled, RequestHandle
+
+class CoalescerTest(unittest.TestCase):
+    """ Tests for the sharing of the results of identical operations.
+    """
+
+    def setUp(self):
+        self.calls = 0
+
+    def operation(self, value='result'):
+        def function():
+            self.calls += 1
+            return value
+        return function
+
+    def testResultIsReused(self):
+        coalescer = Coalescer(ttl=60)
+        self.assertEqual(coalescer.run('k', self.operation()), 'result')
+        self.assertEqual(coalescer.run('k', self.operation()), 'result')
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(coalescer.memoHits, 1)
+        coalescer.run('other', self.operation())
+        self.assertEqual(self.calls, 2)
+
+    def testNoMemo(self):
+        coalescer = Coalescer(ttl=0)
+        coalescer.run('k', self.operation())
+        coalescer.run('k', self.operation())
+        self.assertEqual(self.calls, 2)
+
+        coalescer = Coalescer(ttl=60)
+        coalescer.run('k', self.operation(), memo=lambda value: False)
+        coalescer.run('k', self.operation())
+        self.assertEqual(self.calls, 4)
+
+    def testSizeIsBounded(self):
+        coalescer = Coalescer(ttl=60, size=2)
+        for key in ('a', 'b', 'c'):
+            coalescer.run(key, self.operation())
+        self.assertEqual(list(coalescer.memo), ['b', 'c'])
+
+    def testExpiredResultsArePruned(self):
+        coalescer = Coalescer(ttl=0.05)
+        coalescer.run('a', self.operation())
+        time.sleep(0.1)
+        coalescer.run('b', self.operation())
+        self.assertEqual(list(coalescer.memo), ['b'])
+
+    def testCapacityIsBounded(self):
+        coalescer = Coalescer(ttl=60, capacity=10, weigh=len)
+        coalescer.run('a', self.operation('aaaa'))
+        coalescer.run('b', self.operation('bbbb'))
+        coalescer.run('c', self.operation('cccc'))
+        self.assertEqual(list(coalescer.memo), ['b', 'c'])
+        self.assertEqual(coalescer.bytes, 8)
+        # too large to be kept
+        coalescer.run('d', self.operation('d' * 11))
+        self.assertNotIn('d', coalescer.memo)
+        self.assertEqual(coalescer.bytes, 8)
+        coalescer.clear()
+        self.assertEqual(coalescer.bytes, 0)
+
+    def testClear(self):
+        coalescer = Coalescer(ttl=60)
+        coalescer.run('k', self.operation())
+        flight, leader = coalescer.claim('pending')
+        self.assertTrue(leader)
+        coalescer.clear()
+        coalescer.resolve('pending', flight, 'old')
+        self.assertEqual(len(coalescer.memo), 0)
+        coalescer.run('k', self.operation())
+        self.assertEqual(self.calls, 2)
+
+    def testConcurrentCallersShare(self):
+        coalescer = Coalescer(ttl=0)
+        flight, leader = coalescer.claim('k')
+        self.assertTrue(leader)
+
+        results = []
+        def wait():
+            results.append(coalescer.run('k', self.operation('repeated')))
+        threads = [threading.Thread(target=wait) for _ in range(3)]
+        for t in threads:
+            t.start()
+        while coalescer.shared < 3:
+            time.sleep(0.01)
+        coalescer.resolve('k', flight, 'shared')
+        for t in threads:
+            t.join()
+        self.assertEqual(results, ['shared'] * 3)
+        self.assertEqual(self.calls, 0)
+
+    def testFailedLeader(self):
+        coalescer = Coalescer(ttl=60)
+        flight, leader = coalescer.claim('k')
+
+        results = []
+        def wait():
+            results.append(coalescer.run('k', self.operation('repeated')))
+        t = threading.Thread(target=wait)
+        t.start()
+        while coalescer.shared < 1:
+            time.sleep(0.01)
+        coalescer.abandon('k', flight)
+        t.join()
+        self.assertEqual(results, ['repeated'])
+        self.assertEqual(self.calls, 1)
+
+        def fail():
+            raise OSError()
+        with self.assertRaises(OSError):
+            coalescer.run('failing', fail)
+        self.assertNotIn('failing', coalescer.pending)
+        self.assertNotIn('failing', coalescer.memo)
+
+    def testCancelledFollower(self):
+        coalescer = Coalescer(ttl=60)
+        flight, leader = coalescer.claim('k')
+
+        handle = RequestHandle()
+        errors = []
+        def wait():
+            try:
+                coalescer.run('k', self.operation('repeated'), handle=handle)
+            except Cancelled as e:
+                errors.append(e)
+        t = threading.Thread(target=wait)
+        t.start()
+        while coalescer.shared < 1:
+            time.sleep(0.01)
+        # the follower leaves without waiting for the leader
+        handle.cancel()
+        t.join(5)
+        self.assertFalse(t.is_alive())
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(self.calls, 0)
+        coalescer.resolve('k', flight, 'shared')
+
+if __name__ == '__main__':
+    unittest.main()
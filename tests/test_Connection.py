@@ -0,0 +1,133 @@
+# This file is part of wikied.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (C) 2016 Martino Pilia <martino.pilia@gmail.com>
+import json
+import os
+import tempfile
+import unittest
+
+import requests
+from PyQt5.QtCore import QSettings
+
+from Connection import Connection
+from RequestHandle import RequestHandle
+
+class FailingTransport:
+    """ Transport whose requests fail for a network problem.
+    """
+
+    connections = 1
+
+    def post(self, *args, **kwargs):
+        raise requests.ConnectionError('network unreachable')
+
+    def postMany(self, *args, **kwargs):
+        raise requests.ConnectionError('network unreachable')
+
+    def importCookies(self, cookies, address):
+        pass
+
+    def clearCookies(self):
+        pass
+
+class ScriptedTransport:
+    """ Transport answering each request with the given parsed response.
+    """
+
+    connections = 1
+
+    def __init__(self, response):
+        self.response = response
+
+    def post(self, address, data, handle=None):
+        res = requests.Response()
+        res.status_code = 200
+        res.headers['Content-Type'] = 'application/json'
+        res._content = json.dumps(self.response).encode('utf-8')
+        return res
+
+class ConnectionTest(unittest.TestCase):
+    """ Tests for the login and the page loading of the connection.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        settings = QSettings(
+                os.path.join(self.directory.name, 'wikied.ini'),
+                QSettings.IniFormat)
+        settings.setValue('connection/api', 'http://wiki.invalid/api.php')
+        for store in ('cache', 'checkpoint', 'session', 'offline'):
+            settings.setValue(store + '/path',
+                    os.path.join(self.directory.name, store + '.sqlite'))
+        # the cached pages are always revalidated
+        settings.setValue('cache/freshness', 0)
+        self.connection = Connection(settings)
+
+    def tearDown(self):
+        self.connection.shutdown()
+        self.directory.cleanup()
+
+    def testStalePagesServedWhenRevalidationFails(self):
+        connection = self.connection
+        meta = {'pageid': 1, 'revid': 10, 'timestamp': '2016-01-01T00:00:00Z'}
+        connection.cache.put(connection.address(), 'Page', 'cached', meta)
+        connection.isConnected = True
+        connection.transport = FailingTransport()
+
+        pages = connection.loadPages(['Page'])
+
+        self.assertEqual(list(pages), ['Page'])
+        content, meta = pages['Page']
+        self.assertEqual(content, 'cached')
+        self.assertEqual(meta['revid'], 10)
+        self.assertEqual(connection.pageInfo['Page']['revid'], 10)
+
+    def testStoredSessionKeptWhenReconnectionFails(self):
+        connection = self.connection
+        key = connection.sessionKey()
+        cookie = {'name': 'session', 'value': 'x', 'domain': 'wiki.invalid',
+                'path': '/', 'expires': None, 'secure': False}
+        connection.sessions.save(key,
+                {'cookies': [cookie], 'csrfToken': 'token'})
+        connection.transport = FailingTransport()
+
+        connection.connectFunction()
+
+        self.assertFalse(connection.isConnected)
+        self.assertIsNotNone(connection.sessions.load(key))
+
+    def testFilterKeepsListWhenSearchTimesOut(self):
+        connection = self.connection
+        connection.transport = ScriptedTransport({
+            'batchcomplete': '',
+            'warnings': {'search': {'*': 'The regex search timed out, only '
+                'partial results are available.'}},
+            'query': {
+                'searchinfo': {'totalhits': 1},
+                'search': [{'ns': 0, 'title': 'A'}]
+            }
+        })
+        filtered = []
+        connection.titlesFiltered.connect(
+                lambda request, titles: filtered.append(titles))
+
+        connection.filterTitlesFunction(
+                RequestHandle(), ['A', 'B'], 'insource:/x/')
+
+        self.assertEqual(filtered, [['A', 'B']])
+
+if __name__ == '__main__':
+    unittest.main()
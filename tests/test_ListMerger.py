@@ -0,0 +1,87 @@
+# This file is part of wikied.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (C) 2016 Martino Pilia <martino.pilia@gmail.com>
+import unittest
+
+from ListMerger import ListMerger
+
+class ListMergerTest(unittest.TestCase):
+    """ Tests for the combination of the titles of concurrent list queries.
+    """
+
+    def merger(self, operation, sources):
+        self.sent = []
+        self.total = None
+        def finish(count):
+            self.total = count
+        return ListMerger(operation, sources, self.sent.append, finish)
+
+    def testUnknownOperation(self):
+        with self.assertRaises(ValueError):
+            self.merger('product', 2)
+
+    def testUnion(self):
+        merger = self.merger('union', 2)
+        merger.add(0, ['A', 'B'])
+        merger.add(1, ['B', 'C', 'C'])
+        self.assertEqual(self.sent, [['A', 'B'], ['C']])
+        merger.complete(1)
+        self.assertIsNone(self.total)
+        merger.complete(0)
+        self.assertEqual(self.total, 3)
+
+    def testIntersection(self):
+        merger = self.merger('intersection', 3)
+        merger.add(0, ['A', 'B', 'C'])
+        merger.add(1, ['B', 'C'])
+        self.assertEqual(self.sent, [])
+        merger.add(2, ['C', 'B', 'D'])
+        merger.add(2, ['A'])
+        self.assertEqual(self.sent, [['C', 'B']])
+        for source in range(3):
+            merger.complete(source)
+        self.assertEqual(self.total, 2)
+
+    def testDifference(self):
+        merger = self.merger('difference', 3)
+        merger.add(0, ['A', 'B', 'C'])
+        merger.add(1, ['B'])
+        merger.complete(1)
+        self.assertEqual(self.sent, [])
+        merger.add(2, ['C'])
+        merger.complete(2)
+        self.assertEqual(self.sent, [['A']])
+        # the subtrahends are complete, so the titles are sent at once
+        merger.add(0, ['A', 'D', 'B'])
+        self.assertEqual(self.sent, [['A'], ['D']])
+        merger.complete(0)
+        self.assertEqual(self.total, 2)
+
+    def testFailedSubtrahend(self):
+        merger = self.merger('difference', 2)
+        merger.add(0, ['A', 'B'])
+        merger.add(1, ['B'])
+        merger.fail(1)
+        self.assertEqual(self.sent, [])
+        self.assertEqual(self.total, 0)
+        # the other sources are ignored after the failure
+        merger.add(0, ['C'])
+        merger.complete(0)
+        self.assertEqual(self.sent, [])
+        self.assertEqual(self.total, 0)
+
+if __name__ == '__main__':
+    unittest.main()
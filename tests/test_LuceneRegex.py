@@ -0,0 +1,78 @@
+# This file is part of wikied.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (C) 2016 Martino Pilia <martino.pilia@gmail.com>
+
+import re
+import unittest
+
+from LuceneRegex import translate
+
+class TranslateTest(unittest.TestCase):
+    """ Tests for the translation of the regular expressions searched with
+    insource:.
+    """
+
+    def testLiteralsAreEscaped(self):
+        self.assertEqual(translate('a/b'), ('a\\/b', False))
+        self.assertEqual(translate('"x"@&~#<>'),
+                ('\\"x\\"\\@\\&\\~\\#\\<\\>', False))
+
+    def testClassesAreWidened(self):
+        expression, caseless = translate(r'\d')
+        self.assertEqual(expression, '[0-9\x80-\U0010ffff]')
+        self.assertEqual(translate(r'\S')[0], '.')
+        self.assertEqual(translate(r'[^\d]')[0], '.')
+        self.assertEqual(translate(r'[\w-]')[0],
+                '[0-9A-Za-z_\x80-\U0010ffff\\-]')
+
+    def testWidenedClassesMatchPythonClasses(self):
+        for escape in 'dws':
+            python = re.compile('\\' + escape)
+            lucene = re.compile(translate('\\' + escape)[0])
+            for code in range(0x3000):
+                if python.match(chr(code)):
+                    self.assertTrue(lucene.match(chr(code)),
+                            '\\%s %r' % (escape, chr(code)))
+
+    def testZeroWidthAssertionsAreDropped(self):
+        self.assertEqual(translate(r'^a\b$')[0], '()a()()')
+        self.assertEqual(translate(r'a(?=b)(?<!c)d')[0], 'a()()d')
+
+    def testGroups(self):
+        self.assertEqual(translate(r'(?:ab)+(?P<x>c)(?P=x)\1')[0],
+                '(ab)+(c)(.*)(.*)')
+        self.assertEqual(translate(r'(a|)|')[0], '(a|())|()')
+
+    def testQuantifiers(self):
+        self.assertEqual(translate(r'a*?b+?c{,2}d{3}?')[0],
+                'a*b+c{0,2}d{3}')
+        self.assertEqual(translate(r'a{x}')[0], 'a\\{x\\}')
+
+    def testCharacterEscapes(self):
+        self.assertEqual(translate(r'\x41\t\.')[0], 'A\\\t\\.')
+        self.assertEqual(translate(r'[\-a]')[0], '[\\-a]')
+
+    def testCaseFlag(self):
+        self.assertEqual(translate('(?i)abc'), ('abc', True))
+        self.assertEqual(translate('(?i:a)b'), ('(a)b', True))
+
+    def testUnsupported(self):
+        for pattern in ['(?x)a b', '(a)?(?(1)b|c)', '^$', '(', '']:
+            with self.assertRaises(ValueError):
+                translate(pattern)
+
+if __name__ == '__main__':
+    unittest.main()
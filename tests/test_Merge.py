@@ -0,0 +1,70 @@
+# This file is part of wikied.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (C) 2016 Martino Pilia <martino.pilia@gmail.com>
+import unittest
+
+from Merge import merge3
+
+class Merge3Test(unittest.TestCase):
+    """ Tests for the three-way merge of the texts.
+    """
+
+    def testUnchangedSide(self):
+        self.assertEqual(merge3('a\nb\n', 'a\nB\n', 'a\nb\n'), 'a\nB\n')
+        self.assertEqual(merge3('a\nb\n', 'a\nb\n', 'A\nb\n'), 'A\nb\n')
+
+    def testDisjointHunks(self):
+        base = 'a\nb\nc\nd\ne\n'
+        self.assertEqual(
+                merge3(base, 'A\nb\nc\nd\ne\n', 'a\nb\nc\nd\nE\n'),
+                'A\nb\nc\nd\nE\n')
+
+    def testAdjacentHunksConflict(self):
+        self.assertIsNone(merge3('a\nb\nc\n', 'A\nb\nc\n', 'a\nB\nc\n'))
+
+    def testOverlappingHunksConflict(self):
+        self.assertIsNone(merge3('a\nb\nc\n', 'a\nX\nc\n', 'a\nY\nc\n'))
+
+    def testIdenticalChanges(self):
+        self.assertEqual(
+                merge3('a\nb\nc\n', 'a\nX\nc\n', 'a\nX\nc\n'), 'a\nX\nc\n')
+        self.assertEqual(
+                merge3('a\nb\nc\n', 'A\nb\nx\nc\n', 'a\nb\nx\nc\n'),
+                'A\nb\nx\nc\n')
+
+    def testInsertionsAtSamePoint(self):
+        self.assertIsNone(
+                merge3('a\nb\nc\n', 'a\nb\nx\nc\n', 'a\nb\ny\nc\n'))
+        self.assertEqual(
+                merge3('a\nb\nc\n', 'a\nb\nx\nc\n', 'a\nb\nx\nc\n'),
+                'a\nb\nx\nc\n')
+
+    def testDeletionAndAppend(self):
+        self.assertEqual(
+                merge3('a\nb\nc\n', 'a\nc\n', 'a\nb\nc\nd\n'), 'a\nc\nd\n')
+
+    def testMissingTrailingNewline(self):
+        self.assertEqual(
+                merge3('a\nb\nc', 'A\nb\nc', 'a\nb\nc\n'), 'A\nb\nc\n')
+        self.assertEqual(
+                merge3('a\nb\nc', 'A\nb\nc', 'a\nb\nC'), 'A\nb\nC')
+        self.assertEqual(
+                merge3('a\nb\nc\nd', 'A\nb\nc\nd', 'a\nb\nc\nd\ne'),
+                'A\nb\nc\nd\ne')
+        self.assertIsNone(merge3('a\nb', 'a\nb\nc', 'a\nB'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+# This file is part of wikied.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (C) 2016 Martino Pilia <martino.pilia@gmail.com>
+import time
+import unittest
+
+from Scheduler import Scheduler
+
+class Settings:
+    """ Settings returning the default value of each key.
+    """
+
+    def value(self, key, default=None, type=None):
+        return default
+
+class Response:
+    """ Response throttled by the server.
+    """
+
+    def __init__(self, error):
+        self.status_code = 200
+        self.headers = {'MediaWiki-API-Error': error, 'Retry-After': '0'}
+
+class FeedbackTest(unittest.TestCase):
+    """ Tests for the adjustment of the rate to the responses.
+    """
+
+    def setUp(self):
+        self.scheduler = Scheduler(Settings())
+
+    def testThrottledChunkHalvesOnce(self):
+        sent = time.monotonic()
+        for _ in range(4):
+            self.assertTrue(self.scheduler.feedback(
+                    'read', Response('maxlag'), sent))
+        self.assertEqual(self.scheduler.rate('read'), 10.0)
+
+    def testLaterThrottlingHalvesAgain(self):
+        self.scheduler.feedback(
+                'read', Response('maxlag'), time.monotonic())
+        self.scheduler.feedback(
+                'read', Response('maxlag'), time.monotonic())
+        self.assertEqual(self.scheduler.rate('read'), 5.0)
+
+    def testClassesAreIndependent(self):
+        sent = time.monotonic()
+        self.scheduler.feedback('read', Response('maxlag'), sent)
+        self.scheduler.feedback('edit', Response('ratelimited'), sent)
+        self.assertEqual(self.scheduler.rate('read'), 10.0)
+        self.assertEqual(self.scheduler.rate('edit'), 0.5)
+
+    def testSuccessIsNotRetried(self):
+        self.assertFalse(self.scheduler.feedback('read', Response('')))
+        self.assertEqual(self.scheduler.rate('read'), 20.0)
+
+if __name__ == '__main__':
+    unittest.main()
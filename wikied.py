@@ -21,11 +21,11 @@ import sys
 
 from PyQt5.QtCore import QSettings, Qt
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QAction, QLabel,
-        QToolBar)
+        QToolBar, QFileDialog, QTabWidget, QInputDialog, QMessageBox)
 from PyQt5.QtGui import QIcon
 
 from RegexSandbox import RegexSandbox
-from Connection import Connection
+from SessionRegistry import SessionRegistry, DEFAULT
 from AccountDialog import AccountDialog
 from FindAndReplace import FindAndReplace
 from VoiceSelector import VoiceSelector
@@ -34,6 +34,10 @@ from Diff import Diff
 
 class MainWindow(QMainWindow):
     """ Main window of the program.
+
+    Each open session has a tab with its own editor, and its own voice
+    list, bound to the connection of the session. The status bar and the
+    connection actions refer to the session of the current tab.
     """
 
     def __init__(self):
@@ -44,14 +48,24 @@ class MainWindow(QMainWindow):
         self.permanentMessage = QLabel('Disconnected')
         # window for the regex sandbox
         self.regexSandbox = RegexSandbox()
-        # object for the connection to the site
-        self.connection = Connection(self.settings)
-        self.connection.statusMessage.connect(self.statusBar().showMessage)
-        self.connection.permanentMessage.connect(self.permanentMessage.setText)
-        # window for the account settings
-        self.accountDialog = AccountDialog(self.settings)
-
-        # add permanent widget to the status bar
+        # open sessions, sharing the workers and the transport
+        self.registry = SessionRegistry(self.settings)
+        # editor and voice list of each session, indexed by name
+        self.editors = {}
+        self.selectors = {}
+        # last permanent message of each connection
+        self.permanentTexts = {}
+        # label for the number of edits waiting to be saved
+        self.pendingMessage = QLabel('')
+        # label for the number of edits made offline and not yet saved
+        self.offlineMessage = QLabel('')
+        # label for the number of edits rejected by the wiki
+        self.failedMessage = QLabel('')
+
+        # add permanent widgets to the status bar
+        self.statusBar().addPermanentWidget(self.pendingMessage)
+        self.statusBar().addPermanentWidget(self.offlineMessage)
+        self.statusBar().addPermanentWidget(self.failedMessage)
         self.statusBar().addPermanentWidget(self.permanentMessage)
 
         # actions
@@ -75,46 +89,76 @@ class MainWindow(QMainWindow):
                 QIcon('icons/network-connect'),
                 'Connect', self)
         connectAction.setStatusTip('Connect to the project')
-        connectAction.triggered.connect(self.connection.connect)
+        connectAction.triggered.connect(
+                lambda: self.connection().connect())
         # disconnect
         disconnectAction = QAction(
                 QIcon('icons/network-disconnect'),
                 'Disconnect', self)
         disconnectAction.setStatusTip('Disconnect from the project')
-        disconnectAction.triggered.connect(self.connection.disconnect)
+        disconnectAction.triggered.connect(
+                lambda: self.connection().disconnect())
+        # save the request trace
+        saveTraceAction = QAction(
+                QIcon('icons/document-save'),
+                'Save request trace', self)
+        saveTraceAction.setStatusTip(
+                'Save the record of the last requests to a JSONL file')
+        saveTraceAction.triggered.connect(self.saveTrace)
+        # show request statistics
+        traceSummaryAction = QAction(
+                QIcon('icons/sort-presence'),
+                'Request statistics', self)
+        traceSummaryAction.setStatusTip(
+                'Show the latency statistics of the last requests')
+        traceSummaryAction.triggered.connect(self.showTraceSummary)
+        # recover a failed edit
+        recoverAction = QAction(
+                QIcon('icons/document-edit-sign'),
+                'Recover failed edit', self)
+        recoverAction.setStatusTip(
+                'Open in the editor an edit rejected by the wiki')
+        recoverAction.triggered.connect(self.recoverEdit)
         # set account
         setAccountAction = QAction(
                 QIcon('icons/user-identity'),
                 'Set account', self)
-        setAccountAction.setStatusTip('Manage the account settings')
-        setAccountAction.triggered.connect(self.accountDialog.exec_)
+        setAccountAction.setStatusTip(
+                'Manage the account settings of the current session')
+        setAccountAction.triggered.connect(self.editAccount)
+        # new session
+        newSessionAction = QAction(
+                QIcon('icons/im-user'),
+                'New session', self)
+        newSessionAction.setStatusTip(
+                'Open a session with another wiki or account')
+        newSessionAction.triggered.connect(self.newSession)
+        # remove session
+        removeSessionAction = QAction(
+                QIcon('icons/window-close'),
+                'Remove session', self)
+        removeSessionAction.setStatusTip(
+                'Close the current session and forget its account')
+        removeSessionAction.triggered.connect(self.removeSession)
 
         # central widget and docks
-        diff = Diff()
-        diff.setObjectName('Diff')
-        diff.setVisible(False)
-        self.addDockWidget(Qt.TopDockWidgetArea, diff)
-
-        editorWidget = VoiceEditor(self.connection, diff)
-        self.setCentralWidget(editorWidget)
+        self.diff = Diff()
+        self.diff.setObjectName('Diff')
+        self.diff.setVisible(False)
+        self.addDockWidget(Qt.TopDockWidgetArea, self.diff)
 
-        substWidget = FindAndReplace(editorWidget.pageContent)
-        substWidget.setObjectName('Find and replace')
-        substWidget.statusMessage.connect(self.statusBar().showMessage)
-        self.addDockWidget(Qt.BottomDockWidgetArea, substWidget)
-
-        voiceSelector = VoiceSelector(self.connection, editorWidget)
-        voiceSelector.setObjectName('Select voices')
-        voiceSelector.statusMessage.connect(self.statusBar().showMessage)
-        self.addDockWidget(Qt.LeftDockWidgetArea, voiceSelector)
+        # one tab for the editor of each session
+        self.tabs = QTabWidget()
+        self.setCentralWidget(self.tabs)
 
         # toolbars
         # Connection
-        connectionToolbar = QToolBar('Connection')
-        connectionToolbar.setObjectName('connectionToolbar')
-        connectionToolbar.addActions(
-                [connectAction, disconnectAction, setAccountAction])
-        self.addToolBar(connectionToolbar)
+        self.connectionToolbar = QToolBar('Connection')
+        self.connectionToolbar.setObjectName('connectionToolbar')
+        self.connectionToolbar.addActions(
+                [connectAction, disconnectAction, setAccountAction,
+                    newSessionAction])
+        self.addToolBar(self.connectionToolbar)
 
         # menu bar
         # File
@@ -123,24 +167,38 @@ class MainWindow(QMainWindow):
         fileMenu.addAction(disconnectAction)
         fileMenu.addAction(setAccountAction)
         fileMenu.addSeparator()
+        fileMenu.addAction(newSessionAction)
+        fileMenu.addAction(removeSessionAction)
+        fileMenu.addSeparator()
         fileMenu.addAction(exitAction)
         # Tools
         toolsMenu = self.menuBar().addMenu('Tools')
         toolsMenu.addAction(sandboxAction)
-        # View
-        viewMenu = self.menuBar().addMenu('View')
-        viewMenu.addAction(voiceSelector.toggleViewAction())
-        viewMenu.addAction(substWidget.toggleViewAction())
-        viewMenu.addAction(connectionToolbar.toggleViewAction())
-        viewMenu.addAction(editorWidget.actionsToolbar.toggleViewAction())
-        viewMenu.addAction(diff.toggleViewAction())
-        viewMenu.addAction(editorWidget.editToolbar.toggleViewAction())
+        toolsMenu.addAction(recoverAction)
+        toolsMenu.addSeparator()
+        toolsMenu.addAction(saveTraceAction)
+        toolsMenu.addAction(traceSummaryAction)
+        # View, filled with the widgets of the current session
+        self.viewMenu = self.menuBar().addMenu('View')
+
+        # open the configured sessions
+        for name in self.registry.names():
+            self.openSession(name)
+
+        # find and replace, acting on the editor of the current session
+        self.substWidget = FindAndReplace(self.editors[DEFAULT].pageContent)
+        self.substWidget.setObjectName('Find and replace')
+        self.substWidget.statusMessage.connect(self.statusBar().showMessage)
+        self.addDockWidget(Qt.BottomDockWidgetArea, self.substWidget)
+
+        self.tabs.currentChanged.connect(self.showSession)
+        self.showSession()
 
         # view details
         self.setGeometry(200, 200, 1000, 800)
         self.setWindowTitle('WikiEd')
         self.setWindowIcon(QIcon(''))
-        editorWidget.pageContent.setFocus()
+        self.editors[DEFAULT].pageContent.setFocus()
 
         # restore state and geometry (lazy initialization)
         if (not self.settings.value('window/geometry') or
@@ -151,13 +209,39 @@ class MainWindow(QMainWindow):
 
         self.show()
 
+        # reuse the sessions of the previous run
+        for connection in self.registry.connections.values():
+            if connection.hasStoredSession():
+                connection.connect()
+
     # overriding
     def closeEvent(self, e):
         """ Handle the closing of the main window.
         """
 
-        # disconnect from server
-        self.connection.disconnect()
+        # the edits not saved yet are staged for the next run, or lost if
+        # there is no offline queue
+        pending = sum(connection.saveQueue.count
+                for connection in self.registry.connections.values())
+        # without an offline queue, the failed edits are kept in memory
+        failed = sum(len(connection.saveQueue.failed)
+                for connection in self.registry.connections.values())
+        if pending > 0 or failed > 0:
+            if self.registry.offline is not None:
+                text = ('%d edits are not saved yet. They will be saved at '
+                        'the next run. Close anyway?' % pending)
+            else:
+                text = ('%d edits are not saved yet, and will be lost. '
+                        'Close anyway?' % (pending + failed))
+            answer = QMessageBox.question(self, 'Edits pending', text)
+            if answer != QMessageBox.Yes:
+                e.ignore()
+                return
+
+        # keep the sessions for the next run, or disconnect from the
+        # servers, and stop the workers once the pending requests are
+        # completed
+        self.registry.shutdown()
 
         # close regex sandbox
         self.regexSandbox.done(0)
@@ -165,6 +249,209 @@ class MainWindow(QMainWindow):
         # save state and geometry of the window
         self.saveWindow()
 
+    def connection(self):
+        """ Return the connection of the current session.
+        """
+        return self.registry.get(self.currentSession())
+
+    def currentSession(self):
+        """ Return the name of the current session.
+        """
+        editor = self.tabs.currentWidget()
+        for name in self.editors:
+            if self.editors[name] is editor:
+                return name
+        return DEFAULT
+
+    def openSession(self, name):
+        """ Open a session, adding its editor and its voice list.
+
+        Parameters
+        ----------
+        name : str
+            Name of the session.
+        """
+        connection = self.registry.open(name)
+        connection.statusMessage.connect(self.statusBar().showMessage)
+        connection.permanentMessage.connect(self.setPermanentText)
+        connection.saveQueue.statusMessage.connect(
+                self.statusBar().showMessage)
+        connection.saveQueue.pendingChanged.connect(self.updateStatus)
+        connection.saveQueue.offlineChanged.connect(self.updateStatus)
+        connection.saveQueue.failedChanged.connect(self.updateStatus)
+
+        editor = VoiceEditor(connection, self.diff)
+        # the find and replace widget is shared by the sessions
+        voiceSelector = VoiceSelector(connection, editor,
+                lambda: self.substWidget.regex.text())
+        # the dock names are used to save the state of the window
+        if name == DEFAULT:
+            voiceSelector.setObjectName('Select voices')
+        else:
+            voiceSelector.setObjectName('Select voices (%s)' % name)
+            voiceSelector.setWindowTitle('Select voices (%s)' % name)
+        voiceSelector.statusMessage.connect(self.statusBar().showMessage)
+        self.addDockWidget(Qt.LeftDockWidgetArea, voiceSelector)
+        if DEFAULT in self.selectors:
+            self.tabifyDockWidget(self.selectors[DEFAULT], voiceSelector)
+
+        self.editors[name] = editor
+        self.selectors[name] = voiceSelector
+        self.tabs.addTab(editor, name)
+
+    def showSession(self):
+        """ Bind the shared widgets to the session of the current tab.
+        """
+        name = self.currentSession()
+        editor = self.editors[name]
+        self.substWidget.pageContent = editor.pageContent
+        self.selectors[name].raise_()
+
+        self.viewMenu.clear()
+        self.viewMenu.addAction(self.selectors[name].toggleViewAction())
+        self.viewMenu.addAction(self.substWidget.toggleViewAction())
+        self.viewMenu.addAction(self.connectionToolbar.toggleViewAction())
+        self.viewMenu.addAction(editor.actionsToolbar.toggleViewAction())
+        self.viewMenu.addAction(self.diff.toggleViewAction())
+        self.viewMenu.addAction(editor.editToolbar.toggleViewAction())
+
+        self.updateStatus()
+
+    def newSession(self):
+        """ Ask the name and the account of a new session, and open it.
+        """
+        name, ok = QInputDialog.getText(self, 'New session', 'Name:')
+        name = name.strip()
+        if not ok or name == '':
+            return
+        # a session may be open without its account saved yet
+        if '/' in name or name in self.registry.names() or \
+                name in self.editors or name in self.registry.connections:
+            self.statusBar().showMessage('Invalid session name')
+            return
+        AccountDialog(self.settings, self.registry.account(name)).exec_()
+        self.openSession(name)
+        self.tabs.setCurrentWidget(self.editors[name])
+
+    def removeSession(self):
+        """ Close the current session, forgetting its account.
+        """
+        name = self.currentSession()
+        if name == DEFAULT:
+            self.statusBar().showMessage(
+                    'The default session cannot be removed')
+            return
+
+        connection = self.registry.get(name)
+        self.registry.close(name)
+        # the login of the account is forgotten too
+        if self.registry.sessions is not None:
+            self.registry.sessions.remove(connection.sessionKey())
+        self.settings.remove(self.registry.account(name))
+        self.permanentTexts.pop(connection, None)
+
+        voiceSelector = self.selectors.pop(name)
+        voiceSelector.stopQueries()
+        self.removeDockWidget(voiceSelector)
+        voiceSelector.deleteLater()
+        editor = self.editors.pop(name)
+        self.tabs.removeTab(self.tabs.indexOf(editor))
+        editor.deleteLater()
+
+    def editAccount(self):
+        """ Show the account settings of the current session.
+        """
+        AccountDialog(
+                self.settings,
+                self.registry.account(self.currentSession())).exec_()
+
+    def setPermanentText(self, text):
+        """ Store the permanent message of the connection emitting it, and
+        show it if the connection belongs to the current session.
+
+        Parameters
+        ----------
+        text : str
+            Permanent message.
+        """
+        self.permanentTexts[self.sender()] = text
+        self.updateStatus()
+
+    def updateStatus(self, *args):
+        """ Show in the status bar the state of the current session.
+        """
+        connection = self.connection()
+        if connection is None:
+            return
+        queue = connection.saveQueue
+        self.permanentMessage.setText(
+                self.permanentTexts.get(connection, 'Disconnected'))
+        self.pendingMessage.setText(
+                '%d edits pending' % queue.count if queue.count > 0 else '')
+        offline = queue.offlineCount()
+        self.offlineMessage.setText(
+                '%d edits offline' % offline if offline > 0 else '')
+        failed = queue.failedCount()
+        self.failedMessage.setText(
+                '%d edits failed' % failed if failed > 0 else '')
+
+    def recoverEdit(self):
+        """ Open in the editor of the current session the oldest edit
+        rejected by the wiki, so it can be corrected and saved again.
+        """
+        queue = self.connection().saveQueue
+        edits = queue.failedEdits()
+        if len(edits) < 1:
+            self.statusBar().showMessage('No failed edits')
+            return
+        page, content, summary, meta, error = edits[0]
+
+        editor = self.editors[self.currentSession()]
+        if editor.pageTitle.text() != '' and \
+                editor.pageContent.toPlainText() != editor.originalContent:
+            answer = QMessageBox.question(self, 'Recover failed edit',
+                    'The changes in the editor will be lost. Continue?')
+            if answer != QMessageBox.Yes:
+                return
+
+        edit = queue.recover(page)
+        if edit is None:
+            return
+        editor.openEdit(page, *edit)
+        self.statusBar().showMessage('%s: failed (%s)' % (page, error))
+
+    def saveTrace(self):
+        """ Save the record of the last requests to a file chosen by the
+        user.
+        """
+        path, _ = QFileDialog.getSaveFileName(
+                self,
+                'Save request trace',
+                'trace.jsonl',
+                'JSON lines (*.jsonl)')
+        if path:
+            self.connection().tracer.dump(path)
+
+    def showTraceSummary(self):
+        """ Show in the status bar the statistics of the last requests.
+        """
+        summary = self.connection().tracer.summary()
+        coalescer = self.connection().coalescer
+        self.statusBar().showMessage(
+                '%d requests (%d errors), %d kB sent, %d kB received, '
+                'latency p50 %.0f ms, p90 %.0f ms, p99 %.0f ms, max %.0f ms, '
+                '%d shared, %d memorized' % (
+                    summary['requests'],
+                    summary['errors'],
+                    summary['sent'] / 1024,
+                    summary['received'] / 1024,
+                    summary['p50'] * 1000,
+                    summary['p90'] * 1000,
+                    summary['p99'] * 1000,
+                    summary['max'] * 1000,
+                    coalescer.shared,
+                    coalescer.memoHits))
+
     def saveWindow(self):
         """ Save into the settings the geometry and state of the main window.
         """